@@ -1,105 +1,493 @@
-from flask import Flask, request, jsonify, render_template
-from database import Base, engine
+import time
+
+# Measured from here so /health can report how long worker boot takes
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Blueprint, Flask, Response, g, request, jsonify, render_template
+from sqlalchemy import func
+from database import ENGINE_TIMINGS, SessionLocal, get_db, init_app, on_engine_created, pool_stats
 from slack_routes import slack_bp
-from models import Deployment
-from database import SessionLocal
-from chatops_services.slack_service import notify_slack
+from models import LISTING_COLUMNS, Deployment, listing_rows
+from chatops_services.outbox import enqueue_notification, outbox_dispatcher
 from chatops_services.security import verify_webhook_secret
+from chatops_services.deploy_queue import deploy_pool
+from chatops_services.http_client import async_http_client, http_client
+from chatops_services.circuit_breaker import OPEN, breakers
+from chatops_services.deployment_stats import get_stats, record_status_change, stats_reconciler
+from chatops_services.events import event_bus, publish_deployment
+from chatops_services.deploy_states import ACTIVE_STATUSES, FINISHED_STATUSES, transition
+from chatops_services.durations import duration_stats, record_duration
+from chatops_services.idempotency import slack_requests, webhook_deliveries
+from chatops_services.run_reconciler import run_reconciler
+from chatops_services.deploy_scheduler import promote_next, scheduler_stats, start_promoted
+from chatops_services.history import daily_history, history_maintainer
+from chatops_services.response_cache import (
+    bump_version, current_version, encode_body, etag_matches,
+    make_etag, response_cache, serialize
+)
+from chatops_services.metrics import (
+    HTTP_REQUEST_SECONDS, collect, instrument_engine, metrics_flusher, render
+)
+from chatops_services.log import bind_request_id, log_stats
 from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
+import json
+import logging
 import os
+import queue
 
 load_dotenv()
 
-app = Flask(__name__)
+SSE_HEARTBEAT_SECONDS = 15
+# Schema changes normally run via `python migrate.py` before the workers start
+AUTO_MIGRATE          = os.environ.get("AUTO_MIGRATE", "false").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+main_bp = Blueprint("main", __name__)
+
+BOOT = {
+    "pid":                   None,
+    "import_seconds":        None,
+    "create_app_seconds":    None,
+    "first_request_seconds": None,
+}
+
+
+def create_app() -> Flask:
+    """
+    Builds the Flask app. Nothing here connects to the database: the engine
+    is created on the first query, after gunicorn has forked the worker.
+    """
+    started = time.perf_counter()
+    BOOT["pid"] = os.getpid()
+    BOOT["import_seconds"] = round(started - _IMPORT_STARTED, 4)
+
+    app = Flask(__name__)
+    app.register_blueprint(main_bp)
+    app.register_blueprint(slack_bp)
 
-# Force create all tables in PostgreSQL
-print("Creating database tables...")
-try:
-    Base.metadata.create_all(bind=engine)
-    print("Tables created successfully!")
-except Exception as e:
-    print(f"Error creating tables: {e}")
+    # One DB session per request, closed on app context teardown
+    init_app(app)
 
-# Register Slack routes
-app.register_blueprint(slack_bp)
+    # Per-endpoint query timings for /metrics
+    on_engine_created(instrument_engine)
 
-@app.route("/")
+    if AUTO_MIGRATE:
+        from migrate import upgrade
+        upgrade()
+
+    BOOT["create_app_seconds"] = round(time.perf_counter() - started, 4)
+    logger.info("App created", extra={k: v for k, v in BOOT.items() if v is not None})
+    return app
+
+
+def __getattr__(name):
+    # `gunicorn app:app` keeps working; the app is only built when asked for
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@main_bp.before_app_request
+def start_background_workers():
+    g.request_started = time.perf_counter()
+    # Correlates log lines from this request and the background jobs it queues
+    incoming = request.headers.get("X-Request-Id", "")
+    g.request_id = bind_request_id(incoming[:64] if incoming.isalnum() else None)
+    # Started per worker process (after gunicorn forks), picks up
+    # notifications left pending by a previous run
+    outbox_dispatcher.ensure_started()
+    stats_reconciler.ensure_started()
+    run_reconciler.ensure_started()
+    history_maintainer.ensure_started()
+    event_bus.ensure_listening()
+    metrics_flusher.ensure_started()
+
+@main_bp.after_app_request
+def observe_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        HTTP_REQUEST_SECONDS.labels(
+            request.endpoint or "unknown", str(response.status_code)
+        ).observe(elapsed)
+        if BOOT["first_request_seconds"] is None:
+            # Includes the lazy engine build and background thread start-up
+            BOOT["first_request_seconds"] = round(elapsed, 4)
+    if "request_id" in g:
+        response.headers["X-Request-Id"] = g.request_id
+    return response
+
+@main_bp.route("/")
 def index():
     return jsonify({"message": "ChatOps Platform Running"})
 
-@app.route("/health")
+@main_bp.route("/health")
 def health():
-    return jsonify({"status": "running"})
+    breaker_stats = breakers.stats()
+    degraded = any(b["state"] == OPEN for b in breaker_stats.values())
+    return jsonify({
+        "status": "degraded" if degraded else "running",
+        "breakers": breaker_stats,
+        "deploy_queue": deploy_pool.stats(),
+        "http": http_client.stats(),
+        "http_async": async_http_client.stats(),
+        "outbox": outbox_dispatcher.stats(),
+        "run_reconciler": run_reconciler.stats(),
+        "scheduler": scheduler_stats(),
+        "history": history_maintainer.stats(),
+        "events": event_bus.stats(),
+        "response_cache": response_cache.stats(),
+        "slack_requests": slack_requests.stats(),
+        "db_pool": pool_stats(),
+        "logging": log_stats(),
+        "boot": {**BOOT, "engine_build_seconds": ENGINE_TIMINGS["build_seconds"]}
+    })
+
+@main_bp.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint, aggregated across workers via METRICS_DIR."""
+    gauges = []
+    try:
+        by_environment = get_stats(get_db())["by_environment"]
+        gauges.append((
+            "chatops_deployments", "Deployments by environment and status",
+            ["environment", "status"],
+            [
+                ((env, status), count)
+                for env, totals in sorted(by_environment.items())
+                for status, count in sorted(totals.items()) if status != "total"
+            ]
+        ))
+    except Exception:
+        logger.exception("Metrics stats error")
+
+    boot = {**BOOT, "engine_build": ENGINE_TIMINGS["build_seconds"]}
+    gauges.append((
+        "chatops_worker_boot_seconds", "Worker start-up time by phase (this worker)",
+        ["phase"],
+        [
+            ((phase.replace("_seconds", ""),), value)
+            for phase, value in boot.items() if phase != "pid" and value is not None
+        ]
+    ))
 
-@app.route("/dashboard")
+    return Response(render(collect(), gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@main_bp.route("/dashboard")
 def dashboard():
     return render_template("dashboard.html")
 
-@app.route("/api/deployments")
+def cached_json(build, key_parts: tuple = ()):
+    """
+    Serves a read API through the version-keyed response cache.
+    build() returns (payload, status); only 200s are cached. Clients
+    sending a matching If-None-Match get a 304 without touching the DB
+    beyond the version row. key_parts joins the query params in the cache
+    key and ETag, for anything else the payload depends on (e.g. a default
+    date range that moves with the clock).
+    """
+    params  = tuple(sorted(request.args.items(multi=True))) + tuple(key_parts)
+    version = current_version(get_db())
+    etag    = make_etag(request.path, version, params)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        response_cache.not_modified += 1
+        return Response(status=304, headers=headers)
+
+    key   = (request.path, version, params)
+    entry = response_cache.get(key)
+    if entry is None:
+        payload, status = build()
+        if status != 200:
+            return jsonify(payload), status
+        entry = response_cache.put(key, serialize(payload))
+
+    body, encoding = encode_body(entry, request.headers.get("Accept-Encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype="application/json", headers=headers)
+
+DEFAULT_PAGE_SIZE  = 50
+MAX_PAGE_SIZE      = 200
+EXPORT_BATCH_SIZE  = 1000
+DEPLOYMENT_FILTERS = ("environment", "status", "user_name", "repo_url")
+
+def parse_time_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    # Timestamps are stored as naive UTC
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def filter_deployments(query, since=None, until=None):
+    """Applies the DEPLOYMENT_FILTERS query params and a since/until range."""
+    for name in DEPLOYMENT_FILTERS:
+        value = request.args.get(name)
+        if value:
+            query = query.filter(getattr(Deployment, name) == value)
+    if since:
+        query = query.filter(Deployment.timestamp >= since)
+    if until:
+        query = query.filter(Deployment.timestamp < until)
+    return query
+
+@main_bp.route("/api/deployments")
 def api_deployments():
-    db = SessionLocal()
+    """
+    Keyset-paginated deployment history, newest first.
+    Query params: before=<id>, limit=<n>, environment, status, user_name,
+    repo_url, since/until (ISO-8601). Pass next_before back as before=.
+    Only covers the live table; older months are in /api/history.
+    """
     try:
-        deployments = db.query(Deployment)\
-            .order_by(Deployment.id.desc())\
-            .limit(50)\
-            .all()
-        print(f"Found {len(deployments)} deployments")
-        return jsonify({
-            "deployments": [d.to_dict() for d in deployments]
-        })
-    except Exception as e:
-        print(f"Error fetching deployments: {e}")
-        return jsonify({"deployments": [], "error": str(e)})
-    finally:
-        db.close()
+        before = request.args.get("before", type=int)
+        limit  = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+        limit  = max(1, min(limit, MAX_PAGE_SIZE))
+        since  = parse_time_arg("since")
+        until  = parse_time_arg("until")
+    except ValueError as e:
+        return jsonify({"deployments": [], "error": f"Invalid query: {e}"}), 400
 
-@app.route("/api/deployments/<int:deployment_id>")
-def api_deployment_status(deployment_id):
-    db = SessionLocal()
+    def build():
+        db = get_db()
+        try:
+            # Plain column tuples: no ORM instances or identity map per row
+            query = filter_deployments(db.query(*LISTING_COLUMNS), since, until)
+            if before:
+                query = query.filter(Deployment.id < before)
+
+            rows = query\
+                .order_by(Deployment.id.desc())\
+                .limit(limit)\
+                .all()
+            logger.debug("Found deployments", extra={"count": len(rows)})
+            return {
+                "deployments": listing_rows(rows),
+                "next_before": rows[-1][0] if len(rows) == limit else None
+            }, 200
+        except Exception as e:
+            logger.exception("Error fetching deployments")
+            return {"deployments": [], "error": str(e)}, 500
+
+    return cached_json(build)
+
+@main_bp.route("/api/deployments/export")
+def api_deployments_export():
+    """
+    Every matching deployment as NDJSON (one object per line), newest
+    first, streamed in EXPORT_BATCH_SIZE keyset batches. Same filters as
+    /api/deployments.
+    """
+    try:
+        since = parse_time_arg("since")
+        until = parse_time_arg("until")
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    base = filter_deployments(SessionLocal().query(*LISTING_COLUMNS), since, until)
+
+    def stream():
+        db = base.session
+        try:
+            before = None
+            while True:
+                query = base.filter(Deployment.id < before) if before else base
+                rows = query.order_by(Deployment.id.desc()).limit(EXPORT_BATCH_SIZE).all()
+                # Don't hold a pooled connection while the client reads
+                db.rollback()
+                if not rows:
+                    break
+                yield b"".join(serialize(row) + b"\n" for row in listing_rows(rows))
+                if len(rows) < EXPORT_BATCH_SIZE:
+                    break
+                before = rows[-1][0]
+        finally:
+            db.close()
+
+    return Response(stream(), mimetype="application/x-ndjson", headers={
+        "Content-Disposition": "attachment; filename=deployments.ndjson"
+    })
+
+@main_bp.route("/api/deployments/stream")
+def api_deployments_stream():
+    """
+    Server-Sent Events feed of deployment changes for the dashboard.
+    Each gunicorn worker keeps one connection per open dashboard, so run
+    with threaded workers (e.g. --worker-class gthread) when using it.
+    """
+    subscriber = event_bus.subscribe()
+    if subscriber is None:
+        return jsonify({"error": "Too many subscribers, poll instead"}), 503
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            event_bus.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@main_bp.route("/api/stats")
+def api_stats():
+    """
+    Deployment totals from the incremental counters table.
+    Query params: environment, since (YYYY-MM-DD), breakdown=repo|user, top.
+    """
+    try:
+        since = parse_time_arg("since")
+        top   = max(1, min(request.args.get("top", 10, type=int), 100))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+
+    def build():
+        db = get_db()
+        return get_stats(
+            db,
+            environment=request.args.get("environment"),
+            since=since.date() if since else None,
+            breakdown=request.args.get("breakdown"),
+            top=top
+        ), 200
+
+    return cached_json(build)
+
+@main_bp.route("/api/history")
+def api_history():
+    """
+    Deployments per day and status, including archived months (read from
+    the daily rollups). Query params: since, until (YYYY-MM-DD, default the
+    last 90 days), environment, repo_url.
+    """
     try:
+        until = parse_time_arg("until")
+        until = until.date() if until else datetime.utcnow().date() + timedelta(days=1)
+        since = parse_time_arg("since")
+        since = since.date() if since else until - timedelta(days=90)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+
+    def build():
+        db = get_db()
+        return {
+            "since": since.isoformat(),
+            "until": until.isoformat(),
+            "days":  daily_history(
+                db, since, until,
+                environment=request.args.get("environment"),
+                repo_url=request.args.get("repo_url")
+            )
+        }, 200
+
+    # The default window moves at midnight without a write bumping the version
+    return cached_json(build, key_parts=(since.isoformat(), until.isoformat()))
+
+@main_bp.route("/api/durations")
+def api_durations():
+    """
+    p50/p95/p99 of successful deployment durations (trigger to finish
+    webhook), per repo and environment and merged across them, from the
+    streaming sketches. Query params: environment, repo (URL or owner/repo).
+    """
+    def build():
+        db = get_db()
+        return duration_stats(
+            db,
+            environment=request.args.get("environment"),
+            repo=request.args.get("repo")
+        ), 200
+
+    return cached_json(build)
+
+@main_bp.route("/api/deployments/<int:deployment_id>")
+def api_deployment_status(deployment_id):
+    def build():
+        db = get_db()
         deployment = db.query(Deployment).filter(
             Deployment.id == deployment_id
         ).first()
         if not deployment:
-            return jsonify({"error": "Deployment not found"}), 404
-        return jsonify(deployment.to_dict())
-    finally:
-        db.close()
+            return {"error": "Deployment not found"}, 404
+        return deployment.to_dict(), 200
 
-@app.route("/webhook/github", methods=["POST"])
+    return cached_json(build)
+
+@main_bp.route("/webhook/github", methods=["POST"])
 def github_webhook():
     if not verify_webhook_secret(request):
-        print("Webhook secret FAILED")
+        logger.warning("Webhook secret check failed", extra={"remote_addr": request.remote_addr})
         return jsonify({"error": "Unauthorized"}), 401
 
-    data          = request.get_json()
-    print(f"Webhook received: {data}")
-    deployment_id = int(data.get("deployment_id"))
+    data = request.get_json(silent=True) or {}
+    logger.debug("Webhook received", extra={"payload": data})
+    try:
+        deployment_id = int(data.get("deployment_id"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid deployment_id"}), 400
     status        = data.get("status")
     environment   = data.get("environment")
     run_url       = data.get("run_url", "")
 
-    db = SessionLocal()
+    # Internal states (QUEUED, RETRY_QUEUED, ...) are only ever set by the app itself
+    if status not in FINISHED_STATUSES:
+        return jsonify({"error": f"Unsupported status {status}"}), 400
+
+    # Retried deliveries are acknowledged without touching the DB again
+    delivery_key = request.headers.get("X-Delivery-Id") or f"{deployment_id}:{status}:{run_url}"
+    if delivery_key in webhook_deliveries:
+        return jsonify({"ok": True, "duplicate": True})
+
+    # Rows triggered before started_at existed are timed from the request
+    values = {"run_url": run_url, "finished_at": datetime.utcnow(),
+              "started_at": func.coalesce(Deployment.started_at, Deployment.timestamp)}
+
+    db = get_db()
     try:
-        deployment = db.query(Deployment).filter(
-            Deployment.id == deployment_id
-        ).first()
-        print(f"Found deployment: {deployment}")
-        if deployment:
-            deployment.status  = status
-            deployment.run_url = run_url
-            db.commit()
-            db.refresh(deployment)
-            print(f"Updated to {status}")
-            notify_slack(deployment, status, environment, run_url)
-    except Exception as e:
-        print(f"Webhook error: {e}")
+        deployment, old_status = transition(db, deployment_id, status, **values)
+        if deployment is None:
+            # Unknown id, or a transition the state machine doesn't allow
+            db.rollback()
+            logger.info("Webhook ignored", extra={"deployment_id": deployment_id, "status": status})
+            webhook_deliveries.add(delivery_key)
+            return jsonify({"ok": True, "ignored": True})
+
+        record_status_change(db, deployment, old_status, status)
+        record_duration(db, deployment)
+        # Frees the repo/environment for the request queued behind it, if any
+        promoted = promote_next(db, deployment.repo_url, deployment.environment) if old_status in ACTIVE_STATUSES else []
+        bump_version(db)
+        # Same transaction as the status change, delivered in the background
+        enqueue_notification(db, deployment, status, environment, run_url)
+        db.commit()
+        webhook_deliveries.add(delivery_key)
+        logger.info("Deployment updated", extra={
+            "deployment_id": deployment_id, "old_status": old_status, "status": status
+        })
+        outbox_dispatcher.wake()
+        publish_deployment(deployment.to_dict(), "updated")
+        start_promoted(promoted)
+    except Exception:
+        logger.exception("Webhook error", extra={"deployment_id": deployment_id})
         db.rollback()
-    finally:
-        db.close()
 
     return jsonify({"ok": True})
-@app.route("/debug/token")
+
+@main_bp.route("/debug/token")
 def debug_token():
     token = os.environ.get("GITHUB_TOKEN", "NOT SET")
     return jsonify({
@@ -109,4 +497,4 @@ def debug_token():
     })
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
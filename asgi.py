@@ -0,0 +1,182 @@
+"""
+Async serving mode.
+
+    uvicorn asgi:app --workers 2
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+The Flask views run unchanged in a bounded thread pool, since the only
+blocking work left in them is the database. The slow part of a deploy -
+the GitHub trigger and the response_url reply - runs as tasks on the
+event loop through the async HTTP clients, so one process keeps hundreds
+of deploys in flight instead of DEPLOY_WORKERS. `gunicorn app:app` keeps
+serving the sync mode.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app
+from chatops_services.deploy_queue import deploy_pool
+from chatops_services.http_client import async_http_client
+
+# Threads for the Flask views; more than the DB pool's size + overflow just wait on it.
+# Each open dashboard event stream holds one.
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "32"))
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOpsASGI:
+    """Serves a WSGI app over ASGI with thread offload, and owns the event loop side of deploys."""
+
+    def __init__(self, wsgi_app, threads: int = ASGI_THREADS):
+        self.wsgi_app  = wsgi_app
+        self.threads   = threads
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-view")
+        self._loop     = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if self._loop is None:
+                # Servers that skip lifespan events still get async deploys
+                self._startup()
+            await self._http(scope, receive, send)
+
+    # ── lifespan ─────────────────────────────────────────────
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self._shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _startup(self):
+        self._loop = asyncio.get_running_loop()
+        deploy_pool.attach_loop(self._loop)
+        logger.info("Async mode started", extra={
+            "threads": self.threads, "http_backend": async_http_client.backend
+        })
+
+    async def _shutdown(self):
+        deploy_pool.detach_loop()
+        await async_http_client.aclose()
+        self._executor.shutdown(wait=False)
+        self._loop = None
+
+    # ── http ─────────────────────────────────────────────────
+    async def _http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        loop = asyncio.get_running_loop()
+        started = {}
+        environ = wsgi_environ(scope, b"".join(chunks))
+        body_iter, first = await loop.run_in_executor(self._executor, self._start, environ, started)
+
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        # Streams (event feed, export) keep going until the client leaves
+        disconnected = asyncio.Event()
+        watcher = loop.create_task(_watch_disconnect(receive, disconnected))
+        try:
+            chunk = first
+            while chunk is not None and not disconnected.is_set():
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                chunk = await loop.run_in_executor(self._executor, next, body_iter, None)
+            if not disconnected.is_set():
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+            close = getattr(body_iter, "close", None)
+            if close is not None:
+                await loop.run_in_executor(self._executor, close)
+
+    def _start(self, environ: dict, started: dict):
+        """Runs the view in a pool thread; returns the body iterator and its first chunk."""
+        def start_response(status, headers, exc_info=None):
+            started["status"]  = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+            return lambda data: None
+
+        body_iter = iter(self.wsgi_app(environ, start_response))
+        return body_iter, next(body_iter, None)
+
+
+async def _watch_disconnect(receive, disconnected: asyncio.Event):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnected.set()
+            return
+
+
+def wsgi_environ(scope: dict, body: bytes) -> dict:
+    """PEP 3333 environ for an ASGI http scope."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    root   = scope.get("root_path", "")
+    path   = scope["path"]
+    if root and path.startswith(root):
+        path = path[len(root):]
+
+    environ = {
+        "REQUEST_METHOD":    scope["method"],
+        "SCRIPT_NAME":       root.encode("utf8").decode("latin1"),
+        "PATH_INFO":         path.encode("utf8").decode("latin1"),
+        "QUERY_STRING":      scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME":       server[0],
+        "SERVER_PORT":       str(server[1]),
+        "SERVER_PROTOCOL":   f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR":       client[0],
+        "REMOTE_PORT":       str(client[1]),
+        "CONTENT_LENGTH":    str(len(body)),
+        "wsgi.version":      (1, 0),
+        "wsgi.url_scheme":   scope.get("scheme", "http"),
+        "wsgi.input":        io.BytesIO(body),
+        "wsgi.errors":       sys.stderr,
+        "wsgi.multithread":  True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once":     False,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin1"), value.decode("latin1")
+        if name == "content-length":
+            continue
+        key = "CONTENT_TYPE" if name == "content-type" else "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def create_asgi_app() -> ChatOpsASGI:
+    return ChatOpsASGI(create_app())
+
+
+def __getattr__(name):
+    # Like app.py, the app is only built when the server asks for it
+    if name == "app":
+        globals()["app"] = create_asgi_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("The async mode needs uvicorn: pip install uvicorn httpx")
+    uvicorn.run(create_asgi_app(), host="0.0.0.0", port=int(os.environ.get("PORT", "5000")))
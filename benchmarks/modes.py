@@ -0,0 +1,70 @@
+"""
+Sync vs async serving under the same load.
+
+Runs benchmarks.run once per mode, each in its own process and database,
+with identical arguments, and prints the two side by side. Any other
+argument is passed through to benchmarks.run.
+
+    python -m benchmarks.modes --requests 1000 --concurrency 200 --github-latency-ms 300
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODES   = ["sync", "async"]
+COLUMNS = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors"]
+DRAINS  = {"deploy_queue_drain_seconds": "deploy drain s", "outbox_drain_seconds": "outbox drain s"}
+
+
+def run_mode(mode: str, passthrough: list, workdir: str):
+    output = os.path.join(workdir, f"{mode}.json")
+    command = [sys.executable, "-m", "benchmarks.run", "--mode", mode, "--output", output,
+               "--baseline", os.path.join(workdir, "no-baseline.json"), *passthrough]
+    print(f"== {mode}: {' '.join(command[1:])}", flush=True)
+    if subprocess.call(command) != 0 or not os.path.exists(output):
+        return None
+    with open(output) as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare the sync and async serving modes",
+                                     epilog="other arguments are passed to benchmarks.run")
+    parser.add_argument("--output", help="also write both results to this JSON file")
+    args, passthrough = parser.parse_known_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="chatops-modes-")
+    results = {mode: run_mode(mode, passthrough, workdir) for mode in MODES}
+    missing = [mode for mode, result in results.items() if result is None]
+    if missing:
+        print(f"No results for: {', '.join(missing)}")
+        return 1
+
+    sync, async_ = results["sync"], results["async"]
+    print(f"\n{'scenario':<18}{'metric':<16}{'sync':>12}{'async':>12}{'change':>10}")
+    for name, row in sync["scenarios"].items():
+        other = async_["scenarios"].get(name)
+        if other is None:
+            continue
+        for column in COLUMNS:
+            before, after = row[column], other[column]
+            change = f"{(after - before) / before:+.0%}" if before else ""
+            print(f"{name:<18}{column:<16}{before:>12}{after:>12}{change:>10}")
+    for key, label in DRAINS.items():
+        before, after = sync["background"].get(key), async_["background"].get(key)
+        if before is not None and after is not None:
+            print(f"{'background':<18}{label:<16}{before:>12}{after:>12}")
+    print("(latencies in ms)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""
+Offline benchmark for the ChatOps app.
+
+Starts local stand-ins for GitHub and Slack, serves the app on a local
+port and drives /slack (/deploy), /webhook/github and /api/deployments at
+a fixed concurrency. Nothing leaves the machine.
+
+    python -m benchmarks.run --requests 500 --concurrency 20
+    python -m benchmarks.run --save-baseline        # record benchmarks/baseline.json
+    python -m benchmarks.run --github-error-rate 0.05 --github-latency-ms 300
+    python -m benchmarks.run --mode async            # serve asgi:app under uvicorn
+
+Results are written as JSON; when a baseline exists the run is compared
+against it and exits non-zero on a regression.
+"""
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import requests
+
+from benchmarks.stubs import github_stub, slack_stub
+
+HERE             = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT   = os.path.join(HERE, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+SCENARIOS        = ["slack_deploy", "github_webhook", "api_deployments"]
+WEBHOOK_SECRET   = "benchmark-secret"
+SIGNING_SECRET   = "benchmark-signing-secret"
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values) + 0.5))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    total   = len(ordered)
+    return {
+        "requests":       total,
+        "errors":         errors,
+        "error_rate":     round(errors / total, 4) if total else 0.0,
+        "seconds":        round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "mean_ms":        round(sum(ordered) / total * 1000, 3) if total else 0.0,
+        "p50_ms":         round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms":         round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms":         round(percentile(ordered, 99) * 1000, 3),
+        "max_ms":         round(ordered[-1] * 1000, 3) if total else 0.0,
+    }
+
+
+def drive(make_request, count: int, concurrency: int) -> dict:
+    """
+    Runs make_request(session, i) count times over `concurrency` threads,
+    each with its own keep-alive session. A non-2xx/304 reply is an error.
+    """
+    counter   = itertools.count()
+    latencies = []
+    errors    = [0]
+    lock      = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        local, failed = [], 0
+        while True:
+            i = next(counter)
+            if i >= count:
+                break
+            started = time.perf_counter()
+            try:
+                response = make_request(session, i)
+                ok = response.status_code < 300 or response.status_code == 304
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - started)
+            failed += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+# ── scenarios ────────────────────────────────────────────────
+class Bench:
+    def __init__(self, base_url: str, slack_url: str, repos: int):
+        self.base_url  = base_url
+        self.slack_url = slack_url
+        self.repos     = repos
+        self.run_id    = int(time.time())
+        self.triggers  = itertools.count()
+
+    def slack_deploy(self, session, i):
+        body = urlencode({
+            "command":      "/deploy",
+            "text":         f"https://github.com/bench/service-{i % self.repos} dev",
+            "user_name":    f"bench-user-{i % 7}",
+            "response_url": f"{self.slack_url}/response/{i}",
+            # Unique per command, like Slack's; repeats would be answered from the seen-set
+            "trigger_id":   f"bench.{self.run_id}.{next(self.triggers)}",
+        })
+        # Signed like Slack does, so verification is part of what's measured
+        timestamp = str(int(time.time()))
+        signature = hmac.new(SIGNING_SECRET.encode(), f"v0:{timestamp}:{body}".encode(), hashlib.sha256).hexdigest()
+        return session.post(f"{self.base_url}/slack", data=body, headers={
+            "Content-Type":              "application/x-www-form-urlencoded",
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature":         f"v0={signature}",
+        })
+
+    def github_webhook(self, session, i):
+        deployment_id = self.deployment_ids[i % len(self.deployment_ids)]
+        status = "FAILED" if i % 10 == 0 else "SUCCESS"
+        return session.post(
+            f"{self.base_url}/webhook/github",
+            json={
+                "deployment_id": str(deployment_id),
+                "status":        status,
+                "environment":   "dev",
+                "run_url":       f"https://github.com/bench/actions/runs/{i}",
+            },
+            headers={
+                "X-Webhook-Secret": WEBHOOK_SECRET,
+                "X-Delivery-Id":    f"bench-{self.run_id}-{i}-{status}",
+            }
+        )
+
+    def api_deployments(self, session, i):
+        params = {"limit": 50}
+        if i % 2:
+            params["environment"] = "dev"
+        return session.get(f"{self.base_url}/api/deployments", params=params,
+                           headers={"Accept-Encoding": "gzip"})
+
+
+def wait_for_idle(check, timeout: float = 60.0) -> float:
+    """Polls check() until it returns True; returns the seconds waited."""
+    started = time.perf_counter()
+    while not check() and time.perf_counter() - started < timeout:
+        time.sleep(0.05)
+    return round(time.perf_counter() - started, 3)
+
+
+def module_available(name: str) -> bool:
+    import importlib.util
+    return importlib.util.find_spec(name) is not None
+
+
+def deploy_pool_idle(pool) -> bool:
+    stats = pool.stats()
+    return not stats["queue_depth"] and not stats["busy_workers"] and not stats["async_jobs"]
+
+
+def start_server(mode: str):
+    """
+    Serves the app on a free local port: threaded werkzeug for the sync
+    mode, uvicorn for the async one. Returns (port, stop).
+    """
+    if mode == "sync":
+        from werkzeug.serving import make_server
+        from app import create_app
+
+        # Per-request access lines would dominate the output and the timings
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server.server_port, server.shutdown
+
+    import socket
+    import uvicorn
+    from asgi import create_asgi_app
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    config = uvicorn.Config(create_asgi_app(), log_level="warning", access_log=False, lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    wait_for_idle(lambda: server.started, timeout=10)
+
+    def stop():
+        server.should_exit = True
+        thread.join(timeout=10)
+    return sock.getsockname()[1], stop
+
+
+# ── baseline comparison ──────────────────────────────────────
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lists regressions of results against baseline, per scenario."""
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = results["scenarios"].get(name)
+        if current is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] and current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} -> {current[key]}")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput_rps {base['throughput_rps']} -> {current['throughput_rps']}"
+            )
+        if current["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{name}: error_rate {base['error_rate']} -> {current['error_rate']}")
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"\n{'scenario':<18}{'reqs':>7}{'err':>6}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, row in results["scenarios"].items():
+        print(
+            f"{name:<18}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps']:>10}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        )
+    print("(latencies in ms)\n")
+
+
+def write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+# ── main ─────────────────────────────────────────────────────
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ChatOps benchmark")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync",
+                        help="serve through app:app (threads) or asgi:app (uvicorn, needs uvicorn)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per scenario")
+    parser.add_argument("--repos", type=int, default=20, help="distinct repos used by /deploy")
+    parser.add_argument("--github-latency-ms", type=float, default=50)
+    parser.add_argument("--slack-latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--github-error-rate", type=float, default=0.0)
+    parser.add_argument("--slack-error-rate", type=float, default=0.0)
+    parser.add_argument("--slack-channel-rate", type=float, default=50,
+                        help="outbox messages per second per channel")
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write this run to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown before flagging a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args      = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown   = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        return 2
+    if args.mode == "async" and not module_available("uvicorn"):
+        print("The async mode needs uvicorn (and preferably httpx): pip install uvicorn httpx")
+        return 2
+
+    github = github_stub(latency_ms=args.github_latency_ms, jitter_ms=args.jitter_ms,
+                         error_rate=args.github_error_rate).start()
+    slack  = slack_stub(latency_ms=args.slack_latency_ms, jitter_ms=args.jitter_ms,
+                        error_rate=args.slack_error_rate).start()
+
+    workdir = tempfile.mkdtemp(prefix="chatops-bench-")
+    # Must be set before the app (and its services) are imported
+    os.environ.update({
+        "DATABASE_URL":           args.database_url or f"sqlite:///{workdir}/bench.db",
+        "GITHUB_API_URL":         github.url,
+        "SLACK_API_URL":          slack.url,
+        "GITHUB_TOKEN":           "benchmark",
+        "SLACK_BOT_TOKEN":        "benchmark",
+        "SLACK_DEPLOY_CHANNEL":   "#benchmark",
+        # The stand-in has no per-channel limit; pace the outbox like a fast channel
+        "SLACK_CHANNEL_RATE":     str(args.slack_channel_rate),
+        "CHATOPS_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "SLACK_SIGNING_SECRET":   SIGNING_SECRET,
+        "SLACK_SEEN_STORE":       os.path.join(workdir, "slack-seen.db"),
+        "EVENTS_SOCKET_DIR":      os.path.join(workdir, "events"),
+        # App logs would interleave with the report; raise with LOG_LEVEL=INFO
+        "LOG_LEVEL":              os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+
+    from migrate import upgrade
+    from database import SessionLocal
+    from models import Deployment
+    from chatops_services.deploy_queue import deploy_pool
+    from chatops_services.outbox import outbox_dispatcher
+    from chatops_services.deploy_scheduler import scheduler_stats
+
+    upgrade()
+    port, stop_server = start_server(args.mode)
+    bench = Bench(f"http://127.0.0.1:{port}", slack.url, args.repos)
+
+    results = {
+        "meta": {
+            "timestamp":   datetime.now(timezone.utc).isoformat(),
+            "python":      platform.python_version(),
+            "platform":    platform.platform(),
+            "database":    os.environ["DATABASE_URL"].split(":", 1)[0],
+            "mode":        args.mode,
+            "concurrency": args.concurrency,
+            "requests":    args.requests,
+            "github_latency_ms": args.github_latency_ms,
+            "slack_latency_ms":  args.slack_latency_ms,
+            "github_error_rate": args.github_error_rate,
+            "slack_error_rate":  args.slack_error_rate,
+        },
+        "scenarios":  {},
+        "background": {},
+    }
+
+    try:
+        for name in scenarios:
+            if name == "github_webhook" or (name == "api_deployments" and "slack_deploy" not in scenarios):
+                with SessionLocal() as db:
+                    if not db.query(Deployment.id).first():
+                        # Webhooks and listings need rows to work on
+                        drive(bench.slack_deploy, max(args.repos, 50), args.concurrency)
+                    bench.deployment_ids = [
+                        row.id for row in db.query(Deployment.id).order_by(Deployment.id.desc()).limit(1000)
+                    ]
+
+            make_request = getattr(bench, name)
+            drive(make_request, args.warmup, min(args.concurrency, args.warmup or 1))
+            print(f"Running {name}: {args.requests} requests at concurrency {args.concurrency}...")
+            results["scenarios"][name] = drive(make_request, args.requests, args.concurrency)
+
+            if name == "slack_deploy":
+                # Time for the worker pool to push every queued trigger to GitHub
+                results["background"]["deploy_queue_drain_seconds"] = wait_for_idle(lambda: deploy_pool_idle(deploy_pool))
+
+        results["background"]["outbox_drain_seconds"] = wait_for_idle(
+            lambda: not outbox_dispatcher.stats().get("pending")
+        )
+        results["background"]["deploy_queue"] = deploy_pool.stats()
+        results["background"]["outbox"]       = outbox_dispatcher.stats()
+        # Deploys to a repo that is already deploying are queued and coalesced, not triggered
+        results["background"]["scheduler"]    = scheduler_stats()
+        results["background"]["github_calls"] = dict(github.calls)
+        results["background"]["slack_calls"]  = dict(slack.calls)
+    finally:
+        stop_server()
+        github.stop()
+        slack.stop()
+
+    print_table(results)
+    write_json(args.output, results)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found, skipping comparison (use --save-baseline to record one)")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"Regressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
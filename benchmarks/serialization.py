@@ -0,0 +1,110 @@
+"""
+Micro-benchmark for the /api/deployments read path, without HTTP.
+
+Fills a throwaway SQLite database and times building one page of JSON
+the old way (ORM instances, to_dict(), json.dumps) against the column
+projection (plain tuples, listing_rows(), serialize()), with and without
+orjson.
+
+    python -m benchmarks.serialization --rows 20000 --page 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.run import percentile
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Deployment listing serialization micro-benchmark")
+    parser.add_argument("--rows", type=int, default=20000, help="deployments in the database")
+    parser.add_argument("--page", type=int, default=200, help="rows per page")
+    parser.add_argument("--iterations", type=int, default=200, help="pages built per variant")
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="chatops-serialization-")
+    # Must be set before the app's modules are imported
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{workdir}/bench.db"
+
+    from sqlalchemy import insert
+
+    from migrate import upgrade
+    from database import SessionLocal
+    from models import LISTING_COLUMNS, Deployment, listing_rows
+    from chatops_services import response_cache
+
+    upgrade()
+    db = SessionLocal()
+    if not db.query(Deployment.id).first():
+        started = datetime.utcnow() - timedelta(days=30)
+        db.execute(insert(Deployment), [
+            {
+                "repo_url":    f"https://github.com/bench/service-{i % 40}",
+                "user_name":   f"bench-user-{i % 7}",
+                "environment": ("dev", "staging", "prod")[i % 3],
+                "status":      ("SUCCESS", "FAILED", "DEPLOYING")[i % 3],
+                "run_url":     f"https://github.com/bench/service-{i % 40}/actions/runs/{i}" if i % 3 != 2 else None,
+                "timestamp":   started + timedelta(seconds=i * 7),
+            }
+            for i in range(args.rows)
+        ])
+        db.commit()
+
+    def orm_to_dict():
+        deployments = db.query(Deployment).order_by(Deployment.id.desc()).limit(args.page).all()
+        body = json.dumps({"deployments": [d.to_dict() for d in deployments]}, separators=(",", ":")).encode()
+        # Drop the identity map like the per-request session does
+        db.expunge_all()
+        return body
+
+    def projected():
+        rows = db.query(*LISTING_COLUMNS).order_by(Deployment.id.desc()).limit(args.page).all()
+        return response_cache.serialize({"deployments": listing_rows(rows)})
+
+    def projected_stdlib():
+        saved, response_cache.orjson = response_cache.orjson, None
+        try:
+            return projected()
+        finally:
+            response_cache.orjson = saved
+
+    variants = [("orm + to_dict + json", orm_to_dict), ("columns + json", projected_stdlib)]
+    if response_cache.orjson is not None:
+        variants.append(("columns + orjson", projected))
+    else:
+        print("orjson is not installed; skipping that variant")
+
+    print(f"{args.rows} rows in the table, {args.page} per page, {args.iterations} pages per variant\n")
+    print(f"{'variant':<24}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'rows/s':>12}{'bytes':>10}")
+    baseline = None
+    for name, build in variants:
+        for _ in range(10):
+            build()
+        timings = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            body = build()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        mean = sum(timings) / len(timings)
+        baseline = baseline or mean
+        print(
+            f"{name:<24}{mean * 1000:>10.3f}{percentile(timings, 50) * 1000:>10.3f}"
+            f"{percentile(timings, 95) * 1000:>10.3f}{args.page / mean:>12.0f}{len(body):>10}"
+            f"   x{baseline / mean:.2f}"
+        )
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENTS_PATH   = re.compile(r"^/repos/[^/]+/[^/]+/contents/.+$")
+DISPATCHES_PATH = re.compile(r"^/repos/[^/]+/[^/]+/dispatches$")
+
+
+class StubServer:
+    """
+    Local stand-in for an external API, served from a background thread.
+
+    latency_ms is added to every response (plus up to jitter_ms), and
+    error_rate of requests get error_status instead of the normal reply.
+    """
+
+    def __init__(self, routes, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, error_status: int = 503):
+        self.routes       = routes
+        self.latency_ms   = latency_ms
+        self.jitter_ms    = jitter_ms
+        self.error_rate   = error_rate
+        self.error_status = error_status
+        self.calls        = {}
+        self._lock        = threading.Lock()
+        self._server      = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+
+                delay = stub.latency_ms + random.uniform(0, stub.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+
+                for method, pattern, name, reply in stub.routes:
+                    if method == self.command and pattern.match(self.path):
+                        break
+                else:
+                    stub._count("unmatched")
+                    return self._send(404, {"message": "Not Found"})
+
+                if stub.error_rate and random.random() < stub.error_rate:
+                    stub._count(f"{name}_error")
+                    return self._send(stub.error_status, {"message": "injected error"})
+
+                stub._count(name)
+                status, payload, headers = reply(self, body)
+                self._send(status, payload, headers)
+
+            def _send(self, status: int, payload=None, headers=None):
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if data:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET  = _handle
+            do_PUT  = _handle
+            do_POST = _handle
+
+        return Handler
+
+
+# ── GitHub ───────────────────────────────────────────────────
+def _workflow_contents(handler, body):
+    etag = '"stub-workflow"'
+    if handler.headers.get("If-None-Match") == etag:
+        return 304, None, {"ETag": etag}
+    return 200, {"sha": "stub-sha", "path": ".github/workflows/chatops-deploy.yml"}, {
+        "ETag": etag,
+        "X-RateLimit-Remaining": "5000",
+    }
+
+
+def _create_workflow(handler, body):
+    return 201, {"content": {"sha": "stub-sha"}}, None
+
+
+def _dispatch(handler, body):
+    return 204, None, {"X-RateLimit-Remaining": "5000"}
+
+
+def github_stub(**options) -> StubServer:
+    """Answers the contents and dispatches calls made by github_service."""
+    return StubServer([
+        ("GET",  CONTENTS_PATH,   "contents",   _workflow_contents),
+        ("PUT",  CONTENTS_PATH,   "create",     _create_workflow),
+        ("POST", DISPATCHES_PATH, "dispatches", _dispatch),
+    ], **options)
+
+
+# ── Slack ────────────────────────────────────────────────────
+def _post_message(handler, body):
+    return 200, {"ok": True, "ts": f"{time.time():.6f}"}, None
+
+
+def _response_url(handler, body):
+    return 200, {"ok": True}, None
+
+
+def slack_stub(**options) -> StubServer:
+    """Answers chat.postMessage and slash command response_url posts."""
+    return StubServer([
+        ("POST", re.compile(r"^/chat\.postMessage$"), "chat.postMessage", _post_message),
+        ("POST", re.compile(r"^/response/"),          "response_url",     _response_url),
+    ], **options)
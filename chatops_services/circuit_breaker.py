@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+# A dependency trips when at least BREAKER_MIN_CALLS calls in the window
+# failed at BREAKER_FAILURE_RATE or worse
+BREAKER_WINDOW_SECONDS = float(os.environ.get("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS      = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE   = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+# Open for this long before letting probe calls through
+BREAKER_OPEN_SECONDS   = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_PROBES         = int(os.environ.get("BREAKER_PROBES", "1"))
+BUCKETS                = 10
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker for one dependency.
+
+    Outcomes are counted in BUCKETS time buckets spanning the window. Once
+    the failure rate trips it the breaker opens and calls are refused; after
+    open_seconds up to `probes` calls go through (half-open), and their
+    outcome closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, name: str, window: float = BREAKER_WINDOW_SECONDS, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 probes: int = BREAKER_PROBES):
+        self.name         = name
+        self.window       = window
+        self.min_calls    = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.probes       = probes
+        self._lock        = threading.Lock()
+        self._buckets     = [[0, 0, 0] for _ in range(BUCKETS)]   # [bucket number, calls, failures]
+        self._state       = CLOSED
+        self._opened_at   = 0.0
+        self._probing     = 0
+        self.opened       = 0
+        self.rejected     = 0
+
+    def _bucket(self, now: float):
+        number = int(now / (self.window / BUCKETS))
+        bucket = self._buckets[number % BUCKETS]
+        if bucket[0] != number:
+            bucket[:] = [number, 0, 0]
+        return bucket
+
+    def _totals(self, now: float):
+        oldest = int(now / (self.window / BUCKETS)) - BUCKETS + 1
+        calls = failures = 0
+        for number, bucket_calls, bucket_failures in self._buckets:
+            if number >= oldest:
+                calls    += bucket_calls
+                failures += bucket_failures
+        return calls, failures
+
+    def _refresh(self, now: float):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state   = HALF_OPEN
+            self._probing = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def available(self) -> bool:
+        """True unless the breaker is open; doesn't take a probe slot."""
+        return self.state != OPEN
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets probes through."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(self._opened_at + self.open_seconds - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """
+        Asks to make a call. Every allowed call must be followed by
+        record() or release().
+        """
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool):
+        """Counts the outcome of an allowed call."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = max(self._probing - 1, 0)
+                if ok:
+                    self._state = CLOSED
+                    self._buckets = [[0, 0, 0] for _ in range(BUCKETS)]
+                else:
+                    self._trip(now)
+                return
+            bucket = self._bucket(now)
+            bucket[1] += 1
+            bucket[2] += not ok
+            if self._state == CLOSED and not ok:
+                calls, failures = self._totals(now)
+                if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                    self._trip(now)
+
+    def release(self):
+        """Gives back an allowed call that had no outcome worth counting."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = max(self._probing - 1, 0)
+
+    def _trip(self, now: float):
+        self._state     = OPEN
+        self._opened_at = now
+        self._probing   = 0
+        self.opened    += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            calls, failures = self._totals(now)
+            return {
+                "state":        self._state,
+                "calls":        calls,
+                "failure_rate": round(failures / calls, 4) if calls else 0.0,
+                "opened":       self.opened,
+                "rejected":     self.rejected,
+                "retry_in":     round(max(self._opened_at + self.open_seconds - now, 0.0), 1)
+                                if self._state == OPEN else 0.0,
+            }
+
+
+class BreakerRegistry:
+    """
+    One breaker per dependency. Hosts registered under a name share its
+    breaker (e.g. the REST and GraphQL hosts for "github"); any other host
+    gets a breaker of its own, named after it.
+    """
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._by_name  = {}
+        self._by_host  = {}
+
+    def register(self, name: str, hosts) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._by_name.get(name)
+            if breaker is None:
+                breaker = self._by_name[name] = CircuitBreaker(name)
+            for host in hosts:
+                if host:
+                    self._by_host[host] = breaker
+            return breaker
+
+    def for_host(self, host: str) -> CircuitBreaker:
+        breaker = self._by_host.get(host)
+        if breaker is None:
+            breaker = self.register(host, [host])
+        return breaker
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = list(self._by_name.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+breakers = BreakerRegistry()
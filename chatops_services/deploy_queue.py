@@ -0,0 +1,154 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+
+DEPLOY_WORKERS    = int(os.environ.get("DEPLOY_WORKERS", "4"))
+DEPLOY_QUEUE_SIZE = int(os.environ.get("DEPLOY_QUEUE_SIZE", "100"))
+# Jobs in flight on the event loop in the ASGI mode; they wait on I/O, not threads
+ASYNC_DEPLOY_JOBS = int(os.environ.get("ASYNC_DEPLOY_JOBS", "500"))
+
+logger = logging.getLogger(__name__)
+
+# sync job -> coroutine function that replaces it when an event loop is attached
+_async_variants = {}
+
+
+def async_variant(sync_fn):
+    """
+    Registers the decorated coroutine function as the ASGI mode version of
+    sync_fn: submit(sync_fn, ...) then runs it on the event loop instead of
+    a worker thread. Callers keep submitting the sync job.
+    """
+    def register(coro_fn):
+        _async_variants[sync_fn] = coro_fn
+        return coro_fn
+    return register
+
+
+class DeployWorkerPool:
+    """
+    Bounded pool of worker threads for slow deploy work.
+    Threads are started on first submit so gunicorn forks stay thread-free.
+    """
+
+    def __init__(self, workers: int = DEPLOY_WORKERS, queue_size: int = DEPLOY_QUEUE_SIZE):
+        self.workers      = workers
+        self._queue       = queue.Queue(maxsize=queue_size)
+        self._lock        = threading.Lock()
+        self._threads     = []
+        self._started_at  = None
+        self._busy        = 0
+        self._busy_time   = 0.0
+        self._submitted   = 0
+        self._completed   = 0
+        self._rejected    = 0
+        self._loop        = None
+        self._async_limit = ASYNC_DEPLOY_JOBS
+        self._async_jobs  = 0
+        self._tasks       = set()
+
+    def attach_loop(self, loop, limit: int = ASYNC_DEPLOY_JOBS):
+        """Runs jobs that have an async variant as tasks on loop from now on."""
+        self._loop        = loop
+        self._async_limit = limit
+
+    def detach_loop(self):
+        self._loop = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._started_at = time.monotonic()
+            for i in range(self.workers):
+                worker = threading.Thread(
+                    target=self._run, name=f"deploy-worker-{i}", daemon=True
+                )
+                worker.start()
+                self._threads.append(worker)
+
+    def submit(self, fn, *args, **kwargs) -> bool:
+        """Queues a job. Returns False when the queue is full."""
+        coro_fn = _async_variants.get(fn) if self._loop is not None else None
+        if coro_fn is not None:
+            return self._submit_async(coro_fn, args, kwargs)
+        self._ensure_started()
+        try:
+            # Carry the caller's context (request id) into the worker
+            self._queue.put_nowait((contextvars.copy_context(), fn, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._submitted += 1
+        return True
+
+    def _submit_async(self, coro_fn, args, kwargs) -> bool:
+        with self._lock:
+            if self._async_jobs >= self._async_limit:
+                self._rejected += 1
+                return False
+            self._async_jobs += 1
+            self._submitted  += 1
+        # Safe from request threads; the task inherits the caller's context
+        context = contextvars.copy_context()
+        self._loop.call_soon_threadsafe(context.run, self._start_task, coro_fn, args, kwargs)
+        return True
+
+    def _start_task(self, coro_fn, args, kwargs):
+        # The loop only keeps weak references to tasks
+        task = self._loop.create_task(self._run_async(coro_fn, args, kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_async(self, coro_fn, args, kwargs):
+        try:
+            await coro_fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Deploy task error")
+        finally:
+            with self._lock:
+                self._async_jobs -= 1
+                self._completed  += 1
+
+    def _run(self):
+        while True:
+            context, fn, args, kwargs = self._queue.get()
+            with self._lock:
+                self._busy += 1
+            started = time.monotonic()
+            try:
+                context.run(fn, *args, **kwargs)
+            except Exception:
+                logger.exception("Deploy worker error")
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self._busy      -= 1
+                    self._busy_time += elapsed
+                    self._completed += 1
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        """Queue depth and worker utilisation for /health."""
+        with self._lock:
+            uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+            capacity = uptime * self.workers
+            return {
+                "workers":      self.workers,
+                "busy_workers": self._busy,
+                "queue_depth":  self._queue.qsize(),
+                "queue_size":   self._queue.maxsize,
+                "submitted":    self._submitted,
+                "completed":    self._completed,
+                "rejected":     self._rejected,
+                "async_jobs":   self._async_jobs,
+                "utilisation":  round(self._busy_time / capacity, 4) if capacity else 0.0,
+            }
+
+
+deploy_pool = DeployWorkerPool()
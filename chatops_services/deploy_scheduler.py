@@ -0,0 +1,336 @@
+"""
+One active deployment per (repo_url, environment).
+
+A /deploy for a key that already has a DEPLOYING row is stored as QUEUED.
+Queued requests coalesce, so the newest one wins and any older QUEUED row
+for the key becomes SUPERSEDED (its requester is notified through the
+outbox). When the active deployment settles, the queued one is promoted
+to DEPLOYING and triggered.
+
+While GitHub's circuit breaker is open, deployments that would trigger
+are stored as RETRY_QUEUED instead (keeping their key) and retry_queued()
+triggers them once the breaker lets calls through again.
+"""
+import asyncio
+import logging
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+
+from database import SessionLocal
+from models import Deployment
+from chatops_services.deploy_queue import async_variant, deploy_pool
+from chatops_services.circuit_breaker import HALF_OPEN, OPEN
+from chatops_services.deploy_states import ACTIVE_STATUSES, transition, transition_many
+from chatops_services.deployment_stats import record_status_change
+from chatops_services.events import publish_deployment
+from chatops_services.github_service import github_breaker, trigger_github_deployment, trigger_github_deployment_async
+from chatops_services.outbox import enqueue_notification, outbox_dispatcher
+from chatops_services.response_cache import bump_version
+
+DEPLOY_COALESCE = os.environ.get("DEPLOY_COALESCE", "true").lower() == "true"
+LOCK_STRIPES    = 64
+# RETRY_QUEUED deployments re-triggered per pass, and when to stop trying
+RETRY_BATCH_SIZE      = int(os.environ.get("DEPLOY_RETRY_BATCH_SIZE", "20"))
+RETRY_GIVE_UP_SECONDS = float(os.environ.get("DEPLOY_RETRY_GIVE_UP_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
+
+# Without Postgres advisory locks keys are only serialised within this
+# process; run_reconciler's promote_orphans() picks up anything missed
+_stripes     = [threading.Lock() for _ in range(LOCK_STRIPES)]
+_counts      = {"queued": 0, "superseded": 0, "promoted": 0, "retry_queued": 0, "retried": 0, "retry_expired": 0}
+_counts_lock = threading.Lock()
+# Set when a deployment becomes RETRY_QUEUED or TRIGGER_UNCONFIRMED, so run_reconciler starts polling for it
+retry_wakeup = threading.Event()
+
+
+def _key_id(repo_url: str, environment: str) -> int:
+    return zlib.crc32(f"{repo_url}\n{environment}".encode())
+
+
+def _count(name: str, n: int = 1):
+    with _counts_lock:
+        _counts[name] += n
+
+
+@contextmanager
+def key_locks(db, keys):
+    """
+    Serialises admission and promotion for the given (repo_url, environment)
+    keys until the caller's transaction ends (Postgres) or the block exits.
+    The caller commits inside the block.
+    """
+    ids = sorted({_key_id(repo_url, environment) for repo_url, environment in keys})
+    if db.bind.dialect.name == "postgresql":
+        for key_id in ids:
+            db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": key_id})
+        yield
+        return
+
+    stripes = sorted({key_id % LOCK_STRIPES for key_id in ids})
+    for stripe in stripes:
+        _stripes[stripe].acquire()
+    try:
+        yield
+    finally:
+        for stripe in reversed(stripes):
+            _stripes[stripe].release()
+
+
+def busy_repos(db, repo_urls: list, environment: str) -> dict:
+    """repo_url -> id of its active deployment, for the repos that have one."""
+    if not DEPLOY_COALESCE or not repo_urls:
+        return {}
+    rows = db.query(Deployment.repo_url, func.max(Deployment.id))\
+        .filter(Deployment.repo_url.in_(repo_urls),
+                Deployment.environment == environment,
+                Deployment.status.in_(ACTIVE_STATUSES))\
+        .group_by(Deployment.repo_url)\
+        .all()
+    return dict(rows)
+
+
+def assign_statuses(db, rows: list) -> dict:
+    """
+    Sets each new row's status: DEPLOYING, QUEUED when its key is busy, or
+    RETRY_QUEUED when it would trigger but GitHub's breaker is open.
+    Call inside key_locks(). Returns repo_url -> active deployment id for
+    the queued rows.
+    """
+    busy = busy_repos(db, [row["repo_url"] for row in rows], rows[0]["environment"])
+    # Fail fast rather than tie up a worker on calls the breaker would refuse
+    ready = "DEPLOYING" if github_breaker.available() else "RETRY_QUEUED"
+    now = datetime.utcnow()
+    for row in rows:
+        row["status"]     = "QUEUED" if row["repo_url"] in busy else ready
+        row["started_at"] = now if row["status"] == "DEPLOYING" else None
+    _count("queued", len(busy))
+    if ready == "RETRY_QUEUED" and len(rows) > len(busy):
+        _count("retry_queued", len(rows) - len(busy))
+        retry_wakeup.set()
+    return busy
+
+
+def supersede_queued(db, queued_deployments: list) -> list:
+    """
+    Marks older QUEUED rows for the keys of the newly queued deployments
+    as SUPERSEDED and notifies their requesters, in the caller's
+    transaction. Returns the superseded deployments.
+    """
+    if not queued_deployments:
+        return []
+    newest = {(d.repo_url, d.environment): d for d in queued_deployments}
+    older = db.query(Deployment.id, Deployment.repo_url, Deployment.environment)\
+        .filter(Deployment.status == "QUEUED",
+                Deployment.environment.in_({env for _, env in newest}),
+                Deployment.repo_url.in_({repo for repo, _ in newest}),
+                Deployment.id.notin_([d.id for d in queued_deployments]))\
+        .all()
+    replaced_by = {
+        row.id: newest[(row.repo_url, row.environment)]
+        for row in older if (row.repo_url, row.environment) in newest
+    }
+    if not replaced_by:
+        return []
+
+    superseded = []
+    for deployment, old_status in transition_many(db, "SUPERSEDED", {i: None for i in replaced_by}):
+        record_status_change(db, deployment, old_status, "SUPERSEDED")
+        newer = replaced_by[deployment.id]
+        enqueue_notification(
+            db, deployment, "SUPERSEDED", deployment.environment, None,
+            note=f"Replaced by `{newer.id}` from @{newer.user_name}, which will deploy instead."
+        )
+        superseded.append(deployment)
+    _count("superseded", len(superseded))
+    return superseded
+
+
+def promote_next(db, repo_url: str, environment: str) -> list:
+    """
+    Call in the transaction that settles the active deployment for a key.
+    Moves the newest QUEUED deployment to DEPLOYING; pass the result to
+    start_promoted() after committing.
+    """
+    if not DEPLOY_COALESCE:
+        return []
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _key_id(repo_url, environment)})
+
+    active = db.query(Deployment.id)\
+        .filter(Deployment.repo_url == repo_url,
+                Deployment.environment == environment,
+                Deployment.status.in_(ACTIVE_STATUSES))\
+        .first()
+    if active:
+        return []
+    queued = db.query(Deployment.id)\
+        .filter(Deployment.repo_url == repo_url,
+                Deployment.environment == environment,
+                Deployment.status == "QUEUED")\
+        .order_by(Deployment.id.desc())\
+        .all()
+    if not queued:
+        return []
+
+    # Normally just one; older ones are only left behind by a race
+    newest, *older = [row.id for row in queued]
+    promoted, old_status = transition(db, newest, "DEPLOYING", started_at=datetime.utcnow())
+    if promoted is None:
+        return []
+    record_status_change(db, promoted, old_status, "DEPLOYING")
+    if older:
+        supersede_queued(db, [promoted])
+    _count("promoted")
+    return [promoted]
+
+
+def promote_orphans(db) -> list:
+    """
+    Promotes queued deployments whose key has nothing active - left
+    behind by a crash between settling and promoting. Commits.
+    """
+    keys = db.query(Deployment.repo_url, Deployment.environment)\
+        .filter(Deployment.status == "QUEUED")\
+        .distinct()\
+        .all()
+    promoted = []
+    for repo_url, environment in keys:
+        promoted += promote_next(db, repo_url, environment)
+    if promoted:
+        bump_version(db)
+        db.commit()
+        start_promoted(promoted)
+    else:
+        db.rollback()
+    return promoted
+
+
+def start_promoted(promoted: list):
+    """Publishes and triggers promoted deployments once their transaction has committed."""
+    for deployment in promoted:
+        data = deployment.to_dict()
+        publish_deployment(data, "updated")
+        logger.info("Starting queued deployment", extra={
+            "deployment_id": deployment.id, "repo_url": deployment.repo_url, "environment": deployment.environment
+        })
+        if not deploy_pool.submit(trigger_promoted, deployment.repo_url, deployment.environment, deployment.id):
+            mark_trigger_failed(deployment.id)
+
+
+def trigger_promoted(repo_url: str, environment: str, deployment_id: int):
+    """Deploy pool job: the requester was told at queue time, results go to the channel."""
+    result = trigger_github_deployment(repo_url, environment, deployment_id)
+    if not result["success"]:
+        logger.warning("GitHub trigger failed", extra={
+            "deployment_id": deployment_id, "repo_url": repo_url, "error": result["error"]
+        })
+        mark_trigger_failed(deployment_id, retry=result.get("retry", False), unconfirmed=result.get("unconfirmed", False))
+
+
+@async_variant(trigger_promoted)
+async def trigger_promoted_async(repo_url: str, environment: str, deployment_id: int):
+    """trigger_promoted() for the async mode."""
+    result = await trigger_github_deployment_async(repo_url, environment, deployment_id)
+    if not result["success"]:
+        logger.warning("GitHub trigger failed", extra={
+            "deployment_id": deployment_id, "repo_url": repo_url, "error": result["error"]
+        })
+        await asyncio.to_thread(mark_trigger_failed, deployment_id,
+                                result.get("retry", False), result.get("unconfirmed", False))
+
+
+def mark_trigger_failed(deployment_id: int, retry: bool = False, unconfirmed: bool = False):
+    """
+    Flags a deployment whose GitHub trigger failed. TRIGGER_FAILED frees
+    its key; with retry (the dispatch never went out) it becomes
+    RETRY_QUEUED and keeps the key until retry_queued() picks it up. With
+    unconfirmed (GitHub may have accepted it anyway) it becomes
+    TRIGGER_UNCONFIRMED, frees the key and run_reconciler looks for its run.
+    """
+    status = "RETRY_QUEUED" if retry else "TRIGGER_UNCONFIRMED" if unconfirmed else "TRIGGER_FAILED"
+    db = SessionLocal()
+    try:
+        dep, old_status = transition(db, deployment_id, status)
+        if dep:
+            record_status_change(db, dep, old_status, status)
+            promoted = [] if retry else promote_next(db, dep.repo_url, dep.environment)
+            bump_version(db)
+            db.commit()
+            publish_deployment(dep.to_dict(), "updated")
+            start_promoted(promoted)
+            if retry:
+                _count("retry_queued")
+            if retry or unconfirmed:
+                retry_wakeup.set()
+    finally:
+        db.close()
+
+
+def retry_queued(db) -> list:
+    """
+    Re-triggers RETRY_QUEUED deployments once GitHub's breaker lets calls
+    through: a single one as the probe while half-open, a batch once it is
+    closed. Ones waiting longer than RETRY_GIVE_UP_SECONDS become
+    TRIGGER_FAILED and their requester is told. Commits; returns the
+    deployments re-triggered.
+    """
+    give_up_before = datetime.utcnow() - timedelta(seconds=RETRY_GIVE_UP_SECONDS)
+    expired_ids = [row.id for row in db.query(Deployment.id).filter(
+        Deployment.status == "RETRY_QUEUED", Deployment.timestamp <= give_up_before
+    )]
+    expired, promoted = [], []
+    for deployment, old_status in transition_many(db, "TRIGGER_FAILED", {i: None for i in expired_ids}):
+        record_status_change(db, deployment, old_status, "TRIGGER_FAILED")
+        enqueue_notification(
+            db, deployment, "TRIGGER_FAILED", deployment.environment, None,
+            note="GitHub stayed unavailable, so this deployment was never started. Run `/deploy` again."
+        )
+        promoted += promote_next(db, deployment.repo_url, deployment.environment)
+        expired.append(deployment)
+
+    state = github_breaker.state
+    retried = []
+    if state != OPEN:
+        waiting = db.query(Deployment.id)\
+            .filter(Deployment.status == "RETRY_QUEUED")\
+            .order_by(Deployment.id)\
+            .limit(1 if state == HALF_OPEN else RETRY_BATCH_SIZE)\
+            .all()
+        for (deployment_id,) in waiting:
+            deployment, old_status = transition(db, deployment_id, "DEPLOYING", started_at=datetime.utcnow())
+            if deployment is not None:
+                record_status_change(db, deployment, old_status, "DEPLOYING")
+                retried.append(deployment)
+
+    if not expired and not retried and not promoted:
+        db.rollback()
+        return []
+    bump_version(db)
+    db.commit()
+    _count("retry_expired", len(expired))
+    _count("retried", len(retried))
+    if expired:
+        logger.warning("Gave up retrying deployments", extra={"deployment_ids": [d.id for d in expired]})
+        notify_superseded(expired)
+    start_promoted(retried + promoted)
+    return retried
+
+
+def notify_superseded(superseded: list):
+    """After commit: pushes the notified rows to the dashboard and wakes the outbox."""
+    if not superseded:
+        return
+    for deployment in superseded:
+        publish_deployment(deployment.to_dict(), "updated")
+    outbox_dispatcher.wake()
+
+
+def scheduler_stats() -> dict:
+    with _counts_lock:
+        return {"enabled": DEPLOY_COALESCE, **_counts}
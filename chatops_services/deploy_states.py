@@ -0,0 +1,108 @@
+from sqlalchemy import case, select, update
+
+from models import Deployment
+
+# Allowed status transitions. Anything not listed is rejected, so a late
+# or replayed DEPLOYING can never overwrite SUCCESS/FAILED.
+TRANSITIONS = {
+    "DEPLOYING":      {"SUCCESS", "FAILED", "TRIGGER_FAILED", "TRIGGER_UNCONFIRMED", "RETRY_QUEUED"},
+    # A late callback still settles a deployment we gave up on
+    "TRIGGER_FAILED": {"SUCCESS", "FAILED"},
+    # The dispatch may have been accepted although our call to GitHub failed (timeout, 5xx);
+    # run_reconciler looks for its run and gives up after RECONCILE_UNCONFIRMED_MINUTES
+    "TRIGGER_UNCONFIRMED": {"SUCCESS", "FAILED", "TRIGGER_FAILED"},
+    # Waiting for an active deployment on the same repo and environment
+    "QUEUED":         {"DEPLOYING", "SUPERSEDED"},
+    # GitHub was unavailable and the dispatch never sent; re-triggered once its circuit breaker allows
+    "RETRY_QUEUED":   {"DEPLOYING", "TRIGGER_FAILED", "SUCCESS", "FAILED"},
+}
+
+STATUSES = set(TRANSITIONS) | {s for targets in TRANSITIONS.values() for s in targets}
+
+# Hold their repo/environment, so newer requests for it are QUEUED
+ACTIVE_STATUSES = {"DEPLOYING", "RETRY_QUEUED"}
+
+# Reported by the workflow's webhook; these get a finished_at
+FINISHED_STATUSES = {"SUCCESS", "FAILED"}
+
+# Still waiting on GitHub or the scheduler; never archived
+IN_FLIGHT_STATUSES = ACTIVE_STATUSES | {"QUEUED", "TRIGGER_UNCONFIRMED"}
+
+RETURNED_COLUMNS = (
+    Deployment.id, Deployment.repo_url, Deployment.user_name, Deployment.environment,
+    Deployment.status, Deployment.run_url, Deployment.timestamp, Deployment.started_at, Deployment.finished_at
+)
+
+
+def sources_for(new_status: str) -> list:
+    """Statuses a deployment may move to new_status from, most common first."""
+    return [source for source, targets in TRANSITIONS.items() if new_status in targets]
+
+
+def can_transition(old_status: str, new_status: str) -> bool:
+    return new_status in TRANSITIONS.get(old_status, ())
+
+
+def transition(db, deployment_id: int, new_status: str, **values):
+    """
+    Moves a deployment to new_status with a conditional UPDATE, one
+    statement per allowed source status (normally just DEPLOYING).
+    Uses RETURNING where the dialect supports it, so the common case is a
+    single round-trip. Returns (deployment, old_status); deployment is a
+    detached Deployment built from the updated row, or None when the
+    transition is not allowed or the row doesn't exist.
+    """
+    values = {**values, "status": new_status}
+    returning = db.bind.dialect.update_returning
+
+    for old_status in sources_for(new_status):
+        stmt = update(Deployment)\
+            .where(Deployment.id == deployment_id, Deployment.status == old_status)\
+            .values(**values)
+        if returning:
+            row = db.execute(stmt.returning(*RETURNED_COLUMNS)).first()
+        else:
+            result = db.execute(stmt)
+            row = None
+            if result.rowcount:
+                row = db.execute(select(*RETURNED_COLUMNS).where(Deployment.id == deployment_id)).first()
+        if row is not None:
+            return Deployment(**row._mapping), old_status
+
+    return None, None
+
+
+def transition_many(db, new_status: str, run_urls: dict, **columns) -> list:
+    """
+    Bulk transition(): moves every deployment id in run_urls to new_status
+    and stores its run_url, one UPDATE ... CASE per allowed source status.
+    Each extra keyword is a column name mapped to {deployment_id: value}
+    for the ids that set it. Returns [(deployment, old_status), ...] for
+    the rows that moved.
+    """
+    pending = set(run_urls)
+    moved = []
+    returning = db.bind.dialect.update_returning
+
+    for old_status in sources_for(new_status):
+        if not pending:
+            break
+        ids = sorted(pending)
+        condition = (Deployment.id.in_(ids), Deployment.status == old_status)
+        values = {
+            name: case({i: by_id[i] for i in ids if i in by_id}, value=Deployment.id, else_=getattr(Deployment, name))
+            for name, by_id in {**columns, "run_url": run_urls}.items()
+            if any(i in by_id for i in ids)
+        }
+        stmt = update(Deployment).where(*condition).values(status=new_status, **values)
+        if returning:
+            rows = db.execute(stmt.returning(*RETURNED_COLUMNS)).all()
+        else:
+            matched = [row.id for row in db.execute(select(Deployment.id).where(*condition))]
+            db.execute(stmt)
+            rows = db.execute(select(*RETURNED_COLUMNS).where(Deployment.id.in_(matched))).all() if matched else []
+        for row in rows:
+            moved.append((Deployment(**row._mapping), old_status))
+            pending.discard(row.id)
+
+    return moved
@@ -0,0 +1,259 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal, text
+
+from database import SessionLocal
+from models import Deployment, DeploymentCounter
+from chatops_services.response_cache import bump_version
+from chatops_services.history import archived_through
+
+STATS_RECONCILE_SECONDS = float(os.environ.get("STATS_RECONCILE_SECONDS", "3600"))
+STATS_RECONCILE_DAYS    = int(os.environ.get("STATS_RECONCILE_DAYS", "7"))
+
+# Serialises reconcile passes across workers on Postgres
+ADVISORY_LOCK_ID = 724312
+
+logger = logging.getLogger(__name__)
+
+# Each deployment is counted once per dimension
+DIMENSIONS = {
+    "all":  lambda d: "",
+    "repo": lambda d: d.repo_url,
+    "user": lambda d: d.user_name,
+}
+
+
+def _upsert(db, key: dict, delta: int):
+    """Adds delta to one counter row, creating it if needed."""
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(DeploymentCounter).values(**key, count=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["dimension", "dim_value", "environment", "status", "day"],
+            set_={"count": DeploymentCounter.count + delta}
+        )
+        db.execute(stmt)
+        return
+
+    updated = db.query(DeploymentCounter).filter_by(**key).update(
+        {"count": DeploymentCounter.count + delta}, synchronize_session=False
+    )
+    if not updated:
+        db.add(DeploymentCounter(**key, count=delta))
+
+
+def record_status_change(db, deployment, old_status, new_status):
+    """
+    Moves a deployment between counter buckets in the caller's transaction.
+    old_status is None for a new deployment.
+    """
+    if old_status == new_status:
+        return
+    day = (deployment.timestamp or datetime.utcnow()).date()
+    environment = deployment.environment or "dev"
+
+    for dimension, value_of in DIMENSIONS.items():
+        base = {
+            "dimension":   dimension,
+            "dim_value":   value_of(deployment) or "",
+            "environment": environment,
+            "day":         day,
+        }
+        if old_status:
+            _upsert(db, {**base, "status": old_status}, -1)
+        if new_status:
+            _upsert(db, {**base, "status": new_status}, 1)
+
+
+def record_created(db, deployments):
+    """
+    Counts many new deployments at once (e.g. a group /deploy), with one
+    upsert per distinct counter row instead of three per deployment.
+    """
+    deltas = {}
+    for deployment in deployments:
+        day = (deployment.timestamp or datetime.utcnow()).date()
+        environment = deployment.environment or "dev"
+        for dimension, value_of in DIMENSIONS.items():
+            key = (dimension, value_of(deployment) or "", environment, deployment.status, day)
+            deltas[key] = deltas.get(key, 0) + 1
+
+    for (dimension, dim_value, environment, status, day), delta in deltas.items():
+        _upsert(db, {
+            "dimension":   dimension,
+            "dim_value":   dim_value,
+            "environment": environment,
+            "status":      status,
+            "day":         day,
+        }, delta)
+
+
+def get_stats(db, environment: str = None, since=None, breakdown: str = None, top: int = 10) -> dict:
+    """
+    Reads totals from the counters table; cost depends on the number of
+    (environment, status, day) buckets, never on the number of deployments.
+    """
+    query = db.query(
+        DeploymentCounter.environment,
+        DeploymentCounter.status,
+        func.sum(DeploymentCounter.count)
+    ).filter(DeploymentCounter.dimension == "all")
+    if environment:
+        query = query.filter(DeploymentCounter.environment == environment)
+    if since:
+        query = query.filter(DeploymentCounter.day >= since)
+
+    totals = {"total": 0}
+    by_environment = {}
+    for env, status, count in query.group_by(DeploymentCounter.environment, DeploymentCounter.status):
+        count = int(count or 0)
+        if not count:
+            continue
+        totals[status] = totals.get(status, 0) + count
+        totals["total"] += count
+        env_totals = by_environment.setdefault(env, {"total": 0})
+        env_totals[status] = env_totals.get(status, 0) + count
+        env_totals["total"] += count
+
+    result = {"totals": totals, "by_environment": by_environment}
+
+    if breakdown in ("repo", "user"):
+        query = db.query(
+            DeploymentCounter.dim_value,
+            DeploymentCounter.status,
+            func.sum(DeploymentCounter.count)
+        ).filter(DeploymentCounter.dimension == breakdown)
+        if environment:
+            query = query.filter(DeploymentCounter.environment == environment)
+        if since:
+            query = query.filter(DeploymentCounter.day >= since)
+
+        rows = {}
+        for value, status, count in query.group_by(DeploymentCounter.dim_value, DeploymentCounter.status):
+            count = int(count or 0)
+            if not count:
+                continue
+            entry = rows.setdefault(value, {"total": 0})
+            entry[status] = count
+            entry["total"] += count
+        ranked = sorted(rows.items(), key=lambda item: item[1]["total"], reverse=True)
+        result[f"by_{breakdown}"] = dict(ranked[:top])
+
+    return result
+
+
+def reconcile_counters(db, days: int = STATS_RECONCILE_DAYS) -> int:
+    """
+    Rebuilds counters from the deployments table to fix drift.
+    Only the last `days` days are rebuilt; pass days=None for everything.
+    Returns the number of counter rows written.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=days)).date() if days else None
+    # Archived months are gone from deployments; their counters are final
+    floor = archived_through(db)
+    if floor and (cutoff is None or cutoff < floor):
+        cutoff = floor
+
+    stale = db.query(DeploymentCounter)
+    if cutoff:
+        stale = stale.filter(DeploymentCounter.day >= cutoff)
+    stale.delete(synchronize_session=False)
+
+    day = func.date(Deployment.timestamp)
+    written = 0
+    for dimension, column in (("all", None), ("repo", Deployment.repo_url), ("user", Deployment.user_name)):
+        group_by = [Deployment.environment, Deployment.status, day]
+        if column is not None:
+            group_by.insert(0, column)
+        query = db.query(
+            column if column is not None else literal(""),
+            Deployment.environment, Deployment.status, day, func.count(Deployment.id)
+        )
+        if cutoff:
+            query = query.filter(Deployment.timestamp >= datetime.combine(cutoff, datetime.min.time()))
+        query = query.group_by(*group_by)
+
+        for value, env, status, bucket_day, count in query:
+            if isinstance(bucket_day, str):
+                bucket_day = datetime.strptime(bucket_day, "%Y-%m-%d").date()
+            db.add(DeploymentCounter(
+                dimension=dimension,
+                dim_value=value or "",
+                environment=env or "dev",
+                status=status or "DEPLOYING",
+                day=bucket_day,
+                count=count
+            ))
+            written += 1
+
+    # Cached /api/stats responses are keyed on the version
+    bump_version(db)
+    db.commit()
+    return written
+
+
+def _try_lock(db) -> bool:
+    """Transaction-scoped lock so only one worker rebuilds counters at a time."""
+    if db.bind.dialect.name != "postgresql":
+        return True
+    return bool(db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID}).scalar())
+
+
+class StatsReconciler:
+    """Periodically reconciles recent counters against the deployments table."""
+
+    def __init__(self, interval: float = STATS_RECONCILE_SECONDS):
+        self.interval = interval
+        self._lock    = threading.Lock()
+        self._thread  = None
+        self.last_run = None
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="stats-reconciler", daemon=True
+            )
+            self._thread.start()
+
+    def _reconcile(self, days):
+        db = SessionLocal()
+        try:
+            # Held until reconcile_counters commits; other workers skip this pass
+            if not _try_lock(db):
+                db.rollback()
+                return
+            written = reconcile_counters(db, days=days)
+            self.last_run = datetime.utcnow()
+            logger.info("Reconciled deployment counters", extra={"rows": written})
+        except Exception:
+            logger.exception("Stats reconcile error")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _run(self):
+        # Backfill everything once if the counters table has never been built
+        db = SessionLocal()
+        try:
+            empty = db.query(DeploymentCounter.id).first() is None
+        finally:
+            db.close()
+        if empty:
+            self._reconcile(days=None)
+
+        while True:
+            time.sleep(self.interval)
+            self._reconcile(days=STATS_RECONCILE_DAYS)
+
+
+stats_reconciler = StatsReconciler()
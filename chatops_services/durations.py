@@ -0,0 +1,221 @@
+"""
+Deployment duration percentiles.
+
+Every (repo_url, environment) keeps a DurationSketch of its successful
+deployments' durations (finished_at - started_at) in
+deployment_duration_sketches, updated by the webhook or run_reconciler as
+each one settles.
+The sketch is a log-bucketed histogram: a duration x is counted in bucket
+ceil(log(x) / log(GAMMA)), so each reported quantile is within ACCURACY of
+the true value, adding one is a dict increment, and sketches merge by
+adding their bucket counts. Per-environment or fleet-wide percentiles are
+merged from the per-key sketches instead of scanning deployments.
+"""
+import math
+import struct
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import DeploymentDurationSketch
+
+# Relative error of every reported quantile
+ACCURACY    = 0.01
+GAMMA       = (1 + ACCURACY) / (1 - ACCURACY)
+LOG_GAMMA   = math.log(GAMMA)
+# Anything shorter shares one bucket; no real workflow run is that quick
+MIN_SECONDS = 1.0
+# 1% buckets span 1s to well over a year; past this the lowest ones are folded together
+MAX_BUCKETS = 1024
+QUANTILES   = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+FORMAT_VERSION = 1
+_HEADER        = struct.Struct("<BIddd")   # version, zero count, sum, min, max
+_BUCKET        = struct.Struct("<iI")      # bucket index, count
+
+
+class DurationSketch:
+    """Mergeable streaming quantile sketch of durations in seconds."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.zero    = 0
+        self.count   = 0
+        self.total   = 0.0
+        self.min     = math.inf
+        self.max     = -math.inf
+
+    def add(self, seconds: float):
+        if seconds < MIN_SECONDS:
+            self.zero += 1
+        else:
+            index = math.ceil(math.log(seconds) / LOG_GAMMA)
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+            if len(self.buckets) > MAX_BUCKETS:
+                self._collapse()
+        self.count += 1
+        self.total += seconds
+        self.min    = min(self.min, seconds)
+        self.max    = max(self.max, seconds)
+
+    def merge(self, other: "DurationSketch"):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        while len(self.buckets) > MAX_BUCKETS:
+            self._collapse()
+        self.zero  += other.zero
+        self.count += other.count
+        self.total += other.total
+        self.min    = min(self.min, other.min)
+        self.max    = max(self.max, other.max)
+
+    def _collapse(self):
+        lowest, second = sorted(self.buckets)[:2]
+        self.buckets[second] += self.buckets.pop(lowest)
+
+    def quantile(self, q: float):
+        """Value at quantile q (0-1), or None for an empty sketch."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return self.min
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # Middle of the bucket (GAMMA^(i-1), GAMMA^i], in relative terms
+                value = 2 * GAMMA ** index / (GAMMA + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        summary = {
+            "count":        self.count,
+            "mean_seconds": round(self.total / self.count, 1) if self.count else None,
+            "min_seconds":  round(self.min, 1) if self.count else None,
+            "max_seconds":  round(self.max, 1) if self.count else None,
+        }
+        for name, q in QUANTILES.items():
+            value = self.quantile(q)
+            summary[f"{name}_seconds"] = round(value, 1) if value is not None else None
+        return summary
+
+    def encode(self) -> bytes:
+        """Packed form: a fixed header plus 8 bytes per non-empty bucket."""
+        buckets = sorted(self.buckets.items())
+        body = b"".join(_BUCKET.pack(index, count) for index, count in buckets)
+        low, high = (self.min, self.max) if self.count else (0.0, 0.0)
+        return _HEADER.pack(FORMAT_VERSION, self.zero, self.total, low, high) + body
+
+    @classmethod
+    def decode(cls, data: bytes) -> "DurationSketch":
+        sketch = cls()
+        version, sketch.zero, sketch.total, low, high = _HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unknown duration sketch format {version}")
+        for index, count in _BUCKET.iter_unpack(data[_HEADER.size:]):
+            sketch.buckets[index] = count
+        sketch.count = sketch.zero + sum(sketch.buckets.values())
+        if sketch.count:
+            sketch.min, sketch.max = low, high
+        return sketch
+
+
+def duration_of(deployment):
+    """Seconds from trigger to finish, or None when either end is unknown."""
+    if deployment.started_at is None or deployment.finished_at is None:
+        return None
+    seconds = (deployment.finished_at - deployment.started_at).total_seconds()
+    return seconds if seconds >= 0 else None
+
+
+def _sketch_row(db, repo_url: str, environment: str):
+    """The key's sketch row, locked for update on Postgres; created empty if missing."""
+    def locked():
+        return db.query(DeploymentDurationSketch)\
+            .filter_by(repo_url=repo_url, environment=environment)\
+            .with_for_update()\
+            .first()
+
+    row = locked()
+    if row is not None:
+        return row
+    values = {"repo_url": repo_url, "environment": environment, "count": 0,
+              "sketch": DurationSketch().encode(), "updated_at": datetime.utcnow()}
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        # Another worker may be creating the same key
+        db.execute(upsert(DeploymentDurationSketch).values(**values)
+                   .on_conflict_do_nothing(index_elements=["repo_url", "environment"]))
+        return locked()
+    row = DeploymentDurationSketch(**values)
+    db.add(row)
+    db.flush()
+    return row
+
+
+def record_duration(db, deployment):
+    """
+    Adds a successful deployment's duration to its key's sketch, in the
+    caller's transaction. Failed runs stop early and are left out.
+    """
+    seconds = duration_of(deployment)
+    if deployment.status != "SUCCESS" or seconds is None:
+        return
+    row = _sketch_row(db, deployment.repo_url, deployment.environment or "dev")
+    sketch = DurationSketch.decode(row.sketch)
+    sketch.add(seconds)
+    row.sketch     = sketch.encode()
+    row.count      = sketch.count
+    row.updated_at = datetime.utcnow()
+
+
+def repo_filter(repo: str):
+    """
+    SQL filter matching a repo given as a URL or as owner/repo. The LIKE
+    is only a prefilter; use repo_matches() on the rows it returns. Both
+    sides are lowercased, as SQLite's LIKE ignores case and Postgres's
+    doesn't.
+    """
+    owner_repo = "/".join(repo.rstrip("/").split("/")[-2:]).lower()
+    # Escaped so _ (common in repo names) and % match themselves
+    pattern = owner_repo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    repo_url = func.lower(DeploymentDurationSketch.repo_url)
+    return repo_url.like(f"%/{pattern}", escape="\\") | repo_url.like(f"%/{pattern}/", escape="\\") \
+        | (DeploymentDurationSketch.repo_url == repo)
+
+
+def repo_matches(repo_url: str, repo: str) -> bool:
+    if repo_url == repo:
+        return True
+    owner_repo = "/".join(repo.rstrip("/").split("/")[-2:]).lower()
+    return repo_url.rstrip("/").lower().endswith("/" + owner_repo)
+
+
+def duration_stats(db, environment: str = None, repo: str = None) -> dict:
+    """
+    Percentiles per repo and environment plus all of them merged. repo
+    may be a URL or owner/repo. Reads one sketch row per key.
+    """
+    query = db.query(DeploymentDurationSketch.repo_url, DeploymentDurationSketch.environment,
+                     DeploymentDurationSketch.sketch)
+    if environment:
+        query = query.filter(DeploymentDurationSketch.environment == environment)
+    if repo:
+        query = query.filter(repo_filter(repo))
+
+    overall, keys = DurationSketch(), []
+    for repo_url, env, data in query.order_by(DeploymentDurationSketch.repo_url, DeploymentDurationSketch.environment):
+        if repo and not repo_matches(repo_url, repo):
+            continue
+        sketch = DurationSketch.decode(data)
+        if not sketch.count:
+            continue
+        overall.merge(sketch)
+        keys.append({"repo_url": repo_url, "environment": env, **sketch.summary()})
+    return {"overall": overall.summary(), "by_key": keys}
@@ -0,0 +1,203 @@
+import glob
+import json
+import logging
+import os
+import queue
+import select
+import socket
+import threading
+import time
+
+EVENTS_BROKER       = os.environ.get("EVENTS_BROKER", "local")   # local / postgres / none
+EVENTS_SOCKET_DIR   = os.environ.get("EVENTS_SOCKET_DIR", "/tmp/chatops-events")
+EVENTS_PG_CHANNEL   = "chatops_deployments"
+MAX_SUBSCRIBERS     = int(os.environ.get("EVENTS_MAX_SUBSCRIBERS", "200"))
+SUBSCRIBER_BACKLOG  = 100
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """
+    In-process pub/sub for deployment changes.
+
+    Every published event is delivered to local subscribers (SSE streams)
+    and forwarded to the other gunicorn workers through a broker:
+      - "local":    a unix datagram socket per worker in EVENTS_SOCKET_DIR
+      - "postgres": LISTEN/NOTIFY on the application database
+    """
+
+    def __init__(self, broker: str = EVENTS_BROKER):
+        self.broker       = broker
+        self._lock        = threading.Lock()
+        self._subscribers = set()
+        self._listeners   = []
+        self._pid         = None
+        self._socket      = None
+        self._published   = 0
+        self._dropped     = 0
+
+    # ── subscribers ──────────────────────────────────────────
+    def subscribe(self):
+        """Returns a queue of events, or None when at capacity."""
+        self.ensure_listening()
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                return None
+            subscriber = queue.Queue(maxsize=SUBSCRIBER_BACKLOG)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def add_listener(self, callback):
+        """Registers an in-process callback run for every event."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _deliver(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners   = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Event listener callback error")
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client must not hold up everyone else; it will
+                # resync from /api/deployments when it reconnects
+                self._dropped += 1
+
+    # ── publishing ───────────────────────────────────────────
+    def publish(self, event: dict):
+        self.ensure_listening()
+        self._published += 1
+        self._deliver(event)
+        try:
+            message = json.dumps({"origin": os.getpid(), "event": event})
+            if self.broker == "local":
+                self._publish_local(message.encode())
+            elif self.broker == "postgres":
+                self._publish_postgres(message)
+        except Exception:
+            logger.exception("Event broker publish error")
+
+    def _publish_local(self, data: bytes):
+        own = self._socket_path(os.getpid())
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            for path in glob.glob(os.path.join(EVENTS_SOCKET_DIR, "*.sock")):
+                if path == own:
+                    continue
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker is gone; clean up after it
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except BlockingIOError:
+                    self._dropped += 1
+        finally:
+            sender.close()
+
+    def _publish_postgres(self, message: str):
+        from sqlalchemy import text
+        from database import get_engine
+        with get_engine().begin() as conn:
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": EVENTS_PG_CHANNEL, "payload": message}
+            )
+
+    # ── cross-worker listener ────────────────────────────────
+    def _socket_path(self, pid: int) -> str:
+        return os.path.join(EVENTS_SOCKET_DIR, f"{pid}.sock")
+
+    def ensure_listening(self):
+        """Starts this process's broker listener (once per worker after fork)."""
+        if self._pid == os.getpid() or self.broker not in ("local", "postgres"):
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            target = self._listen_local if self.broker == "local" else self._listen_postgres
+            threading.Thread(target=target, name="event-listener", daemon=True).start()
+
+    def _receive(self, raw):
+        message = json.loads(raw)
+        if message.get("origin") != os.getpid():
+            self._deliver(message["event"])
+
+    def _listen_local(self):
+        os.makedirs(EVENTS_SOCKET_DIR, exist_ok=True)
+        path = self._socket_path(os.getpid())
+        if os.path.exists(path):
+            os.unlink(path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(path)
+        while True:
+            try:
+                self._receive(self._socket.recv(65536))
+            except Exception:
+                logger.exception("Event listener error")
+
+    def _listen_postgres(self):
+        from database import get_engine
+        while True:
+            try:
+                raw = get_engine().raw_connection()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {EVENTS_PG_CHANNEL}")
+                while True:
+                    if hasattr(conn, "notifies"):
+                        # psycopg2: wait on the socket, then drain
+                        select.select([conn], [], [], 5)
+                        conn.poll()
+                        while conn.notifies:
+                            self._receive(conn.notifies.pop(0).payload)
+                    else:
+                        # pg8000 only reads notifications while running a query
+                        cursor.execute("SELECT 1")
+                        while conn.notifications:
+                            self._receive(conn.notifications.popleft()[2])
+                        time.sleep(0.5)
+            except Exception:
+                logger.exception("Postgres event listener error")
+                time.sleep(5)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {
+            "broker":      self.broker,
+            "subscribers": subscribers,
+            "published":   self._published,
+            "dropped":     self._dropped,
+        }
+
+
+event_bus = EventBus()
+
+
+def publish_deployment(data: dict, action: str):
+    """
+    Announces a created/updated deployment to dashboards.
+    Pass deployment.to_dict() taken before commit to avoid a reload.
+    """
+    event_bus.publish({
+        "type": "deployment",
+        "action": action,
+        "deployment": data
+    })
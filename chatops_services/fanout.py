@@ -0,0 +1,193 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from chatops_services.github_service import parse_repo, trigger_github_deployment
+from chatops_services.slack_service import ResponseUrlUpdater
+
+FANOUT_CONCURRENCY    = int(os.environ.get("FANOUT_CONCURRENCY", "8"))
+FANOUT_MAX_REPOS      = int(os.environ.get("FANOUT_MAX_REPOS", "30"))
+FANOUT_UPDATE_SECONDS = float(os.environ.get("FANOUT_UPDATE_SECONDS", "2"))
+SECTION_TEXT_LIMIT    = 2900
+
+logger = logging.getLogger(__name__)
+
+
+def _load_groups(raw: str) -> dict:
+    """DEPLOY_GROUPS='{"platform": ["https://github.com/org/api", ...], ...}'"""
+    if not raw:
+        return {}
+    try:
+        groups = json.loads(raw)
+        return {name.lower(): list(repos) for name, repos in groups.items()}
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.error("Ignoring invalid DEPLOY_GROUPS", extra={"error": str(e)})
+        return {}
+
+
+REPO_GROUPS = _load_groups(os.environ.get("DEPLOY_GROUPS", ""))
+
+
+def resolve_repos(tokens: list):
+    """
+    Expands group names and drops duplicates, keeping the order given.
+    Returns (repo_urls, unknown_tokens); anything without a "/" that isn't
+    a group is reported rather than deployed.
+    """
+    repos, unknown = [], []
+    for token in tokens:
+        group = REPO_GROUPS.get(token.lower())
+        if group is not None:
+            repos.extend(group)
+        elif "/" in token:
+            repos.append(token)
+        else:
+            unknown.append(token)
+    return list(dict.fromkeys(repos)), unknown
+
+
+def short_name(repo_url: str) -> str:
+    try:
+        owner, repo = parse_repo(repo_url)
+        return f"{owner}/{repo}"
+    except IndexError:
+        return repo_url
+
+
+class GroupDeployment:
+    """
+    One multi-repo /deploy. Triggers every repo concurrently (at most
+    FANOUT_CONCURRENCY at a time) and keeps a single Slack summary current
+    through the command's response_url.
+    """
+
+    def __init__(self, deployments: list, environment: str, user_name: str, response_url: str):
+        self.environment = environment
+        self.user_name   = user_name
+        # PENDING until triggered; QUEUED rows wait for a deployment already running on their
+        # repo, RETRY_QUEUED ones for GitHub to come back
+        self.results     = {
+            d["id"]: {
+                "repo_url": d["repo_url"],
+                "status":   "PENDING" if d["status"] == "DEPLOYING" else d["status"],
+                "error":    None
+            }
+            for d in deployments
+        }
+        self._lock       = threading.Lock()
+        self._reply      = ResponseUrlUpdater(response_url, FANOUT_UPDATE_SECONDS)
+        self._started    = None
+        self._to_trigger = sum(1 for r in self.results.values() if r["status"] == "PENDING")
+
+    def run(self, on_trigger_failed):
+        """Deploy pool job. on_trigger_failed(deployment_id, retry) flags a failed trigger."""
+        self._started = time.monotonic()
+        workers = max(1, min(FANOUT_CONCURRENCY, len(self.results)))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fanout") as pool:
+            futures = [
+                pool.submit(
+                    contextvars.copy_context().run,
+                    self._trigger, deployment_id, result["repo_url"], on_trigger_failed
+                )
+                for deployment_id, result in self.results.items() if result["status"] == "PENDING"
+            ]
+            for _ in as_completed(futures):
+                with self._lock:
+                    pending = any(r["status"] == "PENDING" for r in self.results.values())
+                if pending:
+                    self._reply.update(self._message)
+
+        self._reply.finish(self._message(final=True))
+
+    def _trigger(self, deployment_id: int, repo_url: str, on_trigger_failed):
+        try:
+            result = trigger_github_deployment(repo_url, self.environment, deployment_id)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        if not result["success"]:
+            logger.warning("Group trigger failed", extra={
+                "deployment_id": deployment_id, "repo_url": repo_url, "error": result.get("error")
+            })
+            on_trigger_failed(deployment_id, result.get("retry", False), result.get("unconfirmed", False))
+
+        with self._lock:
+            if result["success"]:
+                self.results[deployment_id]["status"] = "TRIGGERED"
+            else:
+                self.results[deployment_id]["status"] = (
+                    "RETRY_QUEUED" if result.get("retry") else
+                    "TRIGGER_UNCONFIRMED" if result.get("unconfirmed") else "TRIGGER_FAILED"
+                )
+            self.results[deployment_id]["error"]  = result.get("error")
+
+    def _message(self, final: bool = False) -> dict:
+        return {"response_type": "in_channel", "blocks": self.summary_blocks(final)}
+
+    def summary_blocks(self, final: bool = False) -> list:
+        with self._lock:
+            results = [(deployment_id, dict(r)) for deployment_id, r in self.results.items()]
+
+        triggered = sum(1 for _, r in results if r["status"] == "TRIGGERED")
+        failed    = sum(1 for _, r in results if r["status"] == "TRIGGER_FAILED")
+        queued    = sum(1 for _, r in results if r["status"] == "QUEUED")
+        retrying  = sum(1 for _, r in results if r["status"] == "RETRY_QUEUED")
+        unconfirmed = sum(1 for _, r in results if r["status"] == "TRIGGER_UNCONFIRMED")
+
+        if self._started is None:
+            title, status_text = "Group Deployment Queued", "Triggering GitHub Actions now..."
+        elif final:
+            title = "Group Deployment Triggered"
+            status_text = f"{triggered}/{len(results)} triggered"
+            if failed:
+                status_text += f", {failed} failed to trigger"
+            if queued:
+                status_text += f", {queued} queued behind a running deployment"
+            if retrying:
+                status_text += f", {retrying} queued for retry while GitHub is unavailable"
+            if unconfirmed:
+                status_text += f", {unconfirmed} not confirmed by GitHub (they may still run)"
+            status_text += f" in {time.monotonic() - self._started:.1f}s - I'll post each result here when it finishes."
+        else:
+            title = "Group Deployment In Progress"
+            pending = sum(1 for _, r in results if r["status"] == "PENDING")
+            status_text = f"{self._to_trigger - pending}/{self._to_trigger} processed..."
+
+        blocks = [
+            {
+                "type": "header",
+                "text": {"type": "plain_text", "text": title}
+            },
+            {
+                "type": "section",
+                "fields": [
+                    {"type": "mrkdwn", "text": f"*Repos:*\n{len(results)}"},
+                    {"type": "mrkdwn", "text": f"*Environment:*\n`{self.environment}`"},
+                    {"type": "mrkdwn", "text": f"*Triggered by:*\n@{self.user_name}"}
+                ]
+            }
+        ]
+
+        # One line per repo, split across sections to stay under Slack's text limit
+        text = ""
+        for deployment_id, r in results:
+            line = f"`{deployment_id}` {short_name(r['repo_url'])} - `{r['status']}`"
+            if r["error"]:
+                line += f" _{r['error'][:80]}_"
+            if text and len(text) + len(line) + 1 > SECTION_TEXT_LIMIT:
+                blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+                text = ""
+            text = f"{text}\n{line}" if text else line
+        if text:
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+
+        blocks.append({
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": f"Status: {status_text}"}
+        })
+        return blocks
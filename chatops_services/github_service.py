@@ -1,8 +1,23 @@
-import requests
+from chatops_services.http_client import async_http_client, http_client, is_transient, latency_budget, never_sent
+from chatops_services.circuit_breaker import breakers
+from urllib.parse import urlsplit
+import asyncio
 import os
 import base64
+import logging
+import time
+from chatops_services.workflow_cache import workflow_cache
+from chatops_services.metrics import GITHUB_STEP_SECONDS, GITHUB_TRIGGERS
 
-GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
+GITHUB_TOKEN   = os.environ.get("GITHUB_TOKEN")
+# Overridable so benchmarks can point at a local stand-in
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_GRAPHQL_URL = os.environ.get("GITHUB_GRAPHQL_URL", f"{GITHUB_API_URL}/graphql")
+# End-to-end limit for one deploy trigger (workflow check, create, dispatch)
+DEPLOY_BUDGET_SECONDS = float(os.environ.get("DEPLOY_BUDGET_SECONDS", "30"))
+
+# REST and GraphQL fail together, so they share one breaker
+github_breaker = breakers.register("github", {urlsplit(GITHUB_API_URL).netloc, urlsplit(GITHUB_GRAPHQL_URL).netloc})
 
 HEADERS = {
     "Authorization": f"Bearer {GITHUB_TOKEN}",
@@ -10,11 +25,25 @@ HEADERS = {
     "X-GitHub-Api-Version": "2022-11-28"
 }
 
+# Label lookups done once; observations on the hot path are lock-free
+STEP_PARSE           = GITHUB_STEP_SECONDS.labels("parse")
+STEP_ENSURE_WORKFLOW = GITHUB_STEP_SECONDS.labels("ensure_workflow")
+STEP_DISPATCH        = GITHUB_STEP_SECONDS.labels("dispatch")
+TRIGGER_OK           = GITHUB_TRIGGERS.labels("success")
+TRIGGER_FAILED       = GITHUB_TRIGGERS.labels("failed")
+
+logger = logging.getLogger(__name__)
+
 WEBHOOK_URL    = os.environ.get("CHATOPS_WEBHOOK_URL", "")
 WEBHOOK_SECRET = os.environ.get("CHATOPS_WEBHOOK_SECRET", "")
 
+WORKFLOW_NAME  = "ChatOps Deployment"
+WORKFLOW_PATH  = ".github/workflows/chatops-deploy.yml"
+RUNS_PER_PAGE  = 100
+
 def get_workflow_content():
-    return f"""name: ChatOps Deployment
+    return f"""name: {WORKFLOW_NAME}
+run-name: ChatOps deploy ${{{{ github.event.client_payload.deployment_id }}}} to ${{{{ github.event.client_payload.environment }}}}
 
 on:
   repository_dispatch:
@@ -39,6 +68,7 @@ jobs:
           curl -X POST {WEBHOOK_URL}/webhook/github \\
             -H "Content-Type: application/json" \\
             -H "X-Webhook-Secret: {WEBHOOK_SECRET}" \\
+            -H "X-Delivery-Id: ${{{{ github.run_id }}}}-${{{{ github.run_attempt }}}}-SUCCESS" \\
             -d "{{\\\"deployment_id\\\": \\\"${{{{ github.event.client_payload.deployment_id }}}}\\\", \\\"status\\\": \\\"SUCCESS\\\", \\\"environment\\\": \\\"${{{{ github.event.client_payload.environment }}}}\\\", \\\"run_url\\\": \\\"https://github.com/${{{{ github.repository }}}}/actions/runs/${{{{ github.run_id }}}}\\\"}}"
 
       - name: Notify Backend - FAILED
@@ -47,6 +77,7 @@ jobs:
           curl -X POST {WEBHOOK_URL}/webhook/github \\
             -H "Content-Type: application/json" \\
             -H "X-Webhook-Secret: {WEBHOOK_SECRET}" \\
+            -H "X-Delivery-Id: ${{{{ github.run_id }}}}-${{{{ github.run_attempt }}}}-FAILED" \\
             -d "{{\\\"deployment_id\\\": \\\"${{{{ github.event.client_payload.deployment_id }}}}\\\", \\\"status\\\": \\\"FAILED\\\", \\\"environment\\\": \\\"${{{{ github.event.client_payload.environment }}}}\\\", \\\"run_url\\\": \\\"https://github.com/${{{{ github.repository }}}}/actions/runs/${{{{ github.run_id }}}}\\\"}}"
 """
 
@@ -57,65 +88,230 @@ def parse_repo(repo_url: str):
     return parts[-2], parts[-1]
 
 
+def invalidate_workflow_cache(owner: str = None, repo: str = None):
+    """
+    Forgets what we know about a repo's workflow file.
+    Call with no arguments to clear the whole cache.
+    """
+    workflow_cache.invalidate(f"{owner}/{repo}" if owner and repo else None)
+
+
 def ensure_workflow_exists(owner: str, repo: str):
     """
     Checks if workflow exists in target repo.
     If not, creates it automatically.
+    Results are cached per owner/repo and revalidated with If-None-Match.
     """
-    file_path = ".github/workflows/chatops-deploy.yml"
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{file_path}"
+    key = f"{owner}/{repo}"
+    cached = workflow_cache.get(key)
+    if cached and cached["fresh"]:
+        return {"success": True, "created": False, "sha": cached["sha"]}
+
+    check = http_client.get(_contents_url(owner, repo), headers=_check_headers(cached))
+    result = _check_result(key, cached, check)
+    if result is not None:
+        return result
+
+    # Workflow missing - create it automatically
+    result = write_workflow(owner, repo)
+    if not result["success"]:
+        return result
+    return {"success": True, "created": True, "sha": result["sha"]}
+
+
+async def ensure_workflow_exists_async(owner: str, repo: str):
+    """ensure_workflow_exists() for the async mode."""
+    key = f"{owner}/{repo}"
+    cached = workflow_cache.get(key)
+    if cached and cached["fresh"]:
+        return {"success": True, "created": False, "sha": cached["sha"]}
+
+    check = await async_http_client.get(_contents_url(owner, repo), headers=_check_headers(cached))
+    result = _check_result(key, cached, check)
+    if result is not None:
+        return result
+
+    result = await write_workflow_async(owner, repo)
+    if not result["success"]:
+        return result
+    return {"success": True, "created": True, "sha": result["sha"]}
+
+
+def _contents_url(owner: str, repo: str) -> str:
+    return f"{GITHUB_API_URL}/repos/{owner}/{repo}/contents/{WORKFLOW_PATH}"
+
 
-    # Check if workflow already exists
-    check = requests.get(url, headers=HEADERS)
+def _check_headers(cached) -> dict:
+    # Check if workflow already exists (a 304 is free against the rate limit)
+    if cached and cached["etag"]:
+        return {**HEADERS, "If-None-Match": cached["etag"]}
+    return HEADERS
+
+
+def _check_result(key: str, cached, check):
+    """
+    Result of the existence check, or None when the workflow is missing.
+    Only a 404 means missing: writing on any other error would overwrite
+    a workflow we just couldn't read.
+    """
+    if check.status_code == 304:
+        workflow_cache.touch(key)
+        return {"success": True, "created": False, "sha": cached["sha"]}
 
     if check.status_code == 200:
-        print(f"Workflow already exists in {owner}/{repo}")
-        return {"success": True, "created": False}
+        logger.debug("Workflow already exists", extra={"repo": key})
+        sha = check.json().get("sha")
+        workflow_cache.put(key, sha, check.headers.get("ETag"))
+        return {"success": True, "created": False, "sha": sha}
 
-    # Workflow missing - create it automatically
-    print(f"Creating workflow in {owner}/{repo}...")
-    content_encoded = base64.b64encode(
-        get_workflow_content().encode()
-    ).decode()
+    workflow_cache.invalidate(key)
+    if check.status_code == 404:
+        return None
 
-    create = requests.put(
-        url,
-        headers=HEADERS,
-        json={
-            "message": "chore: add ChatOps deployment workflow [auto-created]",
-            "content": content_encoded
-        }
+    logger.warning("Workflow check failed", extra={
+        "repo": key, "status_code": check.status_code, "error": check.text[:500]
+    })
+    rate_limited = check.status_code == 429 or \
+        (check.status_code == 403 and check.headers.get("X-RateLimit-Remaining") == "0")
+    return {
+        "success": False,
+        "error": f"HTTP {check.status_code} checking {WORKFLOW_PATH}",
+        "retry": rate_limited or check.status_code >= 500
+    }
+
+
+def write_workflow(owner: str, repo: str, sha: str = None):
+    """
+    Creates the workflow file, or replaces it when sha (the current blob
+    SHA) is given. Caches the new blob SHA on success.
+    """
+    response = http_client.put(_contents_url(owner, repo), headers=HEADERS, json=_workflow_body(owner, repo, sha))
+    return _write_result(owner, repo, response)
+
+
+async def write_workflow_async(owner: str, repo: str, sha: str = None):
+    """write_workflow() for the async mode."""
+    response = await async_http_client.put(
+        _contents_url(owner, repo), headers=HEADERS, json=_workflow_body(owner, repo, sha)
     )
+    return _write_result(owner, repo, response)
+
+
+def _workflow_body(owner: str, repo: str, sha: str = None) -> dict:
+    action = "update" if sha else "add"
+    logger.info("Writing workflow", extra={"repo": f"{owner}/{repo}", "action": action})
+
+    body = {
+        "message": f"chore: {action} ChatOps deployment workflow [auto-{action}d]",
+        "content": base64.b64encode(get_workflow_content().encode()).decode()
+    }
+    if sha:
+        body["sha"] = sha
+    return body
+
+
+def _write_result(owner: str, repo: str, response):
+    if response.status_code in (200, 201):
+        new_sha = response.json().get("content", {}).get("sha")
+        workflow_cache.put(f"{owner}/{repo}", new_sha)
+        return {"success": True, "sha": new_sha}
+
+    logger.error("Failed to write workflow", extra={
+        "repo": f"{owner}/{repo}", "status_code": response.status_code, "error": response.text[:500]
+    })
+    return {"success": False, "error": response.text, "retry": response.status_code >= 500}
 
-    if create.status_code == 201:
-        print(f"Workflow created successfully in {owner}/{repo}")
-        return {"success": True, "created": True}
-    else:
-        print(f"Failed to create workflow: {create.text}")
-        return {"success": False, "error": create.text}
+
+def github_graphql(query: str, variables: dict = None):
+    """Runs a GraphQL query. Returns {"success", "data"} or {"success", "error"}."""
+    response = http_client.post(
+        GITHUB_GRAPHQL_URL,
+        headers=HEADERS,
+        json={"query": query, "variables": variables or {}}
+    )
+    if response.status_code != 200:
+        return {"success": False, "error": f"HTTP {response.status_code}: {response.text[:200]}"}
+    body = response.json()
+    if body.get("errors"):
+        return {"success": False, "error": "; ".join(e.get("message", "") for e in body["errors"])}
+    return {"success": True, "data": body.get("data") or {}}
 
 
 def trigger_dispatch(owner: str, repo: str, environment: str, deployment_id: int):
     """Triggers the GitHub Actions workflow."""
-    url = f"https://api.github.com/repos/{owner}/{repo}/dispatches"
+    response = http_client.post(
+        f"{GITHUB_API_URL}/repos/{owner}/{repo}/dispatches",
+        headers=HEADERS,
+        json=_dispatch_body(environment, deployment_id)
+    )
+    return _dispatch_result(owner, repo, deployment_id, response)
 
-    response = requests.post(
-        url,
+
+async def trigger_dispatch_async(owner: str, repo: str, environment: str, deployment_id: int):
+    """trigger_dispatch() for the async mode."""
+    response = await async_http_client.post(
+        f"{GITHUB_API_URL}/repos/{owner}/{repo}/dispatches",
         headers=HEADERS,
-        json={
-            "event_type": "chatops-deploy",
-            "client_payload": {
-                "environment": environment,
-                "deployment_id": str(deployment_id),
-                "triggered_by": "chatops"
-            }
-        }
+        json=_dispatch_body(environment, deployment_id)
     )
+    return _dispatch_result(owner, repo, deployment_id, response)
+
+
+def _dispatch_body(environment: str, deployment_id: int) -> dict:
+    return {
+        "event_type": "chatops-deploy",
+        "client_payload": {
+            "environment": environment,
+            "deployment_id": str(deployment_id),
+            "triggered_by": "chatops"
+        }
+    }
 
+
+def _dispatch_result(owner: str, repo: str, deployment_id: int, response):
     if response.status_code == 204:
+        logger.info("Dispatch sent", extra={"repo": f"{owner}/{repo}", "deployment_id": deployment_id})
         return {"success": True}
-    else:
-        return {"success": False, "error": response.text}
+
+    logger.warning("Dispatch failed", extra={
+        "repo": f"{owner}/{repo}", "deployment_id": deployment_id, "status_code": response.status_code
+    })
+    # Repo moved, deleted or lost access - don't trust the cached workflow
+    if response.status_code == 404:
+        invalidate_workflow_cache(owner, repo)
+    # A 429 was turned away, but GitHub may have queued the run before failing with a 5xx
+    return {
+        "success":     False,
+        "error":       response.text,
+        "retry":       response.status_code == 429,
+        "unconfirmed": response.status_code >= 500,
+    }
+
+
+def list_dispatch_runs(owner: str, repo: str, etag: str = None):
+    """
+    Recent repository_dispatch workflow runs for a repo, newest first.
+    Pass the ETag from the previous call: an unchanged list comes back as
+    a 304, which doesn't count against the rate limit.
+    """
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/actions/runs"
+    headers = {**HEADERS, "If-None-Match": etag} if etag else HEADERS
+    response = http_client.get(
+        url,
+        headers=headers,
+        params={"event": "repository_dispatch", "per_page": RUNS_PER_PAGE}
+    )
+
+    if response.status_code == 304:
+        return {"success": True, "not_modified": True, "etag": etag, "runs": None}
+    if response.status_code != 200:
+        return {"success": False, "error": f"HTTP {response.status_code}"}
+    return {
+        "success": True,
+        "not_modified": False,
+        "etag": response.headers.get("ETag"),
+        "runs": response.json().get("workflow_runs", [])
+    }
 
 
 def trigger_github_deployment(repo_url: str, environment: str, deployment_id: int):
@@ -127,29 +323,108 @@ def trigger_github_deployment(repo_url: str, environment: str, deployment_id: in
     
     User just types /deploy <any-github-repo> <env>
     Everything else is automatic!
+
+    The whole flow shares DEPLOY_BUDGET_SECONDS. A failed result has
+    "retry": True when GitHub was unavailable and the dispatch was never
+    sent, and "unconfirmed": True when it may have been accepted anyway
+    (left to run_reconciler, never re-dispatched).
     """
     try:
-        # Step 1 - Parse repo URL
-        owner, repo = parse_repo(repo_url)
-        print(f"Processing deployment for {owner}/{repo}")
-
-        # Step 2 - Auto create workflow if missing
-        workflow_result = ensure_workflow_exists(owner, repo)
-        if not workflow_result["success"]:
-            return {
-                "success": False,
-                "error": f"Could not setup workflow: {workflow_result['error']}"
-            }
-
-        # Step 3 - Wait briefly if workflow was just created
-        if workflow_result.get("created"):
-            import time
-            print("Workflow just created, waiting 3 seconds...")
-            time.sleep(3)
-
-        # Step 4 - Trigger the deployment
-        result = trigger_dispatch(owner, repo, environment, deployment_id)
-        return result
+        with latency_budget(DEPLOY_BUDGET_SECONDS):
+            # Step 1 - Parse repo URL
+            started = time.perf_counter()
+            owner, repo = parse_repo(repo_url)
+            STEP_PARSE.observe(time.perf_counter() - started)
+            logger.info("Processing deployment", extra={
+                "repo": f"{owner}/{repo}", "deployment_id": deployment_id, "environment": environment
+            })
+
+            # Step 2 - Auto create workflow if missing
+            started = time.perf_counter()
+            workflow_result = ensure_workflow_exists(owner, repo)
+            STEP_ENSURE_WORKFLOW.observe(time.perf_counter() - started)
+            if not workflow_result["success"]:
+                return _setup_failed(workflow_result)
+
+            # Step 3 - Wait briefly if workflow was just created
+            if workflow_result.get("created"):
+                logger.info("Workflow just created, waiting 3 seconds", extra={"repo": f"{owner}/{repo}"})
+                time.sleep(3)
+
+            # Step 4 - Trigger the deployment
+            started = time.perf_counter()
+            try:
+                result = trigger_dispatch(owner, repo, environment, deployment_id)
+            except Exception as e:
+                return _trigger_error(e, deployment_id, dispatching=True)
+            STEP_DISPATCH.observe(time.perf_counter() - started)
+            (TRIGGER_OK if result["success"] else TRIGGER_FAILED).inc()
+            return result
 
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        return _trigger_error(e, deployment_id)
+
+
+async def trigger_github_deployment_async(repo_url: str, environment: str, deployment_id: int):
+    """
+    trigger_github_deployment() for the async mode: the same steps, with
+    the GitHub calls awaited on the event loop instead of holding a thread.
+    """
+    try:
+        with latency_budget(DEPLOY_BUDGET_SECONDS):
+            started = time.perf_counter()
+            owner, repo = parse_repo(repo_url)
+            STEP_PARSE.observe(time.perf_counter() - started)
+            logger.info("Processing deployment", extra={
+                "repo": f"{owner}/{repo}", "deployment_id": deployment_id, "environment": environment
+            })
+
+            started = time.perf_counter()
+            workflow_result = await ensure_workflow_exists_async(owner, repo)
+            STEP_ENSURE_WORKFLOW.observe(time.perf_counter() - started)
+            if not workflow_result["success"]:
+                return _setup_failed(workflow_result)
+
+            if workflow_result.get("created"):
+                logger.info("Workflow just created, waiting 3 seconds", extra={"repo": f"{owner}/{repo}"})
+                await asyncio.sleep(3)
+
+            started = time.perf_counter()
+            try:
+                result = await trigger_dispatch_async(owner, repo, environment, deployment_id)
+            except Exception as e:
+                return _trigger_error(e, deployment_id, dispatching=True)
+            STEP_DISPATCH.observe(time.perf_counter() - started)
+            (TRIGGER_OK if result["success"] else TRIGGER_FAILED).inc()
+            return result
+
+    except Exception as e:
+        return _trigger_error(e, deployment_id)
+
+
+def _setup_failed(workflow_result: dict) -> dict:
+    TRIGGER_FAILED.inc()
+    return {
+        "success": False,
+        "error": f"Could not setup workflow: {workflow_result['error']}",
+        "retry": workflow_result.get("retry", False)
+    }
+
+
+def _trigger_error(error: Exception, deployment_id: int, dispatching: bool = False) -> dict:
+    """
+    Failed result for an exception. Workflow setup is safe to repeat, so
+    any transient error there is retried; the dispatch POST only when it
+    never left, since a timeout can hide a run GitHub already started.
+    """
+    TRIGGER_FAILED.inc()
+    transient = is_transient(error)
+    retry = never_sent(error) if dispatching else transient
+    if transient:
+        # Outage, timeout or open breaker: expected
+        logger.warning("GitHub unavailable", extra={
+            "deployment_id": deployment_id, "error": str(error), "retry": retry
+        })
+    else:
+        logger.exception("GitHub trigger error", extra={"deployment_id": deployment_id})
+    return {"success": False, "error": str(error), "retry": retry, "unconfirmed": transient and not retry}
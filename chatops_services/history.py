@@ -0,0 +1,359 @@
+"""
+Keeps the live deployments table small.
+
+Closed months older than HISTORY_HOT_MONTHS are rolled up per day into
+deployment_daily_rollups and their raw rows moved to
+deployments_archive_YYYYMM - a monthly partition of deployments_archive on
+Postgres, a standalone archive table on SQLite. Archived months older than
+HISTORY_RETENTION_MONTHS lose their raw rows; the rollups are kept.
+
+    python -m chatops_services.history            # one maintenance pass
+    python -m chatops_services.history status     # list archived months
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime
+
+from sqlalchemy import column, func, insert, inspect, select, table, text
+
+from database import SessionLocal
+from models import Deployment, DeploymentArchive, DeploymentDailyRollup
+from chatops_services.deploy_states import IN_FLIGHT_STATUSES
+from chatops_services.response_cache import bump_version
+
+# Closed months kept in deployments besides the current one
+HISTORY_HOT_MONTHS          = int(os.environ.get("HISTORY_HOT_MONTHS", "1"))
+# Raw archived rows are dropped after this many months; 0 keeps them forever
+HISTORY_RETENTION_MONTHS    = int(os.environ.get("HISTORY_RETENTION_MONTHS", "12"))
+HISTORY_MAINTENANCE_SECONDS = float(os.environ.get("HISTORY_MAINTENANCE_SECONDS", "21600"))
+
+ARCHIVE_TABLE    = "deployments_archive"
+# Serialises maintenance across workers on Postgres
+ADVISORY_LOCK_ID = 724311
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_table_name(month: date) -> str:
+    return f"{ARCHIVE_TABLE}_{month:%Y%m}"
+
+
+def hot_since(now: datetime = None) -> date:
+    """First day still kept in the live deployments table."""
+    return add_months(month_start(now or datetime.utcnow()), -HISTORY_HOT_MONTHS)
+
+
+def archived_through(db):
+    """First day after the newest archived month, or None if nothing is archived."""
+    newest = db.query(func.max(DeploymentArchive.month)).scalar()
+    return add_months(newest, 1) if newest else None
+
+
+def _as_date(value) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date() if isinstance(value, str) else value
+
+
+def _duration_seconds(db):
+    """
+    SQL for started_at -> finished_at in seconds (NULL when either is
+    missing), or None on dialects without one.
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return func.extract("epoch", Deployment.finished_at - Deployment.started_at)
+    if dialect == "sqlite":
+        return (func.julianday(Deployment.finished_at) - func.julianday(Deployment.started_at)) * 86400.0
+    return None
+
+
+def _add_rollup(db, key: dict, count: int, duration_count: int = 0, duration_seconds: float = 0.0):
+    """Adds count and durations to one rollup row, creating it if needed."""
+    totals = {"count": count, "duration_count": duration_count, "duration_seconds": duration_seconds}
+    increments = {
+        name: getattr(DeploymentDailyRollup, name) + value for name, value in totals.items()
+    }
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(DeploymentDailyRollup).values(**key, **totals)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "repo_url", "environment", "status"],
+            set_=increments
+        )
+        db.execute(stmt)
+        return
+
+    updated = db.query(DeploymentDailyRollup).filter_by(**key).update(increments, synchronize_session=False)
+    if not updated:
+        db.add(DeploymentDailyRollup(**key, **totals))
+
+
+def _ensure_archive_table(db, month: date) -> str:
+    name = archive_table_name(month)
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {ARCHIVE_TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+    else:
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {name} AS SELECT * FROM deployments WHERE 0"))
+    return name
+
+
+def _try_lock(db) -> bool:
+    """Transaction-scoped lock so only one worker archives at a time."""
+    if db.bind.dialect.name != "postgresql":
+        return True
+    return bool(db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID}).scalar())
+
+
+def archive_month(db, month: date) -> int:
+    """
+    Rolls up and moves one month's finished deployments, in the caller's
+    transaction. Returns the number of rows moved.
+    """
+    end = add_months(month, 1)
+    in_month = (
+        Deployment.timestamp >= datetime.combine(month, datetime.min.time()),
+        Deployment.timestamp < datetime.combine(end, datetime.min.time()),
+        Deployment.status.notin_(IN_FLIGHT_STATUSES),
+    )
+
+    day = func.date(Deployment.timestamp)
+    duration = _duration_seconds(db)
+    durations = (func.count(duration), func.sum(duration)) if duration is not None else ()
+    buckets = db.query(day, Deployment.repo_url, Deployment.environment, Deployment.status,
+                       func.count(Deployment.id), *durations)\
+        .filter(*in_month)\
+        .group_by(day, Deployment.repo_url, Deployment.environment, Deployment.status)\
+        .all()
+    if not buckets:
+        return 0
+    for bucket_day, repo_url, environment, status, count, *timed in buckets:
+        duration_count, duration_seconds = timed or (0, 0.0)
+        _add_rollup(db, {
+            "day":         _as_date(bucket_day),
+            "repo_url":    repo_url,
+            "environment": environment or "dev",
+            "status":      status,
+        }, count, int(duration_count or 0), float(duration_seconds or 0.0))
+
+    # Copy by name; columns added to deployments after the archive table was made are left out
+    name = _ensure_archive_table(db, month)
+    archived_columns = {c["name"] for c in inspect(db.connection()).get_columns(name)}
+    columns = [c.name for c in Deployment.__table__.columns if c.name in archived_columns]
+    db.execute(
+        insert(table(name, *(column(c) for c in columns))).from_select(
+            columns, select(*(Deployment.__table__.c[c] for c in columns)).where(*in_month)
+        )
+    )
+    moved = db.query(Deployment).filter(*in_month).delete(synchronize_session=False)
+
+    record = db.get(DeploymentArchive, month)
+    if record is None:
+        db.add(DeploymentArchive(month=month, table_name=name, rows=moved, archived_at=datetime.utcnow()))
+    else:
+        record.rows += moved
+        record.archived_at = datetime.utcnow()
+    return moved
+
+
+def archive_old_months(db, now: datetime = None) -> dict:
+    """Archives every month before hot_since(), oldest first, one transaction each."""
+    cutoff = hot_since(now)
+    oldest = db.query(func.min(Deployment.timestamp))\
+        .filter(Deployment.timestamp < datetime.combine(cutoff, datetime.min.time()),
+                Deployment.status.notin_(IN_FLIGHT_STATUSES))\
+        .scalar()
+    db.rollback()
+
+    archived = {}
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        if not _try_lock(db):
+            db.rollback()
+            break
+        moved = archive_month(db, month)
+        if moved:
+            bump_version(db)
+            db.commit()
+            archived[month.isoformat()] = moved
+            logger.info("Archived deployments", extra={"month": month.isoformat(), "rows": moved})
+        else:
+            db.rollback()
+        month = add_months(month, 1)
+    return archived
+
+
+def purge_expired(db, now: datetime = None) -> list:
+    """Drops the raw rows of archived months past the retention period."""
+    if HISTORY_RETENTION_MONTHS <= 0:
+        return []
+    keep_from = add_months(month_start(now or datetime.utcnow()), -HISTORY_RETENTION_MONTHS)
+    expired = db.query(DeploymentArchive)\
+        .filter(DeploymentArchive.month < keep_from, DeploymentArchive.purged_at.is_(None))\
+        .order_by(DeploymentArchive.month)\
+        .all()
+
+    purged = []
+    for record in expired:
+        if not _try_lock(db):
+            break
+        # Dropping a partition is a metadata change on Postgres, no row-by-row delete
+        db.execute(text(f"DROP TABLE IF EXISTS {record.table_name}"))
+        record.purged_at = datetime.utcnow()
+        db.commit()
+        purged.append(record.month.isoformat())
+        logger.info("Purged archived deployments", extra={"month": record.month.isoformat(), "rows": record.rows})
+    db.rollback()
+    return purged
+
+
+def daily_history(db, since: date, until: date, environment: str = None, repo_url: str = None) -> list:
+    """
+    Deployments per day and status for [since, until), summed from the
+    rollups (archived rows) and the live table (everything else).
+    """
+    days = {}
+
+    def add(day, status, count, duration_count=0, duration_seconds=0.0):
+        entry = days.setdefault(_as_date(day), {"total": 0, "by_status": {}, "duration_count": 0, "duration_seconds": 0.0})
+        entry["by_status"][status] = entry["by_status"].get(status, 0) + count
+        entry["total"] += count
+        entry["duration_count"] += duration_count
+        entry["duration_seconds"] += duration_seconds
+
+    rollups = db.query(
+        DeploymentDailyRollup.day, DeploymentDailyRollup.status, func.sum(DeploymentDailyRollup.count),
+        func.sum(DeploymentDailyRollup.duration_count), func.sum(DeploymentDailyRollup.duration_seconds)
+    ).filter(DeploymentDailyRollup.day >= since, DeploymentDailyRollup.day < until)
+    if environment:
+        rollups = rollups.filter(DeploymentDailyRollup.environment == environment)
+    if repo_url:
+        rollups = rollups.filter(DeploymentDailyRollup.repo_url == repo_url)
+    for day, status, count, duration_count, duration_seconds in rollups.group_by(DeploymentDailyRollup.day, DeploymentDailyRollup.status):
+        add(day, status, int(count or 0), int(duration_count or 0), float(duration_seconds or 0.0))
+
+    # Only finished rows of archived months were moved, so the live table never double counts
+    day = func.date(Deployment.timestamp)
+    duration = _duration_seconds(db)
+    durations = (func.count(duration), func.sum(duration)) if duration is not None else ()
+    live = db.query(day, Deployment.status, func.count(Deployment.id), *durations).filter(
+        Deployment.timestamp >= datetime.combine(since, datetime.min.time()),
+        Deployment.timestamp < datetime.combine(until, datetime.min.time())
+    )
+    if environment:
+        live = live.filter(Deployment.environment == environment)
+    if repo_url:
+        live = live.filter(Deployment.repo_url == repo_url)
+    for bucket_day, status, count, *timed in live.group_by(day, Deployment.status):
+        duration_count, duration_seconds = timed or (0, 0.0)
+        add(bucket_day, status, count, int(duration_count or 0), float(duration_seconds or 0.0))
+
+    history = []
+    for day in sorted(days):
+        entry = days[day]
+        avg = entry["duration_seconds"] / entry["duration_count"] if entry["duration_count"] else None
+        history.append({
+            "day":         day.isoformat(),
+            "total":       entry["total"],
+            "by_status":   entry["by_status"],
+            "avg_seconds": round(avg, 1) if avg is not None else None,
+        })
+    return history
+
+
+class HistoryMaintainer:
+    """Periodically archives old months and applies the retention policy."""
+
+    def __init__(self, interval: float = HISTORY_MAINTENANCE_SECONDS):
+        self.interval = interval
+        self._lock    = threading.Lock()
+        self._thread  = None
+        self.last_run = None
+        self.archived = 0
+        self.purged   = 0
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="history-maintainer", daemon=True
+            )
+            self._thread.start()
+
+    def run_once(self) -> dict:
+        db = SessionLocal()
+        try:
+            archived = archive_old_months(db)
+            purged   = purge_expired(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.last_run  = datetime.utcnow()
+        self.archived += sum(archived.values())
+        self.purged   += len(purged)
+        return {"archived": archived, "purged": purged}
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("History maintenance error")
+            time.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "running":   self._thread is not None,
+            "last_run":  self.last_run.isoformat() if self.last_run else None,
+            "hot_since": hot_since().isoformat(),
+            "archived":  self.archived,
+            "purged":    self.purged,
+        }
+
+
+history_maintainer = HistoryMaintainer()
+
+
+def main(argv) -> int:
+    command = argv[1] if len(argv) > 1 else "run"
+    if command == "run":
+        result = history_maintainer.run_once()
+        print(f"Archived: {result['archived'] or 'nothing'}, purged: {result['purged'] or 'nothing'}")
+        return 0
+    if command == "status":
+        db = SessionLocal()
+        try:
+            records = db.query(DeploymentArchive).order_by(DeploymentArchive.month).all()
+            print(f"Live table holds deployments since {hot_since().isoformat()} (plus in-flight ones)")
+            for record in records:
+                state = f"purged {record.purged_at:%Y-%m-%d}" if record.purged_at else record.table_name
+                print(f"  {record.month:%Y-%m}: {record.rows} rows, {state}")
+        finally:
+            db.close()
+        return 0
+    print(f"Unknown command {command!r}; use run or status")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,408 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+from chatops_services.circuit_breaker import breakers
+
+try:
+    import httpx
+except ImportError:  # the async client falls back to threads over the sync one
+    httpx = None
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT    = float(os.environ.get("HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES     = int(os.environ.get("HTTP_MAX_RETRIES", "3"))
+HTTP_POOL_SIZE       = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+# One event loop holds many more calls in flight than a thread pool
+ASYNC_HTTP_POOL_SIZE = int(os.environ.get("ASYNC_HTTP_POOL_SIZE", "100"))
+
+# Start spreading calls out once a host reports fewer requests left than this
+RATE_LIMIT_LOW_WATER = int(os.environ.get("HTTP_RATE_LIMIT_LOW_WATER", "100"))
+MAX_PACING_DELAY     = 5.0
+
+RETRY_STATUSES   = {429, 500, 502, 503, 504}
+IDEMPOTENT_VERBS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Deadline (monotonic) set by latency_budget() for every call in the block
+_deadline = contextvars.ContextVar("http_deadline", default=None)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Refused without a network call: the host's circuit breaker is open."""
+
+    def __init__(self, breaker):
+        super().__init__(f"{breaker.name} is unavailable (circuit open)")
+        self.breaker  = breaker
+        self.retry_in = breaker.retry_in()
+
+
+class BudgetExceeded(requests.Timeout):
+    """The command's latency budget ran out before this call."""
+
+
+@contextmanager
+def latency_budget(seconds: float):
+    """
+    Caps the total time of all calls made inside the block, retries and
+    pacing included; a call that would start past it raises BudgetExceeded.
+    Nested budgets keep the tighter deadline.
+    """
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(min(deadline, outer) if outer else deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed call is worth retrying later (outage, timeout, open breaker)."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return httpx is not None and isinstance(error, httpx.TransportError)
+
+
+def never_sent(error: Exception) -> bool:
+    """
+    Whether a failed call provably never reached the server: refused by
+    the breaker or the budget, or no connection could be made. Only these
+    are safe to repeat for a non-idempotent POST.
+    """
+    if isinstance(error, (CircuitOpenError, BudgetExceeded, requests.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        reason = error.args[0] if error.args else None
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+        # NewConnectionError (refused, DNS) is a ConnectTimeoutError too
+        return isinstance(reason, ConnectTimeoutError)
+    return httpx is not None and isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def _call_deadline(budget):
+    """The earlier of the call's own budget and the enclosing latency_budget()."""
+    deadline = time.monotonic() + budget if budget else None
+    outer = _deadline.get()
+    if outer is None:
+        return deadline
+    if outer <= time.monotonic():
+        raise BudgetExceeded("latency budget exhausted")
+    return min(deadline, outer) if deadline else outer
+
+
+class HttpClient:
+    """
+    Shared keep-alive HTTP client for GitHub and Slack.
+
+    - one urllib3 connection pool per host, reused across calls
+    - connect/read timeouts on every call plus an optional total budget,
+      capped by any enclosing latency_budget()
+    - a circuit breaker per dependency that refuses calls while it is open
+    - jittered exponential retries on 429/5xx (5xx only for idempotent verbs)
+    - paces calls per host from X-RateLimit-* and Retry-After headers
+    """
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_retries: int = HTTP_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._session    = requests.Session()
+        self._adapter    = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+        self._lock       = threading.Lock()
+        self._hosts      = {}
+
+    # ── rate limit bookkeeping ───────────────────────────────
+    def _host_state(self, host: str) -> dict:
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = {
+                    "requests":       0,
+                    "retries":        0,
+                    "errors":         0,
+                    "remaining":      None,
+                    "reset_at":       None,
+                    "blocked_until":  0.0,
+                    "paced_seconds":  0.0,
+                }
+            return state
+
+    def _pace(self, state: dict):
+        """Sleeps before a call when the host asked us to back off."""
+        delay = self._pace_delay(state)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pace_delay(self, state: dict) -> float:
+        """Seconds to wait before the next call to the host (also counted as paced)."""
+        now = time.time()
+        delay = state["blocked_until"] - now
+
+        remaining, reset_at = state["remaining"], state["reset_at"]
+        if remaining is not None and reset_at and remaining < RATE_LIMIT_LOW_WATER:
+            # Spread what is left evenly over the rest of the window
+            delay = max(delay, (reset_at - now) / max(remaining, 1))
+
+        delay = min(delay, MAX_PACING_DELAY)
+        if delay > 0:
+            with self._lock:
+                state["paced_seconds"] += delay
+        return delay
+
+    def _record_limits(self, state: dict, response):
+        headers = response.headers
+        with self._lock:
+            if "X-RateLimit-Remaining" in headers:
+                try:
+                    state["remaining"] = int(headers["X-RateLimit-Remaining"])
+                    state["reset_at"]  = float(headers.get("X-RateLimit-Reset", 0)) or None
+                except ValueError:
+                    pass
+            retry_after = _retry_after_seconds(headers.get("Retry-After"))
+            if retry_after is not None:
+                state["blocked_until"] = time.time() + retry_after
+
+    # ── requests ─────────────────────────────────────────────
+    def request(self, method: str, url: str, timeout=None, budget: float = None,
+                retries: int = None, **kwargs):
+        """
+        Sends a request through the shared pool.
+        `timeout` is per attempt; `budget` caps the total time across retries.
+        """
+        method   = method.upper()
+        host     = urlsplit(url).netloc
+        state    = self._host_state(host)
+        breaker  = breakers.for_host(host)
+        retries  = self.max_retries if retries is None else retries
+        timeout  = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        deadline = _call_deadline(budget)
+
+        attempt = 0
+        while True:
+            # Checked before pacing so an open breaker fails fast
+            if not breaker.allow():
+                raise CircuitOpenError(breaker)
+            self._pace(state)
+            attempt_timeout = _clip_timeout(timeout, deadline)
+            with self._lock:
+                state["requests"] += 1
+            try:
+                response = self._session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                breaker.record(False)
+                with self._lock:
+                    state["errors"] += 1
+                if not self._should_retry(method, None, attempt, retries, deadline):
+                    raise
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.record(response.status_code < 500)
+                self._record_limits(state, response)
+                if not self._should_retry(method, response.status_code, attempt, retries, deadline):
+                    return response
+
+            attempt += 1
+            with self._lock:
+                state["retries"] += 1
+            self._backoff(attempt, deadline)
+
+    def _should_retry(self, method, status, attempt, retries, deadline) -> bool:
+        if attempt >= retries:
+            return False
+        if deadline and time.monotonic() >= deadline:
+            return False
+        if status is None:
+            return method in IDEMPOTENT_VERBS
+        if status == 429:
+            return True
+        return status in RETRY_STATUSES and method in IDEMPOTENT_VERBS
+
+    def _backoff(self, attempt: int, deadline):
+        time.sleep(_backoff_delay(attempt, deadline))
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    # ── stats ────────────────────────────────────────────────
+    def stats(self) -> dict:
+        """Per-host request, retry, rate-limit and connection reuse counters."""
+        pools = {}
+        manager = self._adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            reused = max(pool.num_requests - pool.num_connections, 0)
+            pools[f"{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests":           pool.num_requests,
+                "pool_hits":          reused,
+                "reuse_ratio":        round(reused / pool.num_requests, 4) if pool.num_requests else 0.0,
+            }
+
+        with self._lock:
+            hosts = {}
+            for host, state in self._hosts.items():
+                hosts[host] = {
+                    "requests":             state["requests"],
+                    "retries":              state["retries"],
+                    "errors":               state["errors"],
+                    "rate_limit_remaining": state["remaining"],
+                    "paced_seconds":        round(state["paced_seconds"], 3),
+                }
+        return {"hosts": hosts, "pools": pools}
+
+
+class AsyncHttpClient:
+    """
+    Coroutine counterpart of HttpClient for the ASGI mode.
+
+    Uses httpx's async pool when it is installed, otherwise runs the shared
+    sync client in a thread. Retries, budgets and per-host pacing follow
+    the sync client and share its rate-limit state, since both spend the
+    same token's quota.
+    """
+
+    def __init__(self, shared: HttpClient, pool_size: int = ASYNC_HTTP_POOL_SIZE):
+        self.shared    = shared
+        self.pool_size = pool_size
+        self._client   = None
+        self._loop     = None
+
+    @property
+    def backend(self) -> str:
+        return "httpx" if httpx is not None else "threads"
+
+    def _session(self):
+        # httpx pools are bound to the loop they were opened on
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=self.pool_size, max_keepalive_connections=self.pool_size
+            ))
+            self._loop = loop
+        return self._client
+
+    async def request(self, method: str, url: str, timeout=None, budget: float = None,
+                      retries: int = None, **kwargs):
+        """Same arguments and retry rules as HttpClient.request()."""
+        if httpx is None:
+            return await asyncio.to_thread(
+                self.shared.request, method, url, timeout=timeout, budget=budget, retries=retries, **kwargs
+            )
+
+        shared   = self.shared
+        method   = method.upper()
+        host     = urlsplit(url).netloc
+        state    = shared._host_state(host)
+        breaker  = breakers.for_host(host)
+        retries  = shared.max_retries if retries is None else retries
+        timeout  = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        deadline = _call_deadline(budget)
+        client   = self._session()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(breaker)
+            try:
+                delay = shared._pace_delay(state)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                attempt_timeout = _clip_timeout(timeout, deadline)
+                if isinstance(attempt_timeout, tuple):
+                    attempt_timeout = httpx.Timeout(attempt_timeout[1], connect=attempt_timeout[0])
+                with shared._lock:
+                    state["requests"] += 1
+                response = await client.request(method, url, timeout=attempt_timeout, **kwargs)
+            except httpx.TransportError:
+                breaker.record(False)
+                with shared._lock:
+                    state["errors"] += 1
+                if not shared._should_retry(method, None, attempt, retries, deadline):
+                    raise
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.record(response.status_code < 500)
+                shared._record_limits(state, response)
+                if not shared._should_retry(method, response.status_code, attempt, retries, deadline):
+                    return response
+
+            attempt += 1
+            with shared._lock:
+                state["retries"] += 1
+            await asyncio.sleep(_backoff_delay(attempt, deadline))
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        # Per-host counters are in the sync client's stats
+        return {"backend": self.backend, "pool_size": self.pool_size, "open": self._client is not None}
+
+
+def _backoff_delay(attempt: int, deadline) -> float:
+    # Full jitter; Retry-After (if any) is applied by the pacing on the next loop
+    delay = random.uniform(0, min(MAX_PACING_DELAY, 0.25 * 2 ** attempt))
+    if deadline:
+        delay = min(delay, max(deadline - time.monotonic(), 0))
+    return delay
+
+
+def _clip_timeout(timeout, deadline):
+    """Shrinks the read timeout so an attempt never outlives the budget."""
+    if not deadline:
+        return timeout
+    left = max(deadline - time.monotonic(), 0.1)
+    if isinstance(timeout, tuple):
+        return (min(timeout[0], left), min(timeout[1], left))
+    return min(timeout, left)
+
+
+def _retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+http_client = HttpClient()
+async_http_client = AsyncHttpClient(http_client)
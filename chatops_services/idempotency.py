@@ -0,0 +1,180 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DELIVERY_TTL_SECONDS = float(os.environ.get("DELIVERY_TTL_SECONDS", "86400"))
+DELIVERY_MAX_KEYS    = int(os.environ.get("DELIVERY_MAX_KEYS", "10000"))
+
+# Slack retries within minutes; keep replies a little longer than the signature window
+SLACK_SEEN_TTL_SECONDS = float(os.environ.get("SLACK_SEEN_TTL_SECONDS", "900"))
+SLACK_SEEN_MAX_KEYS    = int(os.environ.get("SLACK_SEEN_MAX_KEYS", "5000"))
+# SQLite file shared by the workers on this host; empty keeps the set per process
+SLACK_SEEN_STORE       = os.environ.get("SLACK_SEEN_STORE", "/tmp/chatops-slack-seen.db")
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStore:
+    """
+    Claim table in a SQLite file, so every worker process on the host sees
+    the same keys. The first INSERT for a key wins the claim.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, ttl: float, max_keys: int):
+        self.path     = path
+        self.ttl      = ttl
+        self.max_keys = max_keys
+        self._local   = threading.local()
+        self._claims  = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, seen_at REAL NOT NULL, value BLOB)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key: str):
+        """(True, None) for the first claim of key, else (False, stored value or None)."""
+        conn = self._conn()
+        now = time.time()
+        self._claims += 1
+        if self._claims % self.PRUNE_EVERY == 0:
+            self.prune(now)
+
+        # Expired claims don't count
+        conn.execute("DELETE FROM seen WHERE key = ? AND seen_at < ?", (key, now - self.ttl))
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO seen (key, seen_at) VALUES (?, ?)", (key, now)
+        ).rowcount
+        if inserted:
+            return True, None
+        row = conn.execute("SELECT value FROM seen WHERE key = ?", (key,)).fetchone()
+        return False, row[0] if row else None
+
+    def put(self, key: str, value: bytes):
+        self._conn().execute("UPDATE seen SET value = ? WHERE key = ?", (value, key))
+
+    def release(self, key: str):
+        self._conn().execute("DELETE FROM seen WHERE key = ?", (key,))
+
+    def prune(self, now: float = None):
+        conn = self._conn()
+        conn.execute("DELETE FROM seen WHERE seen_at < ?", ((now or time.time()) - self.ttl,))
+        conn.execute(
+            "DELETE FROM seen WHERE key IN (SELECT key FROM seen ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_keys,)
+        )
+
+
+class SeenSet:
+    """
+    Bounded, time-expiring set of keys that have already been processed.
+    With a store, claim()/remember() go through it so several processes
+    share the set; the in-memory copy just answers repeats locally.
+    """
+
+    def __init__(self, ttl: float = DELIVERY_TTL_SECONDS, max_keys: int = DELIVERY_MAX_KEYS, store: LocalStore = None):
+        self.ttl        = ttl
+        self.max_keys   = max_keys
+        self.store      = store
+        self._keys      = OrderedDict()   # key -> (seen_at, value)
+        self._lock      = threading.Lock()
+        self.duplicates = 0
+        self.store_errors = 0
+
+    def __contains__(self, key) -> bool:
+        return self._get(key) is not None
+
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                del self._keys[key]
+                return None
+            self.duplicates += 1
+            return entry
+
+    def add(self, key, value=None):
+        with self._lock:
+            self._keys[key] = (time.monotonic(), value)
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+    def claim(self, key):
+        """
+        Atomically marks key as seen. Returns (True, None) to the first
+        caller and (False, value) to repeats, value being whatever was
+        remember()ed for the key (None while the first caller is still busy).
+        """
+        entry = self._get(key)
+        if entry is not None:
+            return False, entry[1]
+        if self.store is not None:
+            try:
+                claimed, value = self.store.claim(key)
+            except sqlite3.Error:
+                # Fall back to this process only rather than failing the request
+                self.store_errors += 1
+                logger.warning("Seen-set store unavailable", exc_info=True)
+                claimed, value = True, None
+            if not claimed:
+                with self._lock:
+                    self.duplicates += 1
+                if value is not None:
+                    self.add(key, value)
+                return False, value
+        self.add(key)
+        return True, None
+
+    def remember(self, key, value):
+        """Stores the result of processing key, for claim() to hand to repeats."""
+        self.add(key, value)
+        if self.store is not None:
+            try:
+                self.store.put(key, value)
+            except sqlite3.Error:
+                self.store_errors += 1
+
+    def forget(self, key):
+        """Drops key so a retry is processed again (e.g. after a failure)."""
+        with self._lock:
+            self._keys.pop(key, None)
+        if self.store is not None:
+            try:
+                self.store.release(key)
+            except sqlite3.Error:
+                self.store_errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "keys":         len(self._keys),
+            "duplicates":   self.duplicates,
+            "shared":       self.store.path if self.store else None,
+            "store_errors": self.store_errors,
+        }
+
+    def __len__(self):
+        return len(self._keys)
+
+
+webhook_deliveries = SeenSet()
+slack_requests = SeenSet(
+    ttl=SLACK_SEEN_TTL_SECONDS,
+    max_keys=SLACK_SEEN_MAX_KEYS,
+    store=LocalStore(SLACK_SEEN_STORE, SLACK_SEEN_TTL_SECONDS, SLACK_SEEN_MAX_KEYS) if SLACK_SEEN_STORE else None
+)
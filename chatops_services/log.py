@@ -0,0 +1,169 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL          = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Per-logger overrides, e.g. "chatops_services.github_service=DEBUG,sqlalchemy.engine=WARNING"
+LOG_LEVELS         = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT         = os.environ.get("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE     = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Fraction of DEBUG lines kept; a call can pass extra={"sample_rate": ...} instead
+LOG_DEBUG_SAMPLE   = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "sample_rate"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def bind_request_id(request_id: str = None) -> str:
+    """Sets the request id for this context; copied into deploy pool jobs."""
+    request_id = request_id or new_request_id()
+    request_id_var.set(request_id)
+    return request_id
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Drops a share of DEBUG records before they are queued."""
+
+    def __init__(self, rate: float = LOG_DEBUG_SAMPLE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts":         datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level":      record.levelname,
+            "logger":     record.name,
+            "msg":        record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread":     record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the writer falls behind, records are dropped and counted."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Keep the structured fields; only resolve the message and traceback here
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state = {"handler": None, "listener": None, "pid": None}
+_state_lock = threading.Lock()
+
+
+def _parse_levels(raw: str) -> dict:
+    levels = {}
+    for item in raw.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener():
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+    )
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    listener = QueueListener(_state["handler"].queue, stream, respect_handler_level=False)
+    listener.start()
+    _state["listener"] = listener
+    _state["pid"] = os.getpid()
+
+
+def configure_logging():
+    """
+    Routes every logger through one bounded queue drained by a single
+    writer thread, so request threads only format and enqueue. Safe to
+    call more than once.
+    """
+    with _state_lock:
+        if _state["handler"] is not None:
+            return
+        handler = _NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(LOG_LEVEL)
+        for name, level in _parse_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _state["handler"] = handler
+        _start_listener()
+
+
+def _restart_after_fork():
+    # The writer thread doesn't survive a gunicorn fork; give each worker its own
+    if _state["handler"] is not None and _state["pid"] != os.getpid():
+        _state["handler"].queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _start_listener()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def log_stats() -> dict:
+    handler = _state["handler"]
+    if handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queued":     handler.queue.qsize(),
+        "dropped":    handler.dropped,
+    }
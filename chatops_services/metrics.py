@@ -0,0 +1,338 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from itertools import count
+
+# Set to a shared directory to aggregate metrics across gunicorn workers
+METRICS_DIR           = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REGISTRY = []
+
+logger = logging.getLogger(__name__)
+
+
+class _ShardOwner:
+    """Held in a thread's local storage; collected when the thread exits."""
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard: list):
+        self.shard = shard
+
+
+class _Child:
+    """
+    One labelled series. Every thread writes to its own shard, so
+    observations never take a lock; shards are summed at scrape time.
+    A shard is folded into `retired` when its thread exits, so short-lived
+    threads (per-request servers, per-job pools) don't pile up.
+    """
+
+    def __init__(self, width: int):
+        self._width   = width
+        self._local   = threading.local()
+        self._shards  = {}
+        self._retired = [0] * width
+        self._ids     = count()
+        self._lock    = threading.Lock()
+
+    def _shard(self) -> list:
+        try:
+            return self._local.owner.shard
+        except AttributeError:
+            shard = [0] * self._width
+            shard_id = next(self._ids)
+            with self._lock:
+                self._shards[shard_id] = shard
+            owner = self._local.owner = _ShardOwner(shard)
+            weakref.finalize(owner, self._retire, shard_id)
+            return shard
+
+    def _retire(self, shard_id: int):
+        with self._lock:
+            shard = self._shards.pop(shard_id, None)
+            if shard is not None:
+                for i, value in enumerate(shard):
+                    self._retired[i] += value
+
+    def values(self) -> list:
+        with self._lock:
+            totals = list(self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self._children     = {}
+        self._lock         = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Returns the series for these label values; cache it for hot paths."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            children = list(self._children.items())
+        return {
+            "type":    self.kind,
+            "help":    self.documentation,
+            "labels":  list(self.labelnames),
+            "extra":   self._extra(),
+            "samples": {json.dumps(list(key)): child.values() for key, child in children},
+        }
+
+    def _extra(self):
+        return None
+
+
+class _CounterChild(_Child):
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild(1)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _HistogramChild(_Child):
+    def __init__(self, bounds):
+        # One slot per bucket, one for +Inf, then the running sum
+        super().__init__(len(bounds) + 2)
+        self._bounds = bounds
+
+    def observe(self, value: float):
+        shard = self._shard()
+        shard[bisect_left(self._bounds, value)] += 1
+        shard[-1] += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _extra(self):
+        return list(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+# ── cross-worker aggregation ─────────────────────────────────
+class _Flusher:
+    """Writes this worker's snapshot to METRICS_DIR every few seconds."""
+
+    def __init__(self):
+        self._pid  = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if not METRICS_DIR or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            threading.Thread(target=self._run, name="metrics-flusher", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                write_snapshot()
+                prune_snapshots()
+            except Exception:
+                logger.exception("Metrics flush error")
+            time.sleep(METRICS_FLUSH_SECONDS)
+
+
+metrics_flusher = _Flusher()
+
+
+def local_snapshot() -> dict:
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def write_snapshot():
+    path = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(local_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def prune_snapshots() -> list:
+    """Deletes the snapshots of workers that have exited; returns their pids."""
+    removed = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        try:
+            pid = int(os.path.basename(path)[len("metrics-"):-len(".json")])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _pid_alive(pid):
+            try:
+                os.remove(path)
+                removed.append(pid)
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def _merge(into: dict, snapshot: dict):
+    for name, metric in snapshot.items():
+        target = into.setdefault(name, {**metric, "samples": {}})
+        for key, values in metric["samples"].items():
+            current = target["samples"].get(key)
+            target["samples"][key] = values if current is None else [a + b for a, b in zip(current, values)]
+
+
+def collect() -> dict:
+    """
+    This worker's live values plus the last snapshot of every other worker.
+    Exited workers' files are pruned by the flusher, so their counts drop
+    out like any restarted process's (Prometheus treats it as a reset).
+    """
+    merged = {}
+    _merge(merged, local_snapshot())
+    if METRICS_DIR:
+        own = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+        for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    _merge(merged, json.load(f))
+            except (OSError, ValueError):
+                continue
+    return merged
+
+
+# ── exposition ───────────────────────────────────────────────
+def _label_text(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        f'{k}="' + str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for k, v in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def render(merged: dict, gauges=()) -> str:
+    """
+    Prometheus text format (0.0.4). gauges is an iterable of
+    (name, help, labelnames, [(labelvalues, value), ...]) computed at scrape.
+    """
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labels = metric["labels"]
+        for key, values in sorted(metric["samples"].items()):
+            label_values = json.loads(key)
+            if metric["type"] == "counter":
+                lines.append(f"{name}{_label_text(labels, label_values)} {values[0]}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["extra"] + ["+Inf"], values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(labels, label_values, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels, label_values)} {values[-1]}")
+            lines.append(f"{name}_count{_label_text(labels, label_values)} {cumulative}")
+
+    for name, documentation, labelnames, samples in gauges:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for label_values, value in samples:
+            lines.append(f"{name}{_label_text(labelnames, label_values)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def instrument_engine(engine):
+    """Times every statement, labelled with the Flask endpoint that ran it."""
+    from flask import has_request_context, request
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is None:
+            return
+        endpoint = (request.endpoint or "unknown") if has_request_context() else "background"
+        DB_QUERY_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+
+
+# ── application metrics ──────────────────────────────────────
+HTTP_REQUEST_SECONDS = Histogram(
+    "chatops_http_request_seconds", "HTTP request handling time by endpoint, incl. /webhook/github",
+    ["endpoint", "status"]
+)
+SLACK_COMMAND_SECONDS = Histogram(
+    "chatops_slack_command_seconds", "Slack slash command handling time", ["command"]
+)
+GITHUB_STEP_SECONDS = Histogram(
+    "chatops_github_trigger_step_seconds", "trigger_github_deployment time by step", ["step"]
+)
+GITHUB_TRIGGERS = Counter(
+    "chatops_github_triggers_total", "GitHub deployment triggers by result", ["result"]
+)
+SLACK_NOTIFY_SECONDS = Histogram(
+    "chatops_slack_notify_seconds", "chat.postMessage latency"
+)
+SLACK_NOTIFY_RESULTS = Counter(
+    "chatops_slack_notify_total", "chat.postMessage calls by result", ["result"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "chatops_db_query_seconds", "Database statement time by endpoint", ["endpoint"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+from database import SessionLocal
+from models import NotificationOutbox, SlackChannelSlot
+from chatops_services.http_client import CircuitOpenError
+from chatops_services.slack_service import build_deployment_message, send_slack_message, slack_breaker
+
+OUTBOX_BATCH_SIZE    = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SECONDS  = float(os.environ.get("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_MAX_ATTEMPTS  = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_LEASE_SECONDS = 60
+
+# chat.postMessage allows roughly one message per second per channel
+SLACK_CHANNEL_RATE   = float(os.environ.get("SLACK_CHANNEL_RATE", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_notification(db, deployment, status: str, environment: str, run_url: str, note: str = None):
+    """
+    Adds a Slack notification to the outbox using the caller's session,
+    so it commits (or rolls back) together with the status update.
+    """
+    payload = build_deployment_message(deployment, status, environment, run_url, note)
+    row = NotificationOutbox(
+        deployment_id=deployment.id,
+        channel=payload["channel"],
+        payload=json.dumps(payload),
+        status="PENDING",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+        created_at=datetime.utcnow()
+    )
+    db.add(row)
+    return row
+
+
+def _slot_row(db, channel: str, now: datetime):
+    """Creates the channel's slot row, free from now, unless it exists."""
+    if db.query(SlackChannelSlot.channel).filter_by(channel=channel).first() is not None:
+        return
+    values = {"channel": channel, "next_send_at": now}
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        # Another worker may be creating the same row
+        db.execute(upsert(SlackChannelSlot).values(**values).on_conflict_do_nothing(index_elements=["channel"]))
+    else:
+        db.add(SlackChannelSlot(**values))
+        db.flush()
+
+
+def _backoff_seconds(attempts: int) -> float:
+    return min(2 ** attempts, 300) + random.uniform(0, 1)
+
+
+class OutboxDispatcher:
+    """
+    Background thread that drains the notification outbox in batches.
+    Rows are claimed with a conditional UPDATE so several gunicorn
+    workers can run a dispatcher against the same table safely; send
+    slots per channel are claimed the same way in slack_channel_slots, so
+    together they stay within Slack's per-channel rate.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self.batch_size    = batch_size
+        self.poll_seconds  = poll_seconds
+        self._wakeup       = threading.Event()
+        self._lock         = threading.Lock()
+        self._thread       = None
+        self._deferred_for = None  # shortest channel wait seen in the last batch
+        self._delivered    = 0
+        self._retried      = 0
+        self._failed       = 0
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="outbox-dispatcher", daemon=True
+            )
+            self._thread.start()
+
+    def wake(self):
+        """Asks the dispatcher to drain now instead of at the next poll."""
+        self.ensure_started()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                sent = self.drain_once()
+            except Exception:
+                logger.exception("Outbox dispatcher error")
+                sent = 0
+            # A full batch probably means more is waiting; rows deferred for a
+            # busy channel come due sooner than the regular poll
+            if sent < self.batch_size:
+                self._wakeup.wait(min(self.poll_seconds, self._deferred_for or self.poll_seconds))
+                self._wakeup.clear()
+
+    def _claim(self, db, row_id: int, due_before: datetime) -> bool:
+        lease = datetime.utcnow() + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        claimed = db.query(NotificationOutbox).filter(
+            NotificationOutbox.id == row_id,
+            NotificationOutbox.status == "PENDING",
+            NotificationOutbox.next_attempt_at <= due_before
+        ).update({"next_attempt_at": lease}, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+
+    def _channel_delay(self, db, channel: str) -> float:
+        """
+        Seconds until `channel` may be posted to again under Slack's
+        per-channel rate. Reserves the slot, for every worker, when it is
+        free. Commits.
+        """
+        interval = 1.0 / SLACK_CHANNEL_RATE if SLACK_CHANNEL_RATE > 0 else 0
+        now = datetime.utcnow()
+        _slot_row(db, channel, now)
+        claimed = db.query(SlackChannelSlot).filter(
+            SlackChannelSlot.channel == channel,
+            SlackChannelSlot.next_send_at <= now
+        ).update({"next_send_at": now + timedelta(seconds=interval)}, synchronize_session=False)
+        if claimed == 1:
+            db.commit()
+            return 0.0
+        slot = db.query(SlackChannelSlot.next_send_at).filter_by(channel=channel).scalar()
+        db.commit()
+        return max((slot - now).total_seconds(), 0.001)
+
+    def _hold_channel(self, db, channel: str, seconds: float):
+        """Pushes the channel's next slot out to at least `seconds` from now, in the caller's transaction."""
+        until = datetime.utcnow() + timedelta(seconds=seconds)
+        db.query(SlackChannelSlot).filter(
+            SlackChannelSlot.channel == channel,
+            SlackChannelSlot.next_send_at < until
+        ).update({"next_send_at": until}, synchronize_session=False)
+
+    def drain_once(self) -> int:
+        """Sends one batch of due notifications. Returns rows processed."""
+        if not slack_breaker.available():
+            # Slack is down: leave the rows alone instead of burning their attempts
+            self._deferred_for = slack_breaker.retry_in() or None
+            return 0
+
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            due = db.query(NotificationOutbox.id)\
+                .filter(
+                    NotificationOutbox.status == "PENDING",
+                    NotificationOutbox.next_attempt_at <= now
+                )\
+                .order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)\
+                .limit(self.batch_size)\
+                .all()
+
+            processed = 0
+            self._deferred_for = None
+            for (row_id,) in due:
+                if not self._claim(db, row_id, now):
+                    continue
+                row = db.get(NotificationOutbox, row_id)
+                delay = self._channel_delay(db, row.channel)
+                if delay > 0:
+                    # Channel is busy: put the row back rather than stall other channels
+                    row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                    db.commit()
+                    self._deferred_for = min(delay, self._deferred_for or delay)
+                    continue
+                try:
+                    result = send_slack_message(json.loads(row.payload), retries=0)
+                except CircuitOpenError as e:
+                    # Tripped mid-batch; waits like a rate limit, not a failed attempt
+                    result = {"ok": False, "error": str(e), "retry_after": max(e.retry_in, 1.0)}
+                except Exception as e:
+                    result = {"ok": False, "error": str(e), "retry_after": None}
+                self._record(db, row, result)
+                db.commit()
+                processed += 1
+            return processed
+        finally:
+            db.close()
+
+    def _record(self, db, row, result: dict):
+        if result["ok"]:
+            row.attempts     = (row.attempts or 0) + 1
+            row.status       = "DELIVERED"
+            row.delivered_at = datetime.utcnow()
+            row.last_error   = None
+            self._delivered += 1
+            return
+
+        row.last_error = result["error"]
+        self._retried += 1
+
+        if result.get("retry_after"):
+            # Rate limited: Slack told us how long this channel must wait,
+            # and it doesn't count as a failed attempt
+            delay = result["retry_after"]
+            self._hold_channel(db, row.channel, delay)
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            return
+
+        row.attempts = (row.attempts or 0) + 1
+        if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+            row.status = "FAILED"
+            self._failed += 1
+            logger.error("Outbox giving up on notification", extra={
+                "notification_id": row.id, "deployment_id": row.deployment_id, "error": result["error"]
+            })
+        else:
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=_backoff_seconds(row.attempts))
+
+    def stats(self) -> dict:
+        db = SessionLocal()
+        try:
+            pending = db.query(NotificationOutbox)\
+                .filter(NotificationOutbox.status == "PENDING")\
+                .count()
+        except Exception:
+            pending = None
+        finally:
+            db.close()
+        return {
+            "running":   self._thread is not None,
+            "pending":   pending,
+            "delivered": self._delivered,
+            "retried":   self._retried,
+            "failed":    self._failed,
+        }
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from database import SessionLocal
+from models import DeploymentVersion
+from chatops_services.events import event_bus
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RESPONSE_CACHE_SIZE  = int(os.environ.get("RESPONSE_CACHE_SIZE", "256"))
+# How long a worker trusts its last read of the version row. Local writes
+# and events from other workers invalidate it immediately.
+VERSION_MEMO_SECONDS = float(os.environ.get("VERSION_MEMO_SECONDS", "1"))
+MIN_COMPRESS_BYTES   = 512
+
+
+def bump_version(db):
+    """Bumps the deployments version in the caller's transaction."""
+    updated = db.query(DeploymentVersion).filter(DeploymentVersion.id == 1).update(
+        {"version": DeploymentVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.add(DeploymentVersion(id=1, version=1))
+    _version_memo["checked_at"] = 0.0
+
+
+_version_memo = {"version": None, "checked_at": 0.0}
+
+
+def _forget_version(event):
+    _version_memo["checked_at"] = 0.0
+
+
+event_bus.add_listener(_forget_version)
+
+
+def current_version(db=None) -> int:
+    """
+    Returns the deployments version, reading the DB at most once per memo
+    window. Pass the request's session to avoid a second pool checkout.
+    """
+    if time.monotonic() - _version_memo["checked_at"] < VERSION_MEMO_SECONDS:
+        return _version_memo["version"]
+
+    session = db or SessionLocal()
+    try:
+        row = session.get(DeploymentVersion, 1)
+        version = row.version if row else 0
+    finally:
+        if db is None:
+            session.close()
+    _version_memo["version"] = version
+    _version_memo["checked_at"] = time.monotonic()
+    return version
+
+
+class ResponseCache:
+    """
+    LRU of serialized JSON bodies keyed by (endpoint, version, params).
+    Compressed variants are produced once per entry and reused.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self.max_size     = max_size
+        self._entries     = OrderedDict()
+        self._lock        = threading.Lock()
+        self.hits         = 0
+        self.misses       = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def put(self, key, body: bytes) -> dict:
+        entry = {"identity": body}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries":      len(self._entries),
+                "hits":         self.hits,
+                "misses":       self.misses,
+                "not_modified": self.not_modified,
+            }
+
+
+response_cache = ResponseCache()
+
+
+def make_etag(endpoint: str, version: int, params) -> str:
+    digest = hashlib.sha1(repr((endpoint, params)).encode()).hexdigest()[:12]
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+def encode_body(entry: dict, accept_encoding: str):
+    """Picks br/gzip/identity for the client, compressing lazily into the entry."""
+    body = entry["identity"]
+    if len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+
+    accept_encoding = accept_encoding or ""
+    if brotli is not None and "br" in accept_encoding:
+        if "br" not in entry:
+            entry["br"] = brotli.compress(body, quality=5)
+        return entry["br"], "br"
+    if "gzip" in accept_encoding:
+        if "gzip" not in entry:
+            entry["gzip"] = gzip.compress(body, compresslevel=6)
+        return entry["gzip"], "gzip"
+    return body, None
+
+
+def _json_default(value):
+    # Same output as orjson for the naive UTC datetimes we store
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def serialize(payload) -> bytes:
+    """Compact JSON; datetimes become ISO-8601. Uses orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), default=_json_default).encode()
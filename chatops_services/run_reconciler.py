@@ -0,0 +1,352 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+
+from database import SessionLocal, get_engine
+from models import Deployment
+from chatops_services.github_service import WORKFLOW_NAME, github_breaker, list_dispatch_runs, parse_repo
+from chatops_services.http_client import is_transient
+from chatops_services.deploy_states import ACTIVE_STATUSES, transition_many
+from chatops_services.deployment_stats import record_status_change
+from chatops_services.durations import record_duration
+from chatops_services.outbox import enqueue_notification, outbox_dispatcher
+from chatops_services.events import publish_deployment
+from chatops_services.response_cache import bump_version
+from chatops_services.deploy_scheduler import promote_next, promote_orphans, retry_queued, retry_wakeup, start_promoted
+
+# A DEPLOYING row older than this is checked against GitHub's runs API
+RECONCILE_STUCK_SECONDS = float(os.environ.get("RECONCILE_STUCK_SECONDS", "900"))
+RECONCILE_MIN_SECONDS   = float(os.environ.get("RECONCILE_MIN_SECONDS", "30"))
+RECONCILE_IDLE_SECONDS  = float(os.environ.get("RECONCILE_IDLE_SECONDS", "300"))
+# With no matching run after this long the deployment is marked FAILED
+RECONCILE_GIVE_UP_HOURS = float(os.environ.get("RECONCILE_GIVE_UP_HOURS", "24"))
+RECONCILE_BATCH_SIZE    = int(os.environ.get("RECONCILE_BATCH_SIZE", "500"))
+# A TRIGGER_UNCONFIRMED row with no run after this long becomes TRIGGER_FAILED
+RECONCILE_UNCONFIRMED_MINUTES = float(os.environ.get("RECONCILE_UNCONFIRMED_MINUTES", "60"))
+
+RUN_TITLE  = re.compile(r"^ChatOps deploy (\d+)\b")
+CLOCK_SKEW = timedelta(seconds=60)
+NOTES = {
+    "TRIGGER_FAILED": "No GitHub run showed up for this dispatch, so it never started. Run `/deploy` again.",
+}
+# One pass at a time across workers on Postgres
+ADVISORY_LOCK_ID = 724313
+
+logger = logging.getLogger(__name__)
+
+
+def _created_at(run: dict) -> datetime:
+    return datetime.strptime(run["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+
+
+def _finished_at(run: dict, now: datetime) -> datetime:
+    """When a completed run last changed, i.e. finished; now if GitHub didn't say."""
+    if not run.get("updated_at"):
+        return now
+    return datetime.strptime(run["updated_at"], "%Y-%m-%dT%H:%M:%SZ")
+
+
+def _started(deployment) -> datetime:
+    """When the row last went DEPLOYING; queued or retried rows start long after they were requested."""
+    return deployment.started_at or deployment.timestamp
+
+
+# _started() in SQL; rows from before started_at existed fall back to the request time
+STARTED = func.coalesce(Deployment.started_at, Deployment.timestamp)
+
+
+def run_outcome(run: dict):
+    """SUCCESS/FAILED for a finished run, None while it is still going."""
+    if run.get("status") != "completed":
+        return None
+    return "SUCCESS" if run.get("conclusion") == "success" else "FAILED"
+
+
+def match_runs(deployments: list, runs: list) -> dict:
+    """
+    Pairs deployments with their workflow runs by the deployment id in the
+    run title. Workflows created before the title existed fall back to the
+    oldest unclaimed run created after the dispatch - for DEPLOYING rows
+    only, as a TRIGGER_UNCONFIRMED one most likely has no run at all.
+    """
+    titled, untitled = {}, []
+    for run in runs:
+        if run.get("name") != WORKFLOW_NAME:
+            continue
+        match = RUN_TITLE.match(run.get("display_title") or "")
+        if match:
+            titled[int(match.group(1))] = run
+        else:
+            untitled.append(run)
+    untitled.sort(key=_created_at)
+
+    matched, claimed = {}, set()
+    for deployment in sorted(deployments, key=_started):
+        run = titled.get(deployment.id)
+        if run is None and deployment.status == "DEPLOYING":
+            for candidate in untitled:
+                if candidate["id"] not in claimed and _created_at(candidate) >= _started(deployment) - CLOCK_SKEW:
+                    run = candidate
+                    claimed.add(candidate["id"])
+                    break
+        if run is not None:
+            matched[deployment.id] = run
+    return matched
+
+
+@contextmanager
+def _pass_lock():
+    """
+    Yields whether this worker may run a pass. A pass commits several
+    times, so the lock is session-level, held on its own connection until
+    the pass ends.
+    """
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect() as conn:
+        acquired = bool(conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID}).scalar())
+        conn.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+                conn.commit()
+
+
+class RunReconciler:
+    """
+    Settles deployments whose workflow callback never arrived.
+
+    Stuck rows are grouped by repo and each repo's recent runs are fetched
+    once per pass, revalidated with the previous ETag. Finished runs move
+    their rows to SUCCESS/FAILED in bulk; running ones just get a run_url.
+    TRIGGER_UNCONFIRMED rows are checked the same way, since GitHub may
+    have accepted a dispatch whose response we never got, until
+    RECONCILE_UNCONFIRMED_MINUTES pass without a run.
+    Each pass also re-triggers RETRY_QUEUED rows once GitHub's breaker
+    allows it. The next pass is sooner the more deployments are in flight,
+    and at most RECONCILE_MIN_SECONDS away while any are waiting to retry.
+    Every worker runs one, but a pass is skipped while another worker's
+    is in progress.
+    """
+
+    def __init__(self):
+        self._lock        = threading.Lock()
+        self._thread      = None
+        self._runs        = {}    # owner/repo -> (etag, runs)
+        self.interval     = RECONCILE_IDLE_SECONDS
+        self.last_run     = None
+        self.in_flight    = 0
+        self.api_calls    = 0
+        self.not_modified = 0
+        self.resolved     = 0
+        self.gave_up      = 0
+        self.retrying     = 0
+        self.skipped      = 0
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None or RECONCILE_STUCK_SECONDS <= 0:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="run-reconciler", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.interval = self.reconcile_once()
+            except Exception:
+                logger.exception("Run reconcile error")
+                self.interval = RECONCILE_IDLE_SECONDS
+            # A new RETRY_QUEUED or TRIGGER_UNCONFIRMED row cuts the wait short, but passes stay RECONCILE_MIN_SECONDS apart
+            retry_wakeup.wait(self.interval)
+            retry_wakeup.clear()
+            time.sleep(max(started + RECONCILE_MIN_SECONDS - time.monotonic(), 0))
+
+    def reconcile_once(self) -> float:
+        """One pass; returns the number of seconds until the next one."""
+        with _pass_lock() as acquired:
+            if not acquired:
+                self.skipped += 1
+                return RECONCILE_IDLE_SECONDS
+            return self._reconcile()
+
+    def _reconcile(self) -> float:
+        now = datetime.utcnow()
+        stuck_before = now - timedelta(seconds=RECONCILE_STUCK_SECONDS)
+        db = SessionLocal()
+        try:
+            in_flight, oldest = db.query(func.count(Deployment.id), func.min(STARTED))\
+                .filter(Deployment.status == "DEPLOYING")\
+                .one()
+            stuck = db.query(Deployment)\
+                .filter(Deployment.status == "DEPLOYING", STARTED <= stuck_before)\
+                .order_by(Deployment.id)\
+                .limit(RECONCILE_BATCH_SIZE)\
+                .all()
+            unconfirmed = db.query(Deployment)\
+                .filter(Deployment.status == "TRIGGER_UNCONFIRMED")\
+                .order_by(Deployment.id)\
+                .limit(RECONCILE_BATCH_SIZE)\
+                .all()
+            if stuck or unconfirmed:
+                self._settle(db, stuck + unconfirmed, now)
+            promote_orphans(db)
+            retry_queued(db)
+            retrying = db.query(func.count(Deployment.id))\
+                .filter(Deployment.status == "RETRY_QUEUED")\
+                .scalar()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.in_flight = in_flight
+        self.retrying  = retrying
+        self.last_run  = now
+        if stuck or unconfirmed:
+            interval = RECONCILE_IDLE_SECONDS / (1 + in_flight + len(unconfirmed))
+        elif oldest is not None:
+            # Nothing stuck yet - come back when the oldest in-flight one would be
+            interval = (oldest - stuck_before).total_seconds()
+        else:
+            interval = RECONCILE_IDLE_SECONDS
+        if retrying:
+            interval = min(interval, max(github_breaker.retry_in(), RECONCILE_MIN_SECONDS))
+        return min(max(interval, RECONCILE_MIN_SECONDS), RECONCILE_IDLE_SECONDS)
+
+    def _runs_for(self, repo_url: str, seen: dict):
+        try:
+            owner, repo = parse_repo(repo_url)
+        except IndexError:
+            return None
+        key = f"{owner}/{repo}"
+        etag, runs = self._runs.get(key, (None, None))
+
+        try:
+            result = list_dispatch_runs(owner, repo, etag)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            # Breaker open or GitHub down; these rows are checked again next pass
+            logger.warning("Could not list runs", extra={"repo": key, "error": str(e)})
+            return None
+        self.api_calls += 1
+        if not result["success"]:
+            logger.warning("Could not list runs", extra={"repo": key, "error": result["error"]})
+            return None
+        if result["not_modified"]:
+            self.not_modified += 1
+        else:
+            etag, runs = result["etag"], result["runs"]
+        seen[key] = (etag, runs)
+        return runs
+
+    def _settle(self, db, stuck: list, now: datetime):
+        by_repo = {}
+        for deployment in stuck:
+            by_repo.setdefault(deployment.repo_url, []).append(deployment)
+
+        finished = {"SUCCESS": {}, "FAILED": {}, "TRIGGER_FAILED": {}}
+        # Set like the webhook does, so settled runs count towards durations
+        times    = {"started_at": {}, "finished_at": {}}
+        running  = {}
+        seen     = {}
+        listed   = set()
+        by_id    = {deployment.id: deployment for deployment in stuck}
+        for repo_url, deployments in by_repo.items():
+            runs = self._runs_for(repo_url, seen)
+            if runs is None:
+                continue
+            listed.add(repo_url)
+            for deployment_id, run in match_runs(deployments, runs).items():
+                outcome = run_outcome(run)
+                if outcome:
+                    finished[outcome][deployment_id] = run["html_url"]
+                    times["started_at"][deployment_id]  = _started(by_id[deployment_id])
+                    times["finished_at"][deployment_id] = _finished_at(run, now)
+                else:
+                    running[deployment_id] = run["html_url"]
+        # Only keep ETags for repos that still have stuck deployments
+        self._runs = seen
+
+        give_up_before     = now - timedelta(hours=RECONCILE_GIVE_UP_HOURS)
+        unconfirmed_before = now - timedelta(minutes=RECONCILE_UNCONFIRMED_MINUTES)
+        for deployment in stuck:
+            matched = deployment.id in running or any(deployment.id in ids for ids in finished.values())
+            if matched:
+                continue
+            if deployment.status == "DEPLOYING" and _started(deployment) <= give_up_before:
+                finished["FAILED"][deployment.id] = deployment.run_url
+                times["started_at"][deployment.id]  = _started(deployment)
+                times["finished_at"][deployment.id] = now
+                self.gave_up += 1
+            elif deployment.status == "TRIGGER_UNCONFIRMED" and deployment.repo_url in listed \
+                    and _started(deployment) <= unconfirmed_before:
+                # GitHub listed no run for it all this time, so the dispatch never took
+                finished["TRIGGER_FAILED"][deployment.id] = None
+
+        moved = []
+        for status, run_urls in finished.items():
+            if run_urls:
+                moved += [(dep, old, status) for dep, old in transition_many(db, status, run_urls, **times)]
+        promoted = []
+        for deployment, old_status, status in moved:
+            record_status_change(db, deployment, old_status, status)
+            record_duration(db, deployment)
+            enqueue_notification(db, deployment, status, deployment.environment, deployment.run_url,
+                                 note=NOTES.get(status))
+            if old_status in ACTIVE_STATUSES:
+                promoted += promote_next(db, deployment.repo_url, deployment.environment)
+
+        linked = []
+        for deployment in stuck:
+            run_url = running.get(deployment.id)
+            if run_url and deployment.run_url != run_url:
+                deployment.run_url = run_url
+                linked.append(deployment)
+
+        if not moved and not linked:
+            return
+
+        bump_version(db)
+        events = [dep.to_dict() for dep, _, _ in moved] + [dep.to_dict() for dep in linked]
+        db.commit()
+        self.resolved += len(moved)
+        logger.info("Reconciled stuck deployments", extra={"resolved": len(moved), "linked": len(linked)})
+
+        if moved:
+            outbox_dispatcher.wake()
+        for data in events:
+            publish_deployment(data, "updated")
+        start_promoted(promoted)
+
+    def stats(self) -> dict:
+        return {
+            "running":      self._thread is not None,
+            "interval":     round(self.interval, 1),
+            "last_run":     self.last_run.isoformat() if self.last_run else None,
+            "in_flight":    self.in_flight,
+            "api_calls":    self.api_calls,
+            "not_modified": self.not_modified,
+            "resolved":     self.resolved,
+            "gave_up":      self.gave_up,
+            "retrying":     self.retrying,
+            "skipped":      self.skipped,
+        }
+
+
+run_reconciler = RunReconciler()
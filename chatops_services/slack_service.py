@@ -1,16 +1,35 @@
-import requests
+from chatops_services.http_client import async_http_client, http_client
+from chatops_services.circuit_breaker import breakers
+from chatops_services.metrics import SLACK_NOTIFY_RESULTS, SLACK_NOTIFY_SECONDS
+from urllib.parse import urlsplit
+import logging
 import os
+import time
 
-def notify_slack(deployment, status: str, environment: str, run_url: str):
-    """
-    Posts a deployment result message to your Slack channel.
-    Called automatically when GitHub webhook hits your backend.
-    """
-    token   = os.environ.get("SLACK_BOT_TOKEN")
+# Overridable so benchmarks can point at a local stand-in
+SLACK_API_URL          = os.environ.get("SLACK_API_URL", "https://slack.com/api").rstrip("/")
+SLACK_POST_MESSAGE_URL = f"{SLACK_API_URL}/chat.postMessage"
+# Slack accepts at most 5 posts per slash command response_url
+RESPONSE_URL_MAX_POSTS = 5
+
+# Web API and slash command response_urls (hooks.slack.com) go down together
+slack_breaker = breakers.register("slack", {urlsplit(SLACK_API_URL).netloc, "hooks.slack.com"})
+
+logger = logging.getLogger(__name__)
+
+
+# status -> (icon, attachment colour); anything else is shown as a failure
+STATUS_STYLES = {
+    "SUCCESS":    ("✅", "#36a64f"),
+    "SUPERSEDED": ("⏭️", "#8b949e"),
+}
+
+
+def build_deployment_message(deployment, status: str, environment: str, run_url: str, note: str = None) -> dict:
+    """Builds the chat.postMessage payload for a deployment result."""
     channel = os.environ.get("SLACK_DEPLOY_CHANNEL", "#deployments")
 
-    icon  = "✅" if status == "SUCCESS" else "❌"
-    color = "#36a64f" if status == "SUCCESS" else "#ff0000"
+    icon, color = STATUS_STYLES.get(status, ("❌", "#ff0000"))
 
     blocks = [
         {
@@ -23,6 +42,7 @@ def notify_slack(deployment, status: str, environment: str, run_url: str):
                     f"*Environment:* `{environment}`\n"
                     f"*Triggered by:* @{deployment.user_name}\n"
                     f"*Deployment ID:* `{deployment.id}`"
+                    + (f"\n{note}" if note else "")
                 )
             }
         }
@@ -41,13 +61,135 @@ def notify_slack(deployment, status: str, environment: str, run_url: str):
             ]
         })
 
-    payload = {
+    return {
         "channel": channel,
         "attachments": [{"color": color, "blocks": blocks}]
     }
 
-    requests.post(
-        "https://slack.com/api/chat.postMessage",
-        json=payload,
-        headers={"Authorization": f"Bearer {token}"}
-    )
\ No newline at end of file
+
+def send_slack_message(payload: dict, retries: int = None) -> dict:
+    """
+    Posts a prepared payload to chat.postMessage.
+    Returns {"ok": bool, "error": str, "retry_after": seconds or None}.
+    """
+    token = os.environ.get("SLACK_BOT_TOKEN")
+
+    started = time.perf_counter()
+    try:
+        response = http_client.post(
+            SLACK_POST_MESSAGE_URL,
+            json=payload,
+            headers={"Authorization": f"Bearer {token}"},
+            retries=retries
+        )
+    except Exception:
+        SLACK_NOTIFY_RESULTS.labels("error").inc()
+        raise
+    finally:
+        SLACK_NOTIFY_SECONDS.observe(time.perf_counter() - started)
+    return _message_result(response)
+
+
+async def send_slack_message_async(payload: dict, retries: int = None) -> dict:
+    """send_slack_message() for the async mode."""
+    token = os.environ.get("SLACK_BOT_TOKEN")
+
+    started = time.perf_counter()
+    try:
+        response = await async_http_client.post(
+            SLACK_POST_MESSAGE_URL,
+            json=payload,
+            headers={"Authorization": f"Bearer {token}"},
+            retries=retries
+        )
+    except Exception:
+        SLACK_NOTIFY_RESULTS.labels("error").inc()
+        raise
+    finally:
+        SLACK_NOTIFY_SECONDS.observe(time.perf_counter() - started)
+    return _message_result(response)
+
+
+def _message_result(response) -> dict:
+    if response.status_code == 429:
+        SLACK_NOTIFY_RESULTS.labels("ratelimited").inc()
+        retry_after = response.headers.get("Retry-After", "1")
+        return {
+            "ok": False,
+            "error": "ratelimited",
+            "retry_after": float(retry_after) if retry_after.isdigit() else 1.0
+        }
+    if response.status_code != 200:
+        SLACK_NOTIFY_RESULTS.labels("error").inc()
+        logger.warning("chat.postMessage failed", extra={"status_code": response.status_code})
+        return {"ok": False, "error": f"HTTP {response.status_code}", "retry_after": None}
+
+    body = response.json()
+    SLACK_NOTIFY_RESULTS.labels("ok" if body.get("ok") else "error").inc()
+    if not body.get("ok"):
+        logger.warning("chat.postMessage rejected", extra={"error": body.get("error")})
+    return {"ok": bool(body.get("ok")), "error": body.get("error"), "retry_after": None}
+
+
+def notify_slack(deployment, status: str, environment: str, run_url: str) -> bool:
+    """
+    Posts a deployment result message to your Slack channel.
+    Prefer queueing through the notification outbox on request paths.
+    """
+    payload = build_deployment_message(deployment, status, environment, run_url)
+    return send_slack_message(payload)["ok"]
+
+
+def post_to_response_url(response_url: str, message: dict) -> bool:
+    """
+    Posts a delayed reply to a slash command via its response_url.
+    Used by background workers once the real result is known.
+    """
+    if not response_url:
+        return False
+
+    response = http_client.post(response_url, json=message)
+    if response.status_code != 200:
+        logger.warning("response_url post failed", extra={"status_code": response.status_code})
+    return response.status_code == 200
+
+
+async def post_to_response_url_async(response_url: str, message: dict) -> bool:
+    """post_to_response_url() for the async mode."""
+    if not response_url:
+        return False
+
+    response = await async_http_client.post(response_url, json=message)
+    if response.status_code != 200:
+        logger.warning("response_url post failed", extra={"status_code": response.status_code})
+    return response.status_code == 200
+
+
+class ResponseUrlUpdater:
+    """
+    Keeps one slash command reply current through its response_url.
+    Progress updates are throttled to one per min_interval and never use
+    the last allowed post, which is kept for finish().
+    """
+
+    def __init__(self, response_url: str, min_interval: float):
+        self.response_url = response_url
+        self.min_interval = min_interval
+        self.posts        = 0
+        self._last_post   = 0.0
+
+    def update(self, build_message) -> bool:
+        """Posts build_message() if the budget and throttle allow it."""
+        if self.posts >= RESPONSE_URL_MAX_POSTS - 1:
+            return False
+        if time.monotonic() - self._last_post < self.min_interval:
+            return False
+        return self._post(build_message())
+
+    def finish(self, message: dict) -> bool:
+        return self._post(message)
+
+    def _post(self, message: dict) -> bool:
+        self.posts += 1
+        self._last_post = time.monotonic()
+        return post_to_response_url(self.response_url, {"replace_original": True, **message})
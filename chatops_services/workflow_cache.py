@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+WORKFLOW_CACHE_TTL  = float(os.environ.get("WORKFLOW_CACHE_TTL", "300"))
+WORKFLOW_CACHE_SIZE = int(os.environ.get("WORKFLOW_CACHE_SIZE", "512"))
+
+
+class WorkflowCache:
+    """
+    LRU cache of "workflow present, blob SHA X" per owner/repo.
+    Expired entries are kept (until evicted) so their ETag can be
+    replayed as If-None-Match on the next check.
+    """
+
+    def __init__(self, ttl: float = WORKFLOW_CACHE_TTL, max_size: int = WORKFLOW_CACHE_SIZE):
+        self.ttl      = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+
+    def get(self, key: str):
+        """Returns the entry dict (fresh or stale) or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry, fresh=time.monotonic() - entry["checked_at"] < self.ttl)
+
+    def put(self, key: str, sha: str, etag: str = None):
+        with self._lock:
+            self._entries[key] = {
+                "sha":        sha,
+                "etag":       etag,
+                "checked_at": time.monotonic()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def touch(self, key: str):
+        """Marks an entry as revalidated (e.g. after a 304)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["checked_at"] = time.monotonic()
+                self._entries.move_to_end(key)
+
+    def invalidate(self, key: str = None):
+        """Drops one entry, or the whole cache when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+workflow_cache = WorkflowCache()
@@ -0,0 +1,262 @@
+"""
+Bulk provisioning of the ChatOps workflow across every repo of an org
+(or user), so no real deploy pays the create-and-wait cold start.
+
+    python -m chatops_services.workflow_setup <org> [--dry-run]
+
+Slack: /deploy-setup <org>
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from chatops_services.github_service import (
+    WORKFLOW_PATH, get_workflow_content, github_graphql, write_workflow
+)
+from chatops_services.slack_service import ResponseUrlUpdater
+
+SETUP_CONCURRENCY    = int(os.environ.get("SETUP_CONCURRENCY", "4"))
+SETUP_UPDATE_SECONDS = float(os.environ.get("SETUP_UPDATE_SECONDS", "3"))
+GRAPHQL_PAGE_SIZE    = 100
+WRITE_PERMISSIONS    = {"ADMIN", "MAINTAIN", "WRITE"}
+
+logger = logging.getLogger(__name__)
+
+# One page lists 100 repos together with the blob id of their workflow file
+REPOS_QUERY = """
+query($owner: String!, $first: Int!, $after: String, $expression: String!) {
+  repositoryOwner(login: $owner) {
+    repositories(first: $first, after: $after, orderBy: {field: NAME, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name
+        isArchived
+        isPrivate
+        viewerPermission
+        defaultBranchRef { name }
+        workflow: object(expression: $expression) { ... on Blob { oid } }
+      }
+    }
+  }
+}
+"""
+
+
+def blob_sha(content: str) -> str:
+    """Git blob id of content - what GitHub reports as the file's sha/oid."""
+    data = content.encode()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def scan_repos(owner: str) -> dict:
+    """
+    Lists every repo of owner and classifies its workflow as current,
+    stale, missing or skipped, 100 repos per GraphQL call. Public repos
+    are skipped: the workflow file carries the webhook secret.
+    """
+    expected = blob_sha(get_workflow_content())
+    repos, after, calls = [], None, 0
+    while True:
+        result = github_graphql(REPOS_QUERY, {
+            "owner":      owner,
+            "first":      GRAPHQL_PAGE_SIZE,
+            "after":      after,
+            "expression": f"HEAD:{WORKFLOW_PATH}",
+        })
+        calls += 1
+        if not result["success"]:
+            return {"success": False, "error": result["error"]}
+        repo_owner = result["data"].get("repositoryOwner")
+        if repo_owner is None:
+            return {"success": False, "error": f"No GitHub org or user named {owner}"}
+
+        page = repo_owner["repositories"]
+        for node in page["nodes"]:
+            sha = (node.get("workflow") or {}).get("oid")
+            entry = {"repo": node["name"], "sha": sha}
+            if node["isArchived"]:
+                entry.update(state="skipped", reason="archived")
+            elif not node.get("isPrivate", False):
+                entry.update(state="skipped", reason="public repository")
+            elif node.get("defaultBranchRef") is None:
+                entry.update(state="skipped", reason="empty repository")
+            elif node.get("viewerPermission") not in WRITE_PERMISSIONS:
+                entry.update(state="skipped", reason="no write access")
+            elif sha is None:
+                entry["state"] = "missing"
+            elif sha != expected:
+                entry["state"] = "stale"
+            else:
+                entry["state"] = "current"
+            repos.append(entry)
+
+        if not page["pageInfo"]["hasNextPage"]:
+            break
+        after = page["pageInfo"]["endCursor"]
+
+    return {"success": True, "repos": repos, "graphql_calls": calls}
+
+
+class WorkflowProvisioner:
+    """
+    Creates missing and upgrades stale workflows for one owner, at most
+    SETUP_CONCURRENCY writes at a time. on_progress(provisioner) is called
+    after every write; report() summarises the run.
+    """
+
+    def __init__(self, owner: str, dry_run: bool = False, on_progress=None):
+        self.owner         = owner
+        self.dry_run       = dry_run
+        self.on_progress   = on_progress
+        self.repos         = []
+        self.scan_error    = None
+        self.graphql_calls = 0
+        self.started       = None
+        self.finished      = None
+        self._lock         = threading.Lock()
+
+    def run(self) -> dict:
+        self.started = time.monotonic()
+        scan = scan_repos(self.owner)
+        if not scan["success"]:
+            self.scan_error = scan["error"]
+            self.finished = time.monotonic()
+            return self.report()
+
+        self.repos = scan["repos"]
+        self.graphql_calls = scan["graphql_calls"]
+        todo = [r for r in self.repos if r["state"] in ("missing", "stale")]
+        logger.info("Workflow scan finished", extra={
+            "owner": self.owner, "repos": len(self.repos), "to_write": len(todo)
+        })
+        if self.on_progress:
+            self.on_progress(self)
+
+        if todo and not self.dry_run:
+            workers = min(SETUP_CONCURRENCY, len(todo))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="workflow-setup") as pool:
+                futures = [pool.submit(self._write, entry) for entry in todo]
+                for _ in as_completed(futures):
+                    if self.on_progress:
+                        self.on_progress(self)
+
+        self.finished = time.monotonic()
+        return self.report()
+
+    def _write(self, entry: dict):
+        upgrade = entry["state"] == "stale"
+        try:
+            result = write_workflow(self.owner, entry["repo"], sha=entry["sha"] if upgrade else None)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        with self._lock:
+            if result["success"]:
+                entry.update(state="upgraded" if upgrade else "created", sha=result["sha"])
+            else:
+                entry.update(state="failed", reason=result["error"][:200])
+
+    def counts(self) -> dict:
+        with self._lock:
+            counts = {}
+            for entry in self.repos:
+                counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+            return counts
+
+    def report(self) -> dict:
+        with self._lock:
+            failures = [
+                {"repo": e["repo"], "error": e.get("reason")} for e in self.repos if e["state"] == "failed"
+            ]
+        elapsed = (self.finished or time.monotonic()) - self.started if self.started else 0.0
+        return {
+            "owner":         self.owner,
+            "success":       self.scan_error is None and not failures,
+            "error":         self.scan_error,
+            "dry_run":       self.dry_run,
+            "repos":         len(self.repos),
+            "counts":        self.counts(),
+            "failures":      failures,
+            "graphql_calls": self.graphql_calls,
+            "seconds":       round(elapsed, 2),
+        }
+
+
+# ── Slack ────────────────────────────────────────────────────
+def setup_message(provisioner: WorkflowProvisioner, final: bool = False) -> dict:
+    report = provisioner.report()
+    counts = report["counts"]
+
+    if report["error"]:
+        return {"response_type": "ephemeral", "text": f"Workflow setup for `{report['owner']}` failed: {report['error']}"}
+
+    pending = counts.get("missing", 0) + counts.get("stale", 0)
+    title = "Workflow Setup Complete" if final else "Workflow Setup In Progress"
+    summary = [
+        f"*Repos:* {report['repos']}",
+        f"*Already current:* {counts.get('current', 0)}",
+        f"*Created:* {counts.get('created', 0)}",
+        f"*Upgraded:* {counts.get('upgraded', 0)}",
+        f"*Failed:* {counts.get('failed', 0)}",
+        f"*Skipped:* {counts.get('skipped', 0)}",
+    ]
+    if report["dry_run"]:
+        summary.append(f"*Would write:* {pending} (dry run)")
+    elif not final:
+        summary.append(f"*Remaining:* {pending}")
+
+    blocks = [
+        {"type": "header", "text": {"type": "plain_text", "text": title}},
+        {"type": "section", "text": {"type": "mrkdwn", "text": f"Owner: `{report['owner']}`\n" + "  ".join(summary)}},
+    ]
+    if final and report["failures"]:
+        lines = [f"{f['repo']}: _{(f['error'] or '')[:100]}_" for f in report["failures"][:20]]
+        if len(report["failures"]) > 20:
+            lines.append(f"...and {len(report['failures']) - 20} more")
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": "*Failures:*\n" + "\n".join(lines)}})
+    if final:
+        blocks.append({"type": "context", "elements": [{
+            "type": "mrkdwn",
+            "text": f"{report['graphql_calls']} GraphQL calls, {report['seconds']}s"
+        }]})
+    return {"response_type": "in_channel", "blocks": blocks}
+
+
+def run_setup_command(owner: str, response_url: str, dry_run: bool = False):
+    """Deploy pool job for /deploy-setup."""
+    reply = ResponseUrlUpdater(response_url, SETUP_UPDATE_SECONDS)
+    provisioner = WorkflowProvisioner(
+        owner, dry_run=dry_run,
+        on_progress=lambda p: reply.update(lambda: setup_message(p))
+    )
+    provisioner.run()
+    reply.finish(setup_message(provisioner, final=True))
+
+
+# ── CLI ──────────────────────────────────────────────────────
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Provision the ChatOps workflow across an org's repos")
+    parser.add_argument("owner", help="GitHub org or user")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args(argv)
+
+    def progress(p):
+        counts = p.counts()
+        print(f"  {counts}", flush=True)
+
+    report = WorkflowProvisioner(args.owner, dry_run=args.dry_run, on_progress=progress).run()
+    if report["error"]:
+        print(f"Scan failed: {report['error']}")
+        return 1
+    print(f"{report['repos']} repos in {report['seconds']}s ({report['graphql_calls']} GraphQL calls): {report['counts']}")
+    for failure in report["failures"]:
+        print(f"  FAILED {failure['repo']}: {failure['error']}")
+    return 0 if report["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,19 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from flask import g
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from chatops_services.log import configure_logging
 
 load_dotenv()
+# database is the first module every entry point imports
+configure_logging()
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///chatops.db")
 
@@ -16,16 +25,183 @@ if DATABASE_URL.startswith("postgres://"):
 if "postgresql" in DATABASE_URL and "pg8000" not in DATABASE_URL and "psycopg2" not in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+pg8000://", 1)
 
-print(f"Connecting to: {DATABASE_URL[:50]}...")
+# Pool sizing - aim for pool_size * gunicorn workers (+ overflow) below the
+# database's connection limit
+DB_POOL_SIZE       = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW    = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT    = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE    = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING   = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+SQLITE_BUSY_MS     = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
-try:
-    engine = create_engine(DATABASE_URL)
-    print("Database engine created successfully!")
-except Exception as e:
-    print(f"Database connection error: {e}")
-    # Fallback to SQLite
-    engine = create_engine("sqlite:///chatops.db")
-    print("Falling back to SQLite!")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base         = declarative_base()
\ No newline at end of file
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    stats_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts  = 0
+        self.wait_total = 0.0
+        self.wait_max   = 0.0
+        self.timeouts   = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self.stats_lock:
+                self.checkouts  += 1
+                self.wait_total += waited
+                self.wait_max    = max(self.wait_max, waited)
+
+
+def _build_engine(url: str):
+    kwargs = {
+        "poolclass":     InstrumentedQueuePool,
+        "pool_size":     DB_POOL_SIZE,
+        "max_overflow":  DB_MAX_OVERFLOW,
+        "pool_timeout":  DB_POOL_TIMEOUT,
+        "pool_recycle":  DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.startswith("sqlite"):
+        # Connections are shared between request and background threads
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_MS / 1000}
+
+    new_engine = create_engine(url, **kwargs)
+
+    if url.startswith("sqlite"):
+        @event.listens_for(new_engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            # WAL lets the webhook writer and dashboard readers run concurrently
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_MS}")
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.close()
+
+    return new_engine
+
+
+_engine        = None
+_engine_lock   = threading.Lock()
+_engine_hooks  = []
+ENGINE_TIMINGS = {"build_seconds": None}
+
+
+def get_engine():
+    """
+    Builds the engine on first use, so importing this module (or forking a
+    worker) never touches the database.
+    """
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            started = time.perf_counter()
+            logger.info("Connecting to database", extra={"url": DATABASE_URL.split("@")[-1][:50]})
+            try:
+                new_engine = _build_engine(DATABASE_URL)
+            except Exception:
+                logger.exception("Database connection error, falling back to SQLite")
+                new_engine = _build_engine("sqlite:///chatops.db")
+            for hook in _engine_hooks:
+                hook(new_engine)
+            ENGINE_TIMINGS["build_seconds"] = round(time.perf_counter() - started, 4)
+            _engine = new_engine
+    return _engine
+
+
+def on_engine_created(hook):
+    """
+    Runs hook(engine) once the engine exists (immediately if it already
+    does). Registering the same hook again is a no-op, so building several
+    apps in one process doesn't stack listeners.
+    """
+    with _engine_lock:
+        if hook in _engine_hooks:
+            return
+        _engine_hooks.append(hook)
+        current = _engine
+    if current is not None:
+        hook(current)
+
+
+def _dispose_after_fork():
+    # Connections inherited from a preloading master must not be shared
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def __getattr__(name):
+    # Keeps `from database import engine` working without building it at import
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+Base             = declarative_base()
+
+
+def SessionLocal():
+    """New session bound to the (lazily built) engine."""
+    return _session_factory(bind=get_engine())
+
+
+def get_db():
+    """
+    Returns the session for the current request, creating it on first use.
+    It is closed automatically when the app context tears down.
+    Background threads should keep using SessionLocal() directly.
+    """
+    if "db" not in g:
+        g.db = SessionLocal()
+    return g.db
+
+
+def close_db(exception=None):
+    db = g.pop("db", None)
+    if db is not None:
+        if exception is not None:
+            db.rollback()
+        db.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
+def pool_stats() -> dict:
+    """Checkout wait time and connection usage, for sizing the pool."""
+    pool = get_engine().pool
+    stats = {
+        "size":        pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow":    pool.overflow(),
+        "idle":        pool.checkedin(),
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool.stats_lock:
+            stats.update({
+                "checkouts":   pool.checkouts,
+                "timeouts":    pool.timeouts,
+                "wait_avg_ms": round(pool.wait_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+                "wait_max_ms": round(pool.wait_max * 1000, 3),
+            })
+    return stats
@@ -1,6 +0,0 @@
-from database import engine
-from models import Base
-
-Base.metadata.create_all(bind=engine)
-
-print("Database created successfully")
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Schema migrations. Run once per release, before starting the workers:
+
+    python migrate.py            # upgrade to the latest version
+    python migrate.py status     # show applied and pending migrations
+
+Workers never create or alter tables themselves (set AUTO_MIGRATE=true to
+have create_app() upgrade, e.g. for a local SQLite setup).
+"""
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+from database import SessionLocal, get_engine
+from models import Base
+
+# Tracks applied versions; kept off Base so create_all() never touches it
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Any constant works; serialises concurrent runs on Postgres
+ADVISORY_LOCK_ID = 724310
+
+
+def _baseline(conn):
+    # Creates whatever is missing; databases built by the old init_db.py keep their tables
+    Base.metadata.create_all(bind=conn)
+
+
+def _backfill_counters(conn):
+    from chatops_services.deployment_stats import reconcile_counters
+    db = SessionLocal()
+    try:
+        reconcile_counters(db, days=None)
+    finally:
+        db.close()
+
+
+def _history_tables(conn):
+    from models import DeploymentArchive, DeploymentDailyRollup
+    Base.metadata.create_all(bind=conn, tables=[DeploymentDailyRollup.__table__, DeploymentArchive.__table__])
+    if conn.dialect.name == "postgresql":
+        # Monthly partitions are attached by chatops_services.history as months are archived
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS deployments_archive (LIKE deployments) PARTITION BY RANGE ("timestamp")'
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_deployments_archive_repo_id ON deployments_archive (repo_url, id)"
+        ))
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there (fresh installs)."""
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _durations(conn):
+    from models import DeploymentDurationSketch
+    tables = ["deployments"]
+    if conn.dialect.name == "postgresql":
+        # Partitions pick the columns up from the parent
+        tables.append("deployments_archive")
+    for table in tables:
+        add_column(conn, table, "started_at", "TIMESTAMP")
+        add_column(conn, table, "finished_at", "TIMESTAMP")
+    Base.metadata.create_all(bind=conn, tables=[DeploymentDurationSketch.__table__])
+
+
+def _missing_indexes(conn):
+    # create_all() skips tables that already exist, indexes and all, so a
+    # deployments table from before the migrations never got the model's indexes
+    existing = set(inspect(conn).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name in existing:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def _channel_slots(conn):
+    from models import SlackChannelSlot
+    Base.metadata.create_all(bind=conn, tables=[SlackChannelSlot.__table__])
+
+
+# (version, description, fn(connection)) - append only, never renumber
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "backfill deployment counters", _backfill_counters),
+    (3, "deployment history rollups and archive", _history_tables),
+    (4, "deployment durations and percentile sketches", _durations),
+    (5, "indexes missing from pre-migration tables", _missing_indexes),
+    (6, "shared Slack channel send slots", _channel_slots),
+]
+
+
+def applied_versions(conn) -> set:
+    _meta.create_all(bind=conn)
+    return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def upgrade() -> list:
+    """Applies pending migrations in order; returns the versions applied."""
+    engine = get_engine()
+    applied_now = []
+    with engine.connect() as conn:
+        postgres = engine.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+            conn.commit()
+        try:
+            done = applied_versions(conn)
+            conn.commit()
+            for version, description, migrate in MIGRATIONS:
+                if version in done:
+                    continue
+                started = time.perf_counter()
+                migrate(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, description=description, applied_at=datetime.utcnow()
+                ))
+                conn.commit()
+                applied_now.append(version)
+                print(f"Applied {version}: {description} ({time.perf_counter() - started:.2f}s)")
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+                conn.commit()
+    return applied_now
+
+
+def pending() -> list:
+    with get_engine().connect() as conn:
+        done = applied_versions(conn)
+        conn.commit()
+    return [(version, description) for version, description, _ in MIGRATIONS if version not in done]
+
+
+def main(argv) -> int:
+    command = argv[1] if len(argv) > 1 else "upgrade"
+    if command == "status":
+        waiting = pending()
+        print(f"Latest version: {MIGRATIONS[-1][0]}, pending: {len(waiting)}")
+        for version, description in waiting:
+            print(f"  {version}: {description}")
+        return 0
+    if command == "upgrade":
+        applied = upgrade()
+        print(f"Database is up to date ({len(applied)} migrations applied)")
+        return 0
+    print(f"Unknown command {command!r}; use upgrade or status")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
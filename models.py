@@ -1,9 +1,17 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Date, Float, Text, LargeBinary, Index, UniqueConstraint
 from datetime import datetime
 
 class Deployment(Base):
     __tablename__ = "deployments"
+    __table_args__ = (
+        # Keyset pages for /api/deployments: equality filters, then id desc
+        Index("ix_deployments_env_status_id", "environment", "status", "id"),
+        Index("ix_deployments_status_id", "status", "id"),
+        Index("ix_deployments_repo_id", "repo_url", "id"),
+        Index("ix_deployments_user_id", "user_name", "id"),
+        Index("ix_deployments_timestamp", "timestamp"),
+    )
 
     id          = Column(Integer, primary_key=True, index=True)
     repo_url    = Column(String, nullable=False)
@@ -12,6 +20,8 @@ class Deployment(Base):
     status      = Column(String, default="DEPLOYING")  # DEPLOYING/SUCCESS/FAILED
     run_url     = Column(String, nullable=True)        # NEW: GitHub Actions run link
     timestamp   = Column(DateTime, default=datetime.utcnow)
+    started_at  = Column(DateTime, nullable=True)      # last time it went DEPLOYING (trigger sent)
+    finished_at = Column(DateTime, nullable=True)      # SUCCESS/FAILED webhook received
 
     def to_dict(self):
         return {
@@ -21,5 +31,135 @@ class Deployment(Base):
             "environment": self.environment,
             "status": self.status,
             "run_url": self.run_url,
-            "timestamp": str(self.timestamp)
-        }
\ No newline at end of file
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+# Keys of Deployment.to_dict(), in order - also the columns the listing APIs select
+LISTING_FIELDS  = ("id", "repo_url", "user_name", "environment", "status", "run_url", "timestamp",
+                   "started_at", "finished_at")
+LISTING_COLUMNS = tuple(getattr(Deployment, field) for field in LISTING_FIELDS)
+
+
+def listing_rows(rows) -> list:
+    """
+    Dicts shaped like to_dict() from plain column tuples, skipping the ORM.
+    Timestamps stay datetimes; response_cache.serialize() writes them as ISO-8601.
+    """
+    return [dict(zip(LISTING_FIELDS, row)) for row in rows]
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        # Dispatcher polls "PENDING and due", oldest first
+        Index("ix_outbox_status_due", "status", "next_attempt_at"),
+    )
+
+    id              = Column(Integer, primary_key=True, index=True)
+    deployment_id   = Column(Integer, nullable=True)
+    channel         = Column(String, nullable=False)
+    payload         = Column(Text, nullable=False)       # JSON chat.postMessage body
+    status          = Column(String, default="PENDING")  # PENDING/DELIVERED/FAILED
+    attempts        = Column(Integer, default=0)
+    last_error      = Column(String, nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at      = Column(DateTime, default=datetime.utcnow)
+    delivered_at    = Column(DateTime, nullable=True)
+
+
+class SlackChannelSlot(Base):
+    """
+    Earliest time the outbox may post to a Slack channel again. Shared so
+    every worker's dispatcher stays within one per-channel rate.
+    """
+    __tablename__ = "slack_channel_slots"
+
+    channel      = Column(String, primary_key=True)
+    next_send_at = Column(DateTime, nullable=False)
+
+
+class DeploymentCounter(Base):
+    """
+    Pre-aggregated deployment counts, maintained incrementally.
+    dimension is "all", "repo" or "user"; dim_value is the repo URL or
+    user name ("" for "all").
+    """
+    __tablename__ = "deployment_counters"
+    __table_args__ = (
+        UniqueConstraint("dimension", "dim_value", "environment", "status", "day",
+                         name="uq_deployment_counters_key"),
+    )
+
+    id          = Column(Integer, primary_key=True)
+    dimension   = Column(String, nullable=False)
+    dim_value   = Column(String, nullable=False, default="")
+    environment = Column(String, nullable=False)
+    status      = Column(String, nullable=False)
+    day         = Column(Date, nullable=False)
+    count       = Column(Integer, nullable=False, default=0)
+
+
+class DeploymentDailyRollup(Base):
+    """
+    Per-day totals for deployments moved out of the live table, written
+    when their month is archived. Historical reports read these instead of
+    raw rows. duration_* cover the deployments with a known finish time.
+    """
+    __tablename__ = "deployment_daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "repo_url", "environment", "status",
+                         name="uq_deployment_daily_rollups_key"),
+    )
+
+    id               = Column(Integer, primary_key=True)
+    day              = Column(Date, nullable=False)
+    repo_url         = Column(String, nullable=False)
+    environment      = Column(String, nullable=False)
+    status           = Column(String, nullable=False)
+    count            = Column(Integer, nullable=False, default=0)
+    duration_count   = Column(Integer, nullable=False, default=0)
+    duration_seconds = Column(Float, nullable=False, default=0.0)
+
+
+class DeploymentDurationSketch(Base):
+    """
+    Percentile sketch of successful deployment durations for one repo and
+    environment, updated as webhooks arrive. sketch is a packed
+    chatops_services.durations.DurationSketch.
+    """
+    __tablename__ = "deployment_duration_sketches"
+    __table_args__ = (
+        UniqueConstraint("repo_url", "environment", name="uq_deployment_duration_sketches_key"),
+    )
+
+    id          = Column(Integer, primary_key=True)
+    repo_url    = Column(String, nullable=False)
+    environment = Column(String, nullable=False)
+    count       = Column(Integer, nullable=False, default=0)
+    sketch      = Column(LargeBinary, nullable=False)
+    updated_at  = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class DeploymentArchive(Base):
+    """One row per month moved out of the live deployments table."""
+    __tablename__ = "deployment_archives"
+
+    month       = Column(Date, primary_key=True)     # first day of the month
+    table_name  = Column(String, nullable=False)     # deployments_archive_YYYYMM
+    rows        = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    purged_at   = Column(DateTime, nullable=True)    # raw rows dropped by retention
+
+
+class DeploymentVersion(Base):
+    """
+    Single-row counter bumped by every deployment write.
+    Read APIs use it as their ETag and cache key.
+    """
+    __tablename__ = "deployment_version"
+
+    id      = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
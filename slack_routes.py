@@ -1,18 +1,244 @@
-from flask import Blueprint, request, jsonify
-from database import SessionLocal
+from flask import Blueprint, g, jsonify, make_response, request
+from sqlalchemy import insert
+from database import get_db
 from models import Deployment
-from chatops_services.github_service import trigger_github_deployment
+from chatops_services.github_service import trigger_github_deployment, trigger_github_deployment_async
+from chatops_services.slack_service import post_to_response_url, post_to_response_url_async
+from chatops_services.deploy_queue import async_variant, deploy_pool
+from chatops_services.deploy_scheduler import (
+    assign_statuses, key_locks, mark_trigger_failed, notify_superseded, supersede_queued
+)
+from chatops_services.deployment_stats import record_created, record_status_change
+from chatops_services.deploy_states import RETURNED_COLUMNS
+from chatops_services.durations import duration_stats
+from chatops_services.events import publish_deployment
+from chatops_services.idempotency import slack_requests
+from chatops_services.response_cache import bump_version
+from chatops_services.security import verify_slack_request
+from chatops_services.metrics import SLACK_COMMAND_SECONDS
+from chatops_services.fanout import FANOUT_MAX_REPOS, REPO_GROUPS, GroupDeployment, resolve_repos
+from chatops_services.workflow_setup import run_setup_command
 from datetime import datetime
+import asyncio
+import logging
+import os
+import re
+import time
 
 slack_bp = Blueprint("slack", __name__)
 
 VALID_ENVIRONMENTS = ["dev", "staging", "prod"]
+KNOWN_COMMANDS     = {"/deploy", "/deploy-status", "/deploy-setup", "/deploy-stats"}
+# Slack user IDs (U0123ABCD, not display names - those can be changed
+# and aren't unique) allowed to run /deploy-setup; nobody when unset
+SLACK_ADMIN_USERS  = {u.strip() for u in os.environ.get("SLACK_ADMIN_USERS", "").split(",") if u.strip()}
+
+logger = logging.getLogger(__name__)
+
+
+def deployment_blocks(title, repo_url, environment, user_name, deployment_id, status_text):
+    """Builds the Slack blocks shown for a single deployment."""
+    return [
+        {
+            "type": "header",
+            "text": {"type": "plain_text", "text": title}
+        },
+        {
+            "type": "section",
+            "fields": [
+                {"type": "mrkdwn", "text": f"*Repo:*\n{repo_url}"},
+                {"type": "mrkdwn", "text": f"*Environment:*\n`{environment}`"},
+                {"type": "mrkdwn", "text": f"*Triggered by:*\n@{user_name}"},
+                {"type": "mrkdwn", "text": f"*Deployment ID:*\n`{deployment_id}`"}
+            ]
+        },
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": status_text
+            }
+        }
+    ]
+
+
+def run_deployment(repo_url, environment, user_name, deployment_id, response_url):
+    """
+    Background job for /deploy.
+    Triggers GitHub Actions and posts the outcome back through response_url.
+    """
+    result = trigger_github_deployment(repo_url, environment, deployment_id)
+
+    if not result["success"]:
+        logger.warning("GitHub trigger failed", extra={
+            "deployment_id": deployment_id, "repo_url": repo_url, "error": result["error"]
+        })
+        mark_trigger_failed(deployment_id, retry=result.get("retry", False), unconfirmed=result.get("unconfirmed", False))
+        post_to_response_url(response_url, trigger_failed_message(result))
+        return
+
+    post_to_response_url(response_url, triggered_message(repo_url, environment, user_name, deployment_id))
+
+
+@async_variant(run_deployment)
+async def run_deployment_async(repo_url, environment, user_name, deployment_id, response_url):
+    """run_deployment() on the event loop in the ASGI mode; only the DB update takes a thread."""
+    result = await trigger_github_deployment_async(repo_url, environment, deployment_id)
+
+    if not result["success"]:
+        logger.warning("GitHub trigger failed", extra={
+            "deployment_id": deployment_id, "repo_url": repo_url, "error": result["error"]
+        })
+        await asyncio.to_thread(mark_trigger_failed, deployment_id,
+                                result.get("retry", False), result.get("unconfirmed", False))
+        await post_to_response_url_async(response_url, trigger_failed_message(result))
+        return
+
+    await post_to_response_url_async(response_url, triggered_message(repo_url, environment, user_name, deployment_id))
+
+
+def trigger_failed_message(result):
+    if result.get("retry"):
+        return {
+            "response_type": "ephemeral",
+            "text": f"GitHub is unavailable right now ({result['error']}). "
+                    "The deployment is queued and will be retried automatically."
+        }
+    if result.get("unconfirmed"):
+        return {
+            "response_type": "ephemeral",
+            "text": f"GitHub didn't confirm the dispatch ({result['error']}), so it may still have started. "
+                    "If a run shows up I'll post its result here - check before deploying again."
+        }
+    return {
+        "response_type": "ephemeral",
+        "text": f"GitHub trigger failed: {result['error']}"
+    }
+
+
+def triggered_message(repo_url, environment, user_name, deployment_id):
+    return {
+        "response_type": "in_channel",
+        "replace_original": True,
+        "blocks": deployment_blocks(
+            "Deployment Triggered!",
+            repo_url, environment, user_name, deployment_id,
+            "Status: `DEPLOYING` - I'll post here when it finishes."
+        )
+    }
+
+
+def queue_group_deployment(repos, environment, user_name, response_url):
+    """
+    /deploy for several repos: inserts every row in one statement, then
+    hands the whole group to a single deploy worker which fans it out.
+    """
+    db = get_db()
+    now = datetime.utcnow()
+    rows = [
+        {
+            "repo_url":    repo_url,
+            "user_name":   user_name,
+            "environment": environment,
+            "timestamp":   now,
+        }
+        for repo_url in repos
+    ]
+    with key_locks(db, [(repo_url, environment) for repo_url in repos]):
+        # Repos already deploying to this environment wait their turn as QUEUED
+        assign_statuses(db, rows)
+        if db.bind.dialect.insert_returning:
+            # One multi-row INSERT ... RETURNING; row order isn't guaranteed, repos are unique
+            inserted = db.execute(insert(Deployment).values(rows).returning(*RETURNED_COLUMNS)).all()
+            by_repo = {row.repo_url: Deployment(**row._mapping) for row in inserted}
+            deployments = [by_repo[repo_url] for repo_url in repos]
+        else:
+            deployments = [Deployment(**row) for row in rows]
+            db.add_all(deployments)
+            db.flush()
+        record_created(db, deployments)
+        superseded = supersede_queued(db, [d for d in deployments if d.status == "QUEUED"])
+        bump_version(db)
+        created = [d.to_dict() for d in deployments]
+        db.commit()
+    for data in created:
+        publish_deployment(data, "created")
+    notify_superseded(superseded)
+
+    logger.info("Group deployment queued", extra={
+        "deployment_ids": [data["id"] for data in created], "environment": environment, "user_name": user_name
+    })
+    group = GroupDeployment(created, environment, user_name, response_url)
+    if not deploy_pool.submit(group.run, mark_trigger_failed):
+        for data in created:
+            if data["status"] == "DEPLOYING":
+                mark_trigger_failed(data["id"])
+        return jsonify({
+            "response_type": "ephemeral",
+            "text": "Deploy queue is full, please try again in a minute."
+        })
+
+    return jsonify({
+        "response_type": "in_channel",
+        "blocks": group.summary_blocks()
+    })
+
+
+@slack_bp.after_request
+def observe_command(response):
+    # Slack gives up after 3s, so this is the latency that matters to users
+    started = g.get("request_started")
+    if started is not None:
+        command = request.form.get("command")
+        label   = command if command in KNOWN_COMMANDS else "other"
+        SLACK_COMMAND_SECONDS.labels(label).observe(time.perf_counter() - started)
+    return response
+
 
 @slack_bp.route("/slack", methods=["POST"])
 def slack_commands():
-    command   = request.form.get("command")
-    text      = request.form.get("text", "").strip()
-    user_name = request.form.get("user_name", "unknown")
+    if not verify_slack_request(request):
+        logger.warning("Rejected unsigned Slack request", extra={"remote_addr": request.remote_addr})
+        return jsonify({"text": "Invalid request signature."}), 401
+
+    # trigger_id is stable across Slack's retries of one command; the
+    # signature stands in for payloads that don't carry one
+    key = request.form.get("trigger_id") or ":".join((
+        request.headers.get("X-Slack-Request-Timestamp", ""),
+        request.headers.get("X-Slack-Signature", "")
+    ))
+    retry_num = request.headers.get("X-Slack-Retry-Num")
+    claimed, body = slack_requests.claim(key)
+    if not claimed:
+        logger.info("Slack retry answered from the seen-set", extra={
+            "retry_num": retry_num, "retry_reason": request.headers.get("X-Slack-Retry-Reason"),
+            "replayed": body is not None
+        })
+        # Still being handled by another request: Slack shows the first reply
+        response = make_response(body or b"", 200)
+        response.headers["X-Slack-No-Retry"] = "1"
+        if body:
+            response.mimetype = "application/json"
+        return response
+    if retry_num:
+        logger.info("Slack retry of an unseen request", extra={"retry_num": retry_num})
+
+    try:
+        response = make_response(handle_command())
+    except Exception:
+        # Let Slack's retry run the command again
+        slack_requests.forget(key)
+        raise
+    slack_requests.remember(key, response.get_data())
+    return response
+
+
+def handle_command():
+    command      = request.form.get("command")
+    text         = request.form.get("text", "").strip()
+    user_name    = request.form.get("user_name", "unknown")
+    user_id      = request.form.get("user_id", "")
+    response_url = request.form.get("response_url", "")
 
     # ── /deploy ──────────────────────────────────────────────
     if command == "/deploy":
@@ -21,11 +247,11 @@ def slack_commands():
         if len(parts) < 2:
             return jsonify({
                 "response_type": "ephemeral",
-                "text": "Usage: `/deploy <github-repo-url> <environment>`\nEnvironments: `dev`, `staging`, `prod`"
+                "text": "Usage: `/deploy <github-repo-url>[,<repo-url>|<group>...] <environment>`\n"
+                        "Environments: `dev`, `staging`, `prod`"
             })
 
-        repo_url    = parts[0]
-        environment = parts[1].lower()
+        environment = parts[-1].lower()
 
         if environment not in VALID_ENVIRONMENTS:
             return jsonify({
@@ -33,69 +259,107 @@ def slack_commands():
                 "text": f"Invalid environment `{environment}`. Choose from: `dev`, `staging`, `prod`"
             })
 
+        tokens = [t for t in re.split(r"[,\s]+", " ".join(parts[:-1])) if t]
+        repos, unknown = resolve_repos(tokens)
+
+        if unknown:
+            groups = ", ".join(f"`{name}`" for name in sorted(REPO_GROUPS)) or "none configured"
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": f"Unknown repo group `{unknown[0]}`. Groups: {groups}"
+            })
+
+        if not repos:
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": "No repos to deploy."
+            })
+
+        if len(repos) > FANOUT_MAX_REPOS:
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": f"Too many repos ({len(repos)}), the limit is {FANOUT_MAX_REPOS} per command."
+            })
+
+        if len(repos) > 1:
+            return queue_group_deployment(repos, environment, user_name, response_url)
+
+        repo_url = repos[0]
+
         # Save to DB
-        db = SessionLocal()
-        try:
-            deployment = Deployment(
-                repo_url=repo_url,
-                user_name=user_name,
-                environment=environment,
-                status="DEPLOYING",
-                timestamp=datetime.utcnow()
-            )
+        db = get_db()
+        row = {
+            "repo_url":    repo_url,
+            "user_name":   user_name,
+            "environment": environment,
+            "timestamp":   datetime.utcnow(),
+        }
+        with key_locks(db, [(repo_url, environment)]):
+            busy = assign_statuses(db, [row])
+            deployment = Deployment(**row)
             db.add(deployment)
+            db.flush()
+            record_status_change(db, deployment, None, deployment.status)
+            superseded = supersede_queued(db, [deployment]) if busy else []
+            bump_version(db)
             db.commit()
-            db.refresh(deployment)
-            deployment_id = deployment.id
-        finally:
-            db.close()
-
-        # Trigger GitHub Actions
-        result = trigger_github_deployment(repo_url, environment, deployment_id)
-
-        if not result["success"]:
-            db = SessionLocal()
-            try:
-                dep = db.query(Deployment).filter(Deployment.id == deployment_id).first()
-                if dep:
-                    dep.status = "TRIGGER_FAILED"
-                    db.commit()
-            finally:
-                db.close()
+        db.refresh(deployment)
+        deployment_id = deployment.id
+        publish_deployment(deployment.to_dict(), "created")
+        notify_superseded(superseded)
+        logger.info("Deployment queued", extra={
+            "deployment_id": deployment_id, "repo_url": repo_url,
+            "environment": environment, "user_name": user_name, "status": deployment.status
+        })
+
+        if deployment.status == "RETRY_QUEUED":
+            return jsonify({
+                "response_type": "in_channel",
+                "blocks": deployment_blocks(
+                    "Deployment Queued",
+                    repo_url, environment, user_name, deployment_id,
+                    "Status: `RETRY_QUEUED` - GitHub is unavailable right now. "
+                    "This one starts automatically once it recovers."
+                )
+            })
+
+        if busy:
+            replaced = f" It replaces {len(superseded)} earlier queued request(s)." if superseded else ""
+            return jsonify({
+                "response_type": "in_channel",
+                "blocks": deployment_blocks(
+                    "Deployment Queued",
+                    repo_url, environment, user_name, deployment_id,
+                    f"Status: `QUEUED` - deployment `{busy[repo_url]}` is still running on this repo and "
+                    f"environment. This one starts when it finishes, unless a newer request replaces it.{replaced}"
+                )
+            })
+
+        # Hand the GitHub trigger to a worker so Slack gets its reply in time
+        queued = deploy_pool.submit(
+            run_deployment, repo_url, environment, user_name,
+            deployment_id, response_url
+        )
+
+        if not queued:
+            mark_trigger_failed(deployment_id)
             return jsonify({
                 "response_type": "ephemeral",
-                "text": f"GitHub trigger failed: {result['error']}"
+                "text": "Deploy queue is full, please try again in a minute."
             })
 
         return jsonify({
             "response_type": "in_channel",
-            "blocks": [
-                {
-                    "type": "header",
-                    "text": {"type": "plain_text", "text": "Deployment Triggered!"}
-                },
-                {
-                    "type": "section",
-                    "fields": [
-                        {"type": "mrkdwn", "text": f"*Repo:*\n{repo_url}"},
-                        {"type": "mrkdwn", "text": f"*Environment:*\n`{environment}`"},
-                        {"type": "mrkdwn", "text": f"*Triggered by:*\n@{user_name}"},
-                        {"type": "mrkdwn", "text": f"*Deployment ID:*\n`{deployment_id}`"}
-                    ]
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": "Status: `DEPLOYING` - I'll post here when it finishes."
-                    }
-                }
-            ]
+            "blocks": deployment_blocks(
+                "Deployment Queued",
+                repo_url, environment, user_name, deployment_id,
+                "Status: `QUEUED` - triggering GitHub Actions now..."
+            )
         })
 
     # ── /deploy-status ────────────────────────────────────────
     elif command == "/deploy-status":
-        db = SessionLocal()
+        db = get_db()
         try:
             deployments = db.query(Deployment)\
                 .order_by(Deployment.id.desc())\
@@ -119,7 +383,11 @@ def slack_commands():
                 "SUCCESS":        "SUCCESS",
                 "FAILED":         "FAILED",
                 "DEPLOYING":      "DEPLOYING",
-                "TRIGGER_FAILED": "TRIGGER_FAILED"
+                "TRIGGER_FAILED": "TRIGGER_FAILED",
+                "TRIGGER_UNCONFIRMED": "TRIGGER_UNCONFIRMED",
+                "QUEUED":         "QUEUED",
+                "SUPERSEDED":     "SUPERSEDED",
+                "RETRY_QUEUED":   "RETRY_QUEUED"
             }
 
             for dep in deployments:
@@ -141,11 +409,97 @@ def slack_commands():
             })
 
         except Exception as e:
+            logger.exception("Error fetching deployment status")
             return jsonify({
                 "response_type": "ephemeral",
                 "text": f"Error fetching status: {str(e)}"
             })
-        finally:
-            db.close()
+
+    # ── /deploy-stats ─────────────────────────────────────────
+    elif command == "/deploy-stats":
+        parts = text.split()
+
+        if len(parts) != 1 or "/" not in parts[0]:
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": "Usage: `/deploy-stats <github-repo-url or owner/repo>`"
+            })
+
+        repo = parts[0]
+        try:
+            stats = duration_stats(get_db(), repo=repo)
+        except Exception as e:
+            logger.exception("Error fetching deployment durations")
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": f"Error fetching durations: {str(e)}"
+            })
+
+        if not stats["by_key"]:
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": f"No finished deployments of `{repo}` timed yet."
+            })
+
+        def seconds(value):
+            return f"{value:.0f}s" if value < 120 else f"{value / 60:.1f}m"
+
+        blocks = [
+            {
+                "type": "header",
+                "text": {"type": "plain_text", "text": "Deployment Durations"}
+            }
+        ]
+        for entry in stats["by_key"]:
+            blocks.append({
+                "type": "section",
+                "fields": [
+                    {"type": "mrkdwn", "text": f"*Repo:*\n{entry['repo_url']}"},
+                    {"type": "mrkdwn", "text": f"*Env:*\n`{entry['environment']}` ({entry['count']} run{'' if entry['count'] == 1 else 's'})"},
+                    {"type": "mrkdwn", "text": f"*p50 / p95:*\n{seconds(entry['p50_seconds'])} / {seconds(entry['p95_seconds'])}"},
+                    {"type": "mrkdwn", "text": f"*p99:*\n{seconds(entry['p99_seconds'])}"}
+                ]
+            })
+            blocks.append({"type": "divider"})
+
+        return jsonify({
+            "response_type": "ephemeral",
+            "blocks": blocks
+        })
+
+    # ── /deploy-setup ─────────────────────────────────────────
+    elif command == "/deploy-setup":
+        parts = text.split()
+
+        if not parts or len(parts) > 2 or (len(parts) == 2 and parts[1] != "--dry-run"):
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": "Usage: `/deploy-setup <github-org> [--dry-run]`"
+            })
+
+        if user_id not in SLACK_ADMIN_USERS:
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": "Only ChatOps admins can run `/deploy-setup`."
+                        if SLACK_ADMIN_USERS else "`/deploy-setup` is disabled until SLACK_ADMIN_USERS is set."
+            })
+
+        owner   = parts[0].rstrip("/").split("/")[-1]
+        dry_run = len(parts) == 2
+        logger.info("Workflow setup queued", extra={
+            "owner": owner, "user_id": user_id, "user_name": user_name, "dry_run": dry_run
+        })
+
+        if not deploy_pool.submit(run_setup_command, owner, response_url, dry_run):
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": "Deploy queue is full, please try again in a minute."
+            })
+
+        return jsonify({
+            "response_type": "in_channel",
+            "text": f"Scanning `{owner}` for repos without the ChatOps workflow"
+                    f"{' (dry run)' if dry_run else ''}..."
+        })
 
     return jsonify({"text": "Unknown command."})
\ No newline at end of file
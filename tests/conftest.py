@@ -0,0 +1,67 @@
+"""
+Tests run against a throwaway SQLite database. DATABASE_URL has to be set
+before database.py is first imported, so it happens here at collection.
+"""
+import os
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="chatops-tests-")
+os.environ["DATABASE_URL"]           = f"sqlite:///{os.path.join(_DB_DIR, 'chatops.db')}"
+os.environ["AUTO_MIGRATE"]           = "false"
+os.environ["CHATOPS_WEBHOOK_SECRET"] = "test-secret"
+os.environ["SLACK_SEEN_STORE"]       = os.path.join(_DB_DIR, "slack-seen.db")
+# Every test starts on an empty database, so a memoized version would be stale
+os.environ["VERSION_MEMO_SECONDS"]   = "0"
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+
+import pytest
+from sqlalchemy import MetaData
+
+from database import Base, SessionLocal, get_engine
+import models  # noqa: F401  (registers the tables on Base)
+from chatops_services.deployment_stats import stats_reconciler
+from chatops_services.events import event_bus
+from chatops_services.history import history_maintainer
+from chatops_services.metrics import metrics_flusher
+from chatops_services.outbox import outbox_dispatcher
+from chatops_services.run_reconciler import run_reconciler
+
+
+@pytest.fixture(autouse=True)
+def no_background_workers(monkeypatch):
+    """
+    The app starts its workers on the first request; in tests they would
+    write to the database behind the test's back, so they never start.
+    """
+    for worker in (outbox_dispatcher, stats_reconciler, run_reconciler, history_maintainer, metrics_flusher):
+        monkeypatch.setattr(worker, "ensure_started", lambda: None)
+    monkeypatch.setattr(event_bus, "ensure_listening", lambda: None)
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, all dropped again afterwards."""
+    engine = get_engine()
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+        # Reflected, so tables made outside the models (monthly archives) go too
+        existing = MetaData()
+        existing.reflect(engine)
+        existing.drop_all(engine)
+
+
+@pytest.fixture
+def add_deployment(db):
+    """Inserts and commits a deployment; returns its id."""
+    def add(repo_url="https://github.com/acme/api", environment="dev", status="DEPLOYING", **values):
+        deployment = models.Deployment(repo_url=repo_url, user_name="alice", environment=environment,
+                                       status=status, **values)
+        db.add(deployment)
+        db.commit()
+        return deployment.id
+    return add
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+from app import create_app
+
+
+@pytest.fixture
+def client(db):
+    return create_app().test_client()
+
+
+def frozen_at(moment):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return moment
+    return FrozenDatetime
+
+
+def test_history_default_window_follows_the_date(client, monkeypatch):
+    today = datetime(2026, 3, 10, 23, 59)
+    monkeypatch.setattr(app_module, "datetime", frozen_at(today))
+    first = client.get("/api/history")
+    assert client.get("/api/history", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    # No writes overnight: the version is unchanged, the window is not
+    monkeypatch.setattr(app_module, "datetime", frozen_at(today + timedelta(minutes=2)))
+    second = client.get("/api/history", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert second.status_code == 200
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert (first.get_json()["until"], second.get_json()["until"]) == ("2026-03-11", "2026-03-12")
+
+
+def test_history_explicit_window_is_cached(client):
+    query = "/api/history?since=2026-01-01&until=2026-02-01"
+    first = client.get(query)
+
+    assert first.get_json()["since"] == "2026-01-01"
+    assert client.get(query, headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
@@ -0,0 +1,190 @@
+from datetime import datetime
+
+import pytest
+
+from models import Deployment, NotificationOutbox
+from chatops_services import deploy_scheduler
+from chatops_services.deploy_scheduler import assign_statuses, promote_next, supersede_queued
+from chatops_services.deploy_states import transition, transition_many
+
+REPO  = "https://github.com/acme/api"
+OTHER = "https://github.com/acme/web"
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "no-returning"])
+def returning(request, db, monkeypatch):
+    """Runs a test with and without UPDATE ... RETURNING."""
+    monkeypatch.setattr(db.bind.dialect, "update_returning", request.param)
+    return request.param
+
+
+def status_of(db, deployment_id):
+    db.expire_all()
+    return db.get(Deployment, deployment_id).status
+
+
+# ── state machine ──
+
+def test_transition_moves_an_allowed_status(db, add_deployment, returning):
+    deployment_id = add_deployment(status="DEPLOYING")
+
+    deployment, old_status = transition(db, deployment_id, "SUCCESS", run_url="https://run/1")
+    db.commit()
+
+    assert old_status == "DEPLOYING"
+    assert (deployment.id, deployment.status, deployment.run_url) == (deployment_id, "SUCCESS", "https://run/1")
+    assert status_of(db, deployment_id) == "SUCCESS"
+
+
+def test_transition_rejects_a_replayed_status(db, add_deployment, returning):
+    deployment_id = add_deployment(status="SUCCESS")
+
+    assert transition(db, deployment_id, "DEPLOYING") == (None, None)
+    assert transition(db, deployment_id, "FAILED") == (None, None)
+    assert status_of(db, deployment_id) == "SUCCESS"
+
+
+def test_transition_unknown_id(db, returning):
+    assert transition(db, 404, "SUCCESS") == (None, None)
+
+
+def test_transition_many_only_moves_allowed_rows(db, add_deployment, returning):
+    deploying = add_deployment(status="DEPLOYING")
+    unconfirmed = add_deployment(status="TRIGGER_UNCONFIRMED")
+    finished = add_deployment(status="FAILED", run_url="https://run/old")
+
+    moved = transition_many(db, "SUCCESS", {
+        deploying: "https://run/1", unconfirmed: "https://run/2", finished: "https://run/3"
+    })
+    db.commit()
+
+    assert sorted((d.id, old, d.run_url) for d, old in moved) == [
+        (deploying, "DEPLOYING", "https://run/1"),
+        (unconfirmed, "TRIGGER_UNCONFIRMED", "https://run/2"),
+    ]
+    assert status_of(db, finished) == "FAILED"
+    assert db.get(Deployment, finished).run_url == "https://run/old"
+
+
+def test_transition_many_with_nothing_to_move(db, returning):
+    assert transition_many(db, "SUCCESS", {}) == []
+
+
+def test_transition_many_sets_extra_columns_per_row(db, add_deployment, returning):
+    first, second = add_deployment(status="DEPLOYING"), add_deployment(status="DEPLOYING")
+    finished_at = datetime(2026, 1, 2, 3, 4, 5)
+
+    moved = transition_many(db, "SUCCESS", {first: "https://run/1", second: "https://run/2"},
+                            finished_at={first: finished_at})
+    db.commit()
+
+    assert {d.id: d.finished_at for d, _ in moved} == {first: finished_at, second: None}
+
+
+# ── scheduler ──
+
+def new_rows(*repos, environment="dev"):
+    return [{"repo_url": repo, "user_name": "bob", "environment": environment} for repo in repos]
+
+
+def test_assign_statuses_queues_busy_keys(db, add_deployment):
+    active = add_deployment(repo_url=REPO, status="DEPLOYING")
+    add_deployment(repo_url=OTHER, environment="prod", status="DEPLOYING")
+    rows = new_rows(REPO, OTHER)
+
+    busy = assign_statuses(db, rows)
+
+    assert busy == {REPO: active}
+    assert [row["status"] for row in rows] == ["QUEUED", "DEPLOYING"]
+    assert rows[0]["started_at"] is None
+    assert rows[1]["started_at"] is not None
+
+
+def test_assign_statuses_retry_queues_while_github_is_unavailable(db, add_deployment, monkeypatch):
+    monkeypatch.setattr(deploy_scheduler.github_breaker, "available", lambda: False)
+    deploy_scheduler.retry_wakeup.clear()
+    add_deployment(repo_url=REPO, status="RETRY_QUEUED")
+    rows = new_rows(REPO, OTHER)
+
+    assign_statuses(db, rows)
+
+    # A RETRY_QUEUED row still holds its key
+    assert [row["status"] for row in rows] == ["QUEUED", "RETRY_QUEUED"]
+    assert all(row["started_at"] is None for row in rows)
+    assert deploy_scheduler.retry_wakeup.is_set()
+
+
+def test_supersede_queued_replaces_older_requests_for_the_key(db, add_deployment):
+    older = add_deployment(repo_url=REPO, status="QUEUED")
+    other_key = add_deployment(repo_url=REPO, environment="prod", status="QUEUED")
+    newest_id = add_deployment(repo_url=REPO, status="QUEUED")
+    newest = db.get(Deployment, newest_id)
+
+    superseded = supersede_queued(db, [newest])
+    db.commit()
+
+    assert [d.id for d in superseded] == [older]
+    assert status_of(db, older) == "SUPERSEDED"
+    assert status_of(db, other_key) == "QUEUED"
+    assert status_of(db, newest_id) == "QUEUED"
+    notices = db.query(NotificationOutbox).filter_by(deployment_id=older).all()
+    assert len(notices) == 1
+    assert f"`{newest_id}`" in notices[0].payload
+
+
+def test_supersede_queued_with_nothing_queued(db):
+    assert supersede_queued(db, []) == []
+
+
+def test_promote_next_waits_for_the_active_deployment(db, add_deployment):
+    add_deployment(repo_url=REPO, status="DEPLOYING")
+    queued = add_deployment(repo_url=REPO, status="QUEUED")
+
+    assert promote_next(db, REPO, "dev") == []
+    assert status_of(db, queued) == "QUEUED"
+
+
+def test_promote_next_starts_the_newest_and_supersedes_the_rest(db, add_deployment):
+    add_deployment(repo_url=REPO, status="SUCCESS")
+    older = add_deployment(repo_url=REPO, status="QUEUED")
+    newest = add_deployment(repo_url=REPO, status="QUEUED")
+
+    promoted = promote_next(db, REPO, "dev")
+    db.commit()
+
+    assert [d.id for d in promoted] == [newest]
+    assert promoted[0].started_at is not None
+    assert status_of(db, newest) == "DEPLOYING"
+    assert status_of(db, older) == "SUPERSEDED"
+
+
+def test_promote_next_with_an_empty_queue(db, add_deployment):
+    add_deployment(repo_url=REPO, status="FAILED")
+
+    assert promote_next(db, REPO, "dev") == []
+
+
+def test_promote_next_disabled_without_coalescing(db, add_deployment, monkeypatch):
+    monkeypatch.setattr(deploy_scheduler, "DEPLOY_COALESCE", False)
+    queued = add_deployment(repo_url=REPO, status="QUEUED")
+
+    assert promote_next(db, REPO, "dev") == []
+    assert status_of(db, queued) == "QUEUED"
+
+
+@pytest.mark.parametrize("retry, unconfirmed, expected", [
+    (False, False, "TRIGGER_FAILED"),
+    (False, True,  "TRIGGER_UNCONFIRMED"),
+    (True,  False, "RETRY_QUEUED"),
+])
+def test_mark_trigger_failed(db, add_deployment, monkeypatch, retry, unconfirmed, expected):
+    monkeypatch.setattr(deploy_scheduler.deploy_pool, "submit", lambda *args: True)
+    failed = add_deployment(repo_url=REPO, status="DEPLOYING")
+    queued = add_deployment(repo_url=REPO, status="QUEUED")
+
+    deploy_scheduler.mark_trigger_failed(failed, retry=retry, unconfirmed=unconfirmed)
+
+    assert status_of(db, failed) == expected
+    # Only RETRY_QUEUED keeps the key
+    assert status_of(db, queued) == ("QUEUED" if retry else "DEPLOYING")
+
@@ -0,0 +1,98 @@
+from datetime import date, datetime, timedelta
+
+from models import Deployment, DeploymentCounter
+from chatops_services import deployment_stats
+from chatops_services.deployment_stats import (
+    StatsReconciler, get_stats, reconcile_counters, record_created, record_status_change,
+)
+from chatops_services.history import archive_month
+
+REPO  = "https://github.com/acme/api"
+OTHER = "https://github.com/acme/web"
+NOW   = datetime.utcnow().replace(microsecond=0)
+
+
+def counted(db, **filters):
+    """Sum of the counter rows matching filters."""
+    return sum(c.count for c in db.query(DeploymentCounter).filter_by(**filters))
+
+
+def test_record_status_change_moves_between_buckets(db, add_deployment):
+    deployment = db.get(Deployment, add_deployment(repo_url=REPO))
+    record_created(db, [deployment])
+    db.commit()
+
+    record_status_change(db, deployment, "DEPLOYING", "SUCCESS")
+    record_status_change(db, deployment, "SUCCESS", "SUCCESS")
+    db.commit()
+
+    stats = get_stats(db, breakdown="repo")
+    assert stats["totals"] == {"total": 1, "SUCCESS": 1}
+    assert stats["by_environment"] == {"dev": {"total": 1, "SUCCESS": 1}}
+    assert stats["by_repo"] == {REPO: {"total": 1, "SUCCESS": 1}}
+    assert counted(db, dimension="user", dim_value="alice", status="DEPLOYING") == 0
+
+
+def test_reconcile_rebuilds_drifted_counters(db, add_deployment):
+    add_deployment(repo_url=REPO, status="SUCCESS")
+    add_deployment(repo_url=OTHER, environment="prod", status="FAILED")
+    # A counter for a deployment that never made it into the table
+    phantom = Deployment(repo_url=REPO, user_name="bob", environment="dev", timestamp=NOW)
+    record_status_change(db, phantom, None, "SUCCESS")
+    db.commit()
+
+    written = reconcile_counters(db, days=None)
+
+    assert written == 6
+    stats = get_stats(db, breakdown="user")
+    assert stats["totals"] == {"total": 2, "SUCCESS": 1, "FAILED": 1}
+    assert stats["by_environment"] == {"dev": {"total": 1, "SUCCESS": 1}, "prod": {"total": 1, "FAILED": 1}}
+    assert stats["by_user"] == {"alice": {"total": 2, "SUCCESS": 1, "FAILED": 1}}
+
+
+def test_recent_reconcile_leaves_older_counters_alone(db, add_deployment):
+    old = Deployment(repo_url=REPO, user_name="alice", environment="dev", timestamp=NOW - timedelta(days=30))
+    record_status_change(db, old, None, "FAILED")
+    add_deployment(repo_url=REPO, status="SUCCESS", timestamp=NOW)
+    db.commit()
+
+    reconcile_counters(db, days=7)
+
+    assert get_stats(db)["totals"] == {"total": 2, "SUCCESS": 1, "FAILED": 1}
+    assert get_stats(db, since=(NOW - timedelta(days=7)).date())["totals"] == {"total": 1, "SUCCESS": 1}
+
+
+def test_reconcile_keeps_counters_of_archived_months(db, add_deployment):
+    add_deployment(repo_url=REPO, status="SUCCESS", timestamp=datetime(2025, 3, 3, 12))
+    add_deployment(repo_url=REPO, status="FAILED", timestamp=datetime(2025, 3, 20, 12))
+    add_deployment(repo_url=REPO, status="SUCCESS", timestamp=NOW)
+    reconcile_counters(db, days=None)
+    archive_month(db, date(2025, 3, 1))
+    db.commit()
+
+    reconcile_counters(db, days=None)
+
+    assert db.query(Deployment).count() == 1
+    assert get_stats(db)["totals"] == {"total": 3, "SUCCESS": 2, "FAILED": 1}
+    assert counted(db, dimension="all", day=date(2025, 3, 20), status="FAILED") == 1
+
+
+def test_reconciler_skips_the_pass_while_another_worker_holds_the_lock(db, add_deployment, monkeypatch):
+    add_deployment(status="SUCCESS")
+    monkeypatch.setattr(deployment_stats, "_try_lock", lambda session: False)
+    reconciler = StatsReconciler(interval=0)
+
+    reconciler._reconcile(days=None)
+
+    assert reconciler.last_run is None
+    assert db.query(DeploymentCounter).count() == 0
+
+
+def test_reconciler_pass(db, add_deployment):
+    add_deployment(status="SUCCESS")
+    reconciler = StatsReconciler(interval=0)
+
+    reconciler._reconcile(days=None)
+
+    assert reconciler.last_run is not None
+    assert get_stats(db)["totals"] == {"total": 1, "SUCCESS": 1}
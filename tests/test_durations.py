@@ -0,0 +1,170 @@
+import math
+import random
+from datetime import datetime
+
+import pytest
+
+from models import DeploymentDurationSketch
+from chatops_services.durations import ACCURACY, MAX_BUCKETS, MIN_SECONDS, DurationSketch, duration_stats, repo_filter
+
+
+def durations(n, seed=7):
+    """Workflow-like run times: mostly minutes, a long tail up to hours."""
+    rng = random.Random(seed)
+    return [rng.lognormvariate(math.log(240), 1.0) + MIN_SECONDS for _ in range(n)]
+
+
+def sketch_of(values):
+    sketch = DurationSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def exact_quantile(values, q):
+    """The value quantile() estimates: rank q * (n - 1), rounded down."""
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.mark.parametrize("q", [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999, 1.0])
+def test_quantiles_within_relative_accuracy(q):
+    values = durations(5000)
+    sketch = sketch_of(values)
+
+    expected = exact_quantile(values, q)
+    assert abs(sketch.quantile(q) - expected) <= ACCURACY * expected * (1 + 1e-9)
+
+
+def test_summary_counts_every_value():
+    values = durations(1000)
+    summary = sketch_of(values).summary()
+
+    assert summary["count"] == 1000
+    assert summary["min_seconds"] == round(min(values), 1)
+    assert summary["max_seconds"] == round(max(values), 1)
+    assert summary["mean_seconds"] == round(sum(values) / len(values), 1)
+
+
+def test_empty_sketch():
+    sketch = DurationSketch()
+
+    assert sketch.quantile(0.5) is None
+    assert sketch.summary() == {
+        "count": 0, "mean_seconds": None, "min_seconds": None, "max_seconds": None,
+        "p50_seconds": None, "p95_seconds": None, "p99_seconds": None,
+    }
+
+
+def test_merge_matches_one_sketch_of_everything():
+    left, right = durations(700, seed=1), durations(300, seed=2) + [0.2, 0.4]
+
+    merged = sketch_of(left)
+    merged.merge(sketch_of(right))
+    combined = sketch_of(left + right)
+
+    assert merged.buckets == combined.buckets
+    assert (merged.zero, merged.count, merged.min, merged.max) == \
+           (combined.zero, combined.count, combined.min, combined.max)
+    assert merged.total == pytest.approx(combined.total)
+    assert merged.summary() == combined.summary()
+
+
+def test_merge_with_empty_sketch():
+    sketch = sketch_of(durations(50))
+    before = sketch.summary()
+
+    sketch.merge(DurationSketch())
+    empty = DurationSketch()
+    empty.merge(sketch)
+
+    assert sketch.summary() == before
+    assert empty.summary() == before
+
+
+@pytest.mark.parametrize("values", [[], [0.5], [42.0], durations(500) + [0.1, 0.9]], ids=["empty", "zero", "one", "many"])
+def test_encode_round_trip(values):
+    sketch = sketch_of(values)
+
+    decoded = DurationSketch.decode(sketch.encode())
+
+    assert decoded.buckets == sketch.buckets
+    assert (decoded.zero, decoded.count, decoded.total, decoded.min, decoded.max) == \
+           (sketch.zero, sketch.count, sketch.total, sketch.min, sketch.max)
+    assert decoded.summary() == sketch.summary()
+
+
+def test_decode_rejects_unknown_format():
+    data = bytearray(DurationSketch().encode())
+    data[0] = 99
+
+    with pytest.raises(ValueError):
+        DurationSketch.decode(bytes(data))
+
+
+def test_sub_second_durations_share_the_zero_bucket():
+    sketch = sketch_of([0.0, 0.25, 0.5, MIN_SECONDS - 1e-9, 30.0])
+
+    assert sketch.zero == 4
+    assert sum(sketch.buckets.values()) == 1
+    assert sketch.count == 5
+    # Ranks inside the zero bucket report the smallest value seen
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(30.0, rel=ACCURACY)
+
+
+def test_bucket_count_is_bounded():
+    gamma = (1 + ACCURACY) / (1 - ACCURACY)
+    values = [gamma ** i for i in range(MAX_BUCKETS + 200)]
+    sketch = sketch_of(values)
+
+    assert len(sketch.buckets) <= MAX_BUCKETS
+    assert sketch.count == len(values)
+    # Only the lowest buckets are folded together; the top stays accurate
+    assert sketch.quantile(0.99) == pytest.approx(exact_quantile(values, 0.99), rel=ACCURACY)
+
+
+# ── duration_stats ──
+
+def add_sketch(db, repo_url, environment="dev", values=(60.0,)):
+    sketch = sketch_of(values)
+    db.add(DeploymentDurationSketch(repo_url=repo_url, environment=environment, count=sketch.count,
+                                    sketch=sketch.encode(), updated_at=datetime.utcnow()))
+    db.commit()
+
+
+@pytest.mark.parametrize("repo", ["acme/my_api", "Acme/MY_API", "https://github.com/ACME/my_api/"])
+def test_duration_stats_repo_matches_literally_and_ignores_case(db, repo):
+    add_sketch(db, "https://github.com/Acme/My_API")
+    add_sketch(db, "https://github.com/acme/myXapi")
+    add_sketch(db, "https://github.com/acme/my_api/", environment="prod")
+
+    stats = duration_stats(db, repo=repo)
+
+    assert sorted((k["repo_url"], k["environment"]) for k in stats["by_key"]) == [
+        ("https://github.com/Acme/My_API", "dev"), ("https://github.com/acme/my_api/", "prod"),
+    ]
+    assert stats["overall"]["count"] == 2
+
+
+def test_repo_filter_escapes_like_wildcards(db):
+    add_sketch(db, "https://github.com/acme/my_api")
+    add_sketch(db, "https://github.com/acme/myXapi")
+    add_sketch(db, "https://github.com/acme/my%api")
+
+    def matched(repo):
+        rows = db.query(DeploymentDurationSketch.repo_url).filter(repo_filter(repo))
+        return sorted(url for (url,) in rows)
+
+    assert matched("ACME/My_Api") == ["https://github.com/acme/my_api"]
+    assert matched("acme/my%api") == ["https://github.com/acme/my%api"]
+
+
+def test_duration_stats_by_environment(db):
+    add_sketch(db, "https://github.com/acme/api", values=(30.0, 90.0))
+    add_sketch(db, "https://github.com/acme/api", environment="prod", values=(600.0,))
+
+    stats = duration_stats(db, environment="prod")
+
+    assert [k["environment"] for k in stats["by_key"]] == ["prod"]
+    assert stats["overall"]["count"] == 1
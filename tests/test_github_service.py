@@ -0,0 +1,74 @@
+import pytest
+
+from chatops_services import github_service
+from chatops_services.github_service import ensure_workflow_exists, invalidate_workflow_cache
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers     = headers or {}
+        self._body       = body or {}
+        self.text        = str(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeGitHub:
+    """Answers the contents GET with .check and records every PUT."""
+
+    def __init__(self, check):
+        self.check = check
+        self.puts  = []
+
+    def get(self, url, headers=None, **kwargs):
+        return self.check
+
+    def put(self, url, headers=None, json=None, **kwargs):
+        self.puts.append(url)
+        return FakeResponse(201, {"content": {"sha": "new"}})
+
+
+@pytest.fixture
+def github(monkeypatch):
+    def answer(check):
+        fake = FakeGitHub(check)
+        monkeypatch.setattr(github_service, "http_client", fake)
+        return fake
+    invalidate_workflow_cache()
+    yield answer
+    invalidate_workflow_cache()
+
+
+def test_existing_workflow_is_left_alone(github):
+    fake = github(FakeResponse(200, {"sha": "abc"}, {"ETag": '"1"'}))
+
+    assert ensure_workflow_exists("acme", "api") == {"success": True, "created": False, "sha": "abc"}
+    assert fake.puts == []
+
+
+def test_missing_workflow_is_created(github):
+    fake = github(FakeResponse(404))
+
+    assert ensure_workflow_exists("acme", "api") == {"success": True, "created": True, "sha": "new"}
+    assert len(fake.puts) == 1
+
+
+@pytest.mark.parametrize("status, headers, retry", [
+    (401, {}, False),
+    (403, {}, False),
+    (403, {"X-RateLimit-Remaining": "0"}, True),
+    (429, {}, True),
+    (500, {}, True),
+    (502, {}, True),
+])
+def test_failed_check_never_overwrites_the_workflow(github, status, headers, retry):
+    fake = github(FakeResponse(status, {"message": "nope"}, headers))
+
+    result = ensure_workflow_exists("acme", "api")
+
+    assert result["success"] is False
+    assert f"HTTP {status}" in result["error"]
+    assert result["retry"] is retry
+    assert fake.puts == []
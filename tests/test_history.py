@@ -0,0 +1,95 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import inspect, text
+
+from models import Deployment, DeploymentArchive, DeploymentDailyRollup
+from chatops_services import history
+from chatops_services.history import archive_month, archive_old_months, daily_history, purge_expired
+
+REPO  = "https://github.com/acme/api"
+MARCH = date(2025, 3, 1)
+NOW   = datetime(2025, 6, 15, 12, 0)
+
+
+def at(day, hour=12):
+    return datetime(2025, 3, day, hour)
+
+
+@pytest.fixture
+def march(add_deployment):
+    """Three finished deployments and one still in flight, all in March 2025."""
+    return {
+        "success": add_deployment(status="SUCCESS", timestamp=at(3), started_at=at(3),
+                                  finished_at=at(3).replace(minute=2)),
+        "failed":  add_deployment(status="FAILED", timestamp=at(3, 14)),
+        "prod":    add_deployment(status="SUCCESS", environment="prod", timestamp=at(20)),
+        "running": add_deployment(status="DEPLOYING", timestamp=at(31)),
+    }
+
+
+def archived_rows(db, month):
+    return db.execute(text(f"SELECT id FROM {history.archive_table_name(month)} ORDER BY id")).scalars().all()
+
+
+def test_archive_month_moves_finished_rows_and_rolls_them_up(db, march):
+    before = daily_history(db, MARCH, date(2025, 4, 1))
+
+    moved = archive_month(db, MARCH)
+    db.commit()
+
+    assert moved == 3
+    assert [d.id for d in db.query(Deployment)] == [march["running"]]
+    assert archived_rows(db, MARCH) == sorted([march["success"], march["failed"], march["prod"]])
+    assert db.get(DeploymentArchive, MARCH).rows == 3
+    rollup = db.query(DeploymentDailyRollup).filter_by(day=date(2025, 3, 3), status="SUCCESS").one()
+    assert (rollup.count, rollup.duration_count, rollup.duration_seconds) == (1, 1, pytest.approx(120))
+    # Rollups plus live rows add up to what the live table alone said
+    assert daily_history(db, MARCH, date(2025, 4, 1)) == before
+
+
+def test_daily_history_filters_archived_rollups(db, march):
+    archive_month(db, MARCH)
+    db.commit()
+
+    days = daily_history(db, MARCH, date(2025, 4, 1), environment="prod")
+
+    assert days == [{"day": "2025-03-20", "total": 1, "by_status": {"SUCCESS": 1}, "avg_seconds": None}]
+
+
+def test_archive_old_months_keeps_hot_months(db, march, add_deployment, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_HOT_MONTHS", 1)
+    hot = add_deployment(status="SUCCESS", timestamp=datetime(2025, 5, 20))
+
+    archived = archive_old_months(db, now=NOW)
+
+    assert archived == {"2025-03-01": 3}
+    db.expire_all()
+    assert {d.id for d in db.query(Deployment)} == {hot, march["running"]}
+    assert history.archived_through(db) == date(2025, 4, 1)
+
+
+def test_archiving_twice_moves_nothing_new(db, march):
+    assert archive_old_months(db, now=NOW) == {"2025-03-01": 3}
+    assert archive_old_months(db, now=NOW) == {}
+    assert db.get(DeploymentArchive, MARCH).rows == 3
+
+
+def test_purge_expired_drops_raw_rows_and_keeps_rollups(db, march, monkeypatch):
+    archive_old_months(db, now=NOW)
+    monkeypatch.setattr(history, "HISTORY_RETENTION_MONTHS", 2)
+
+    assert purge_expired(db, now=NOW) == ["2025-03-01"]
+
+    assert history.archive_table_name(MARCH) not in inspect(db.connection()).get_table_names()
+    assert db.get(DeploymentArchive, MARCH).purged_at is not None
+    assert db.query(DeploymentDailyRollup).count() == 3
+    assert purge_expired(db, now=NOW) == []
+
+
+def test_purge_disabled_by_zero_retention(db, march, monkeypatch):
+    archive_old_months(db, now=NOW)
+    monkeypatch.setattr(history, "HISTORY_RETENTION_MONTHS", 0)
+
+    assert purge_expired(db, now=NOW) == []
+    assert len(archived_rows(db, MARCH)) == 3
@@ -0,0 +1,99 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import NotificationOutbox
+from chatops_services import outbox
+from chatops_services.outbox import OutboxDispatcher
+
+
+class FakeSlack:
+    """Records posted messages; set .reply to change what Slack answers."""
+
+    def __init__(self):
+        self.posted = []
+        self.reply  = {"ok": True, "error": None, "retry_after": None}
+
+    def __call__(self, payload, retries=None):
+        self.posted.append(payload)
+        return self.reply
+
+
+@pytest.fixture
+def slack(monkeypatch):
+    fake = FakeSlack()
+    monkeypatch.setattr(outbox, "send_slack_message", fake)
+    return fake
+
+
+def add_notification(db, channel="#deployments", text="hello"):
+    row = NotificationOutbox(channel=channel, payload=json.dumps({"channel": channel, "text": text}),
+                             status="PENDING", attempts=0, next_attempt_at=datetime.utcnow(),
+                             created_at=datetime.utcnow())
+    db.add(row)
+    db.commit()
+    return row.id
+
+
+def row(db, row_id):
+    db.expire_all()
+    return db.get(NotificationOutbox, row_id)
+
+
+def test_delivers_due_notifications(db, slack):
+    first, second = add_notification(db, "#a"), add_notification(db, "#b")
+
+    assert OutboxDispatcher().drain_once() == 2
+
+    assert [p["channel"] for p in slack.posted] == ["#a", "#b"]
+    assert row(db, first).status == row(db, second).status == "DELIVERED"
+
+
+def test_channel_rate_is_shared_by_every_dispatcher(db, slack):
+    first, second = add_notification(db, text="one"), add_notification(db, text="two")
+
+    # Two workers' dispatchers draining the same table
+    assert OutboxDispatcher().drain_once() == 1
+    assert OutboxDispatcher().drain_once() == 0
+
+    assert [p["text"] for p in slack.posted] == ["one"]
+    assert row(db, first).status == "DELIVERED"
+    deferred = row(db, second)
+    assert deferred.status == "PENDING" and deferred.attempts == 0
+    assert deferred.next_attempt_at > datetime.utcnow()
+
+
+def test_rate_limit_holds_the_channel_without_using_an_attempt(db, slack):
+    limited = add_notification(db)
+    slack.reply = {"ok": False, "error": "ratelimited", "retry_after": 30}
+
+    OutboxDispatcher().drain_once()
+
+    held = row(db, limited)
+    assert (held.status, held.attempts) == ("PENDING", 0)
+    assert held.next_attempt_at > datetime.utcnow() + timedelta(seconds=25)
+    # Another worker sees the same hold
+    add_notification(db)
+    db.query(NotificationOutbox).update({"next_attempt_at": datetime.utcnow()})
+    db.commit()
+    slack.reply = {"ok": True, "error": None, "retry_after": None}
+    assert OutboxDispatcher().drain_once() == 0
+    assert len(slack.posted) == 1
+
+
+def test_gives_up_after_max_attempts(db, slack, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(outbox, "SLACK_CHANNEL_RATE", 0)
+    failing = add_notification(db)
+    slack.reply = {"ok": False, "error": "channel_not_found", "retry_after": None}
+    dispatcher = OutboxDispatcher()
+
+    dispatcher.drain_once()
+    assert (row(db, failing).status, row(db, failing).attempts) == ("PENDING", 1)
+    db.query(NotificationOutbox).update({"next_attempt_at": datetime.utcnow()})
+    db.commit()
+    dispatcher.drain_once()
+
+    assert (row(db, failing).status, row(db, failing).attempts) == ("FAILED", 2)
+    assert dispatcher.stats()["failed"] == 1
@@ -0,0 +1,211 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Deployment, NotificationOutbox
+from chatops_services import run_reconciler as reconciler
+from chatops_services.durations import duration_stats
+from chatops_services.github_service import WORKFLOW_NAME
+from chatops_services.run_reconciler import RunReconciler, match_runs
+
+REPO  = "https://github.com/acme/api"
+NOW   = datetime.utcnow().replace(microsecond=0)
+STUCK = timedelta(seconds=reconciler.RECONCILE_STUCK_SECONDS)
+
+
+def run(run_id, created_at, deployment_id=None, status="completed", conclusion="success", updated_at=None):
+    return {
+        "id":            run_id,
+        "name":          WORKFLOW_NAME,
+        "display_title": f"ChatOps deploy {deployment_id} to dev" if deployment_id else "ChatOps Deployment",
+        "created_at":    created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "updated_at":    (updated_at or created_at).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "status":        status,
+        "conclusion":    conclusion if status == "completed" else None,
+        "html_url":      f"https://github.com/acme/api/actions/runs/{run_id}",
+    }
+
+
+def deployment(deployment_id, timestamp, started_at=None, status="DEPLOYING"):
+    return Deployment(id=deployment_id, repo_url=REPO, user_name="alice", environment="dev",
+                      status=status, timestamp=timestamp, started_at=started_at)
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """The runs GitHub lists for every repo; append to it in the test."""
+    listed = []
+    monkeypatch.setattr(reconciler, "list_dispatch_runs", lambda owner, repo, etag=None: {
+        "success": True, "not_modified": False, "etag": None, "runs": list(listed)
+    })
+    return listed
+
+
+@pytest.fixture
+def reconcile(db, runs, monkeypatch):
+    """Runs one pass of a fresh reconciler; promoted deployments are not triggered."""
+    monkeypatch.setattr("chatops_services.deploy_scheduler.deploy_pool.submit", lambda *args: True)
+    instance = RunReconciler()
+
+    def once():
+        instance.reconcile_once()
+        db.expire_all()
+        return instance
+    return once
+
+
+# ── match_runs ──
+
+def test_match_runs_by_title():
+    deployments = [deployment(7, NOW), deployment(8, NOW)]
+    runs = [run(1, NOW, deployment_id=8), run(2, NOW, deployment_id=7), run(3, NOW, deployment_id=99)]
+
+    matched = match_runs(deployments, runs)
+
+    assert {i: r["id"] for i, r in matched.items()} == {7: 2, 8: 1}
+
+
+def test_match_runs_ignores_other_workflows():
+    other = {**run(1, NOW, deployment_id=7), "name": "CI"}
+
+    assert match_runs([deployment(7, NOW)], [other]) == {}
+
+
+def test_match_runs_untitled_fallback_claims_each_run_once():
+    deployments = [deployment(7, NOW - timedelta(minutes=10)), deployment(8, NOW - timedelta(minutes=5))]
+    runs = [run(2, NOW - timedelta(minutes=4)), run(1, NOW - timedelta(minutes=9)), run(0, NOW - timedelta(hours=1))]
+
+    matched = match_runs(deployments, runs)
+
+    assert {i: r["id"] for i, r in matched.items()} == {7: 1, 8: 2}
+
+
+def test_match_runs_promoted_row_skips_runs_before_it_started():
+    # Requested an hour ago, queued behind a deploy whose untitled run started 30 minutes ago
+    promoted = deployment(8, NOW - timedelta(hours=1), started_at=NOW - timedelta(minutes=5))
+
+    assert match_runs([promoted], [run(1, NOW - timedelta(minutes=30))]) == {}
+    assert match_runs([promoted], [run(2, NOW - timedelta(minutes=4))])[8]["id"] == 2
+
+
+def test_match_runs_untitled_fallback_only_for_deploying_rows():
+    unconfirmed = deployment(7, NOW - timedelta(minutes=10), status="TRIGGER_UNCONFIRMED")
+
+    assert match_runs([unconfirmed], [run(1, NOW - timedelta(minutes=9))]) == {}
+    assert match_runs([unconfirmed], [run(2, NOW, deployment_id=7)])[7]["id"] == 2
+
+
+# ── reconcile passes ──
+
+def test_stuck_deployment_settled_from_its_run(db, add_deployment, runs, reconcile):
+    stuck = add_deployment(timestamp=NOW - STUCK - timedelta(minutes=1))
+    queued = add_deployment(status="QUEUED")
+    runs.append(run(1, NOW - STUCK, deployment_id=stuck, conclusion="failure"))
+
+    stats = reconcile().stats()
+
+    settled = db.get(Deployment, stuck)
+    assert (settled.status, settled.run_url) == ("FAILED", runs[0]["html_url"])
+    assert db.get(Deployment, queued).status == "DEPLOYING"
+    assert db.query(NotificationOutbox).filter_by(deployment_id=stuck).count() == 1
+    assert stats["resolved"] == 1
+
+
+def test_settled_deployment_is_timed(db, add_deployment, runs, reconcile):
+    started = NOW - STUCK - timedelta(minutes=10)
+    stuck = add_deployment(timestamp=started - timedelta(minutes=5), started_at=started)
+    runs.append(run(1, started, deployment_id=stuck, updated_at=started + timedelta(minutes=4)))
+
+    reconcile()
+
+    settled = db.get(Deployment, stuck)
+    assert (settled.status, settled.started_at) == ("SUCCESS", started)
+    assert settled.finished_at == started + timedelta(minutes=4)
+    stats = duration_stats(db)["overall"]
+    assert stats["count"] == 1
+    assert stats["p50_seconds"] == pytest.approx(240, rel=0.01)
+
+
+def test_running_deployment_only_gets_its_run_url(db, add_deployment, runs, reconcile):
+    stuck = add_deployment(timestamp=NOW - STUCK - timedelta(minutes=1))
+    runs.append(run(1, NOW - STUCK, deployment_id=stuck, status="in_progress"))
+
+    reconcile()
+
+    settled = db.get(Deployment, stuck)
+    assert (settled.status, settled.run_url) == ("DEPLOYING", runs[0]["html_url"])
+
+
+def test_promoted_deployment_is_not_stuck_yet(db, add_deployment, runs, reconcile):
+    # Queued an hour ago behind another deploy, promoted a minute ago
+    promoted = add_deployment(timestamp=NOW - timedelta(hours=1), started_at=NOW - timedelta(minutes=1))
+    runs.append(run(1, NOW - timedelta(minutes=30), conclusion="failure"))
+
+    stats = reconcile().stats()
+
+    assert db.get(Deployment, promoted).status == "DEPLOYING"
+    assert stats["api_calls"] == 0
+    assert stats["in_flight"] == 1
+
+
+def test_gives_up_on_deployments_without_a_run(db, add_deployment, runs, reconcile):
+    give_up = timedelta(hours=reconciler.RECONCILE_GIVE_UP_HOURS)
+    abandoned = add_deployment(timestamp=NOW - give_up - timedelta(hours=1))
+    # Requested as long ago, but only promoted recently
+    promoted = add_deployment(timestamp=NOW - give_up - timedelta(hours=1),
+                              started_at=NOW - STUCK - timedelta(minutes=1))
+
+    stats = reconcile().stats()
+
+    assert db.get(Deployment, abandoned).status == "FAILED"
+    assert db.get(Deployment, abandoned).finished_at is not None
+    assert db.get(Deployment, promoted).status == "DEPLOYING"
+    assert stats["gave_up"] == 1
+
+
+# ── unconfirmed dispatches ──
+
+def test_definitive_trigger_failure_is_not_polled(db, add_deployment, runs, reconcile):
+    failed = add_deployment(status="TRIGGER_FAILED", timestamp=NOW - timedelta(minutes=5))
+    runs.append(run(1, NOW, deployment_id=failed))
+
+    stats = reconcile().stats()
+
+    assert db.get(Deployment, failed).status == "TRIGGER_FAILED"
+    assert stats["api_calls"] == 0
+    assert reconciler.RunReconciler().reconcile_once() == reconciler.RECONCILE_IDLE_SECONDS
+
+
+def test_unconfirmed_dispatch_settled_from_its_run(db, add_deployment, runs, reconcile):
+    unconfirmed = add_deployment(status="TRIGGER_UNCONFIRMED", started_at=NOW - timedelta(minutes=2))
+    runs.append(run(1, NOW - timedelta(minutes=1), deployment_id=unconfirmed))
+
+    stats = reconcile().stats()
+
+    settled = db.get(Deployment, unconfirmed)
+    assert (settled.status, settled.run_url) == ("SUCCESS", runs[0]["html_url"])
+    assert stats["api_calls"] == 1
+
+
+def test_unconfirmed_dispatch_without_a_run(db, add_deployment, runs, reconcile):
+    window = timedelta(minutes=reconciler.RECONCILE_UNCONFIRMED_MINUTES)
+    recent = add_deployment(status="TRIGGER_UNCONFIRMED", started_at=NOW - timedelta(minutes=2))
+    expired = add_deployment(status="TRIGGER_UNCONFIRMED", started_at=NOW - window - timedelta(minutes=1))
+
+    reconcile()
+
+    assert db.get(Deployment, recent).status == "TRIGGER_UNCONFIRMED"
+    assert db.get(Deployment, expired).status == "TRIGGER_FAILED"
+    notice = db.query(NotificationOutbox).filter_by(deployment_id=expired).one()
+    assert "never started" in notice.payload
+
+
+def test_unconfirmed_dispatch_kept_while_runs_cannot_be_listed(db, add_deployment, reconcile, monkeypatch):
+    monkeypatch.setattr(reconciler, "list_dispatch_runs",
+                        lambda owner, repo, etag=None: {"success": False, "error": "HTTP 502"})
+    window = timedelta(minutes=reconciler.RECONCILE_UNCONFIRMED_MINUTES)
+    unconfirmed = add_deployment(status="TRIGGER_UNCONFIRMED", started_at=NOW - window - timedelta(minutes=1))
+
+    reconcile()
+
+    assert db.get(Deployment, unconfirmed).status == "TRIGGER_UNCONFIRMED"
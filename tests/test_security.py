@@ -0,0 +1,53 @@
+import hashlib
+import hmac
+import time
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from chatops_services import security
+from chatops_services.security import verify_slack_request
+
+SECRET = "slack-secret"
+BODY   = b"command=%2Fdeploy&text=acme%2Fapi"
+
+
+def slack_request(signed_at=None, secret=SECRET):
+    timestamp = str(int(signed_at if signed_at is not None else time.time()))
+    signature = "v0=" + hmac.new(secret.encode(), b"v0:" + timestamp.encode() + b":" + BODY,
+                                 hashlib.sha256).hexdigest()
+    return Request(EnvironBuilder(method="POST", data=BODY, headers={
+        "X-Slack-Request-Timestamp": timestamp, "X-Slack-Signature": signature,
+    }).get_environ())
+
+
+@pytest.fixture
+def signing_secret(monkeypatch):
+    monkeypatch.setattr(security, "_slack_mac", hmac.new(SECRET.encode(), digestmod=hashlib.sha256))
+
+
+def test_valid_signature(signing_secret):
+    assert verify_slack_request(slack_request())
+
+
+def test_wrong_secret(signing_secret):
+    assert not verify_slack_request(slack_request(secret="other"))
+
+
+def test_replayed_request(signing_secret):
+    assert not verify_slack_request(slack_request(signed_at=time.time() - 3600))
+
+
+def test_fails_closed_without_a_secret(monkeypatch):
+    monkeypatch.setattr(security, "_slack_mac", None)
+    monkeypatch.setattr(security, "SLACK_VERIFY_SIGNATURES", True)
+
+    assert not verify_slack_request(slack_request())
+
+
+def test_unverified_only_when_explicitly_disabled(monkeypatch):
+    monkeypatch.setattr(security, "_slack_mac", None)
+    monkeypatch.setattr(security, "SLACK_VERIFY_SIGNATURES", False)
+
+    assert verify_slack_request(slack_request())
@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+
+import slack_routes
+from app import create_app
+from chatops_services import security
+
+ADMIN_ID = "U0ADMIN01"
+_trigger_ids = itertools.count()
+
+
+@pytest.fixture
+def slack(db, monkeypatch):
+    """Posts unsigned slash commands; setup jobs are accepted but not run."""
+    monkeypatch.setattr(security, "_slack_mac", None)
+    monkeypatch.setattr(security, "SLACK_VERIFY_SIGNATURES", False)
+    monkeypatch.setattr(slack_routes, "SLACK_ADMIN_USERS", {ADMIN_ID})
+    submitted = []
+    monkeypatch.setattr(slack_routes.deploy_pool, "submit", lambda *args: submitted.append(args) or True)
+    client = create_app().test_client()
+
+    def command(name, text, user_id, user_name):
+        response = client.post("/slack", data={
+            "command": name, "text": text, "user_id": user_id, "user_name": user_name,
+            "response_url": "https://hooks.slack.test/1", "trigger_id": f"t{next(_trigger_ids)}",
+        })
+        return response.get_json(), submitted
+    return command
+
+
+def test_deploy_setup_allowed_for_admin_user_id(slack):
+    reply, submitted = slack("/deploy-setup", "acme --dry-run", ADMIN_ID, "someone")
+
+    assert reply["response_type"] == "in_channel"
+    assert len(submitted) == 1
+
+
+def test_deploy_setup_ignores_user_names(slack):
+    # Display names can be changed to match an admin's
+    reply, submitted = slack("/deploy-setup", "acme", "U0OTHER01", ADMIN_ID)
+
+    assert "Only ChatOps admins" in reply["text"]
+    assert submitted == []
+
+
+def test_deploy_setup_disabled_without_admins(slack, monkeypatch):
+    monkeypatch.setattr(slack_routes, "SLACK_ADMIN_USERS", set())
+
+    reply, submitted = slack("/deploy-setup", "acme", "", "")
+
+    assert "disabled" in reply["text"]
+    assert submitted == []
@@ -0,0 +1,39 @@
+import pytest
+
+from app import create_app
+from models import Deployment
+
+HEADERS = {"X-Webhook-Secret": "test-secret"}
+
+
+@pytest.fixture
+def client(db):
+    return create_app().test_client()
+
+
+@pytest.mark.parametrize("status", ["DEPLOYING", "QUEUED", "RETRY_QUEUED", "TRIGGER_FAILED", "SUPERSEDED", "BOGUS"])
+def test_webhook_rejects_statuses_the_workflow_never_reports(client, db, add_deployment, status):
+    deployment_id = add_deployment(status="DEPLOYING")
+
+    response = client.post("/webhook/github", headers=HEADERS,
+                           json={"deployment_id": deployment_id, "status": status})
+
+    assert response.status_code == 400
+    db.expire_all()
+    assert db.get(Deployment, deployment_id).status == "DEPLOYING"
+
+
+def test_webhook_finishes_and_promotes_the_queued_deployment(client, db, add_deployment, monkeypatch):
+    monkeypatch.setattr("chatops_services.deploy_scheduler.deploy_pool.submit", lambda *args: True)
+    active = add_deployment(status="DEPLOYING")
+    queued = add_deployment(status="QUEUED")
+
+    response = client.post("/webhook/github", headers=HEADERS,
+                           json={"deployment_id": active, "status": "SUCCESS", "run_url": "https://run/1"})
+
+    assert response.status_code == 200
+    db.expire_all()
+    finished = db.get(Deployment, active)
+    assert (finished.status, finished.run_url) == ("SUCCESS", "https://run/1")
+    assert finished.finished_at is not None
+    assert db.get(Deployment, queued).status == "DEPLOYING"